@@ -27,8 +27,8 @@ target_metadata = db.metadata
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
-alembic_config = config.get_section(config.config_ini_section)
-alembic_config['sqlalchemy.url'] = app.config['SQLALCHEMY_DATABASE_URI']
+config.set_main_option('sqlalchemy.url',
+                       app.config['SQLALCHEMY_DATABASE_URI'])
 
 
 def run_migrations_offline():
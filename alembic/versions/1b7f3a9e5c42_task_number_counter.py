@@ -0,0 +1,32 @@
+"""task number counter
+
+Revision ID: 1b7f3a9e5c42
+Revises: 4c1e2d6f8a90
+Create Date: 2026-10-17 11:03:27.540917
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1b7f3a9e5c42'
+down_revision = '4c1e2d6f8a90'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # env.py creates the app, which may already have created the table
+    if not op.get_bind().dialect.has_table(op.get_bind(), 'counter'):
+        op.create_table(
+            'counter',
+            sa.Column('name', sa.Unicode(), nullable=False),
+            sa.Column('value', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name'))
+    op.execute("INSERT OR IGNORE INTO counter (name, value) "
+               "SELECT 'task', ifnull(max(number), 0) FROM task")
+
+
+def downgrade():
+    op.drop_table('counter')
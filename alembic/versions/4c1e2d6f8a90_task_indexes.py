@@ -0,0 +1,42 @@
+"""task indexes
+
+Revision ID: 4c1e2d6f8a90
+Revises: 373846ede3bd
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c1e2d6f8a90'
+down_revision = '373846ede3bd'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def create_index(name, columns, **kw):
+    # env.py creates the app, which may already have created the indexes
+    inspector = sa.inspect(op.get_bind())
+    if name not in [index['name'] for index in inspector.get_indexes('task')]:
+        op.create_index(name, 'task', columns, **kw)
+
+
+def upgrade():
+    create_index('ix_task_due', ['due'])
+    create_index('ix_task_project_id_completed', ['project_id', 'completed'])
+    create_index('ix_task_completed', ['completed'],
+                 sqlite_where=sa.text('completed IS NOT NULL'))
+    create_index('ix_task_pending_due', ['due'],
+                 sqlite_where=sa.text('completed IS NULL'))
+    create_index('ix_task_pending_waituntil', ['waituntil'],
+                 sqlite_where=sa.text('completed IS NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_task_pending_waituntil', 'task')
+    op.drop_index('ix_task_pending_due', 'task')
+    op.drop_index('ix_task_completed', 'task')
+    op.drop_index('ix_task_project_id_completed', 'task')
+    op.drop_index('ix_task_due', 'task')
@@ -0,0 +1,53 @@
+"""task full text index
+
+Revision ID: 5e9a0c3b7d21
+Revises: 8d2b6c0e4f17
+Create Date: 2026-10-17 16:48:52.091466
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5e9a0c3b7d21'
+down_revision = '8d2b6c0e4f17'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+
+def upgrade():
+    # env.py creates the app, which may already have created the index
+    exists = op.get_bind().execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'task_fts'").scalar()
+    if exists:
+        return
+
+    op.execute("CREATE VIRTUAL TABLE task_fts USING fts5("
+               "description, content='task', content_rowid='number', "
+               "prefix='2 3')")
+    op.execute("INSERT INTO task_fts (task_fts) VALUES ('rebuild')")
+    op.execute("""CREATE TRIGGER task_fts_insert AFTER INSERT ON task
+    BEGIN
+        INSERT INTO task_fts (rowid, description)
+        VALUES (new.number, new.description);
+    END""")
+    op.execute("""CREATE TRIGGER task_fts_delete AFTER DELETE ON task
+    BEGIN
+        INSERT INTO task_fts (task_fts, rowid, description)
+        VALUES ('delete', old.number, old.description);
+    END""")
+    op.execute("""CREATE TRIGGER task_fts_update
+    AFTER UPDATE OF number, description ON task
+    BEGIN
+        INSERT INTO task_fts (task_fts, rowid, description)
+        VALUES ('delete', old.number, old.description);
+        INSERT INTO task_fts (rowid, description)
+        VALUES (new.number, new.description);
+    END""")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS task_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS task_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS task_fts_insert")
+    op.execute("DROP TABLE IF EXISTS task_fts")
@@ -0,0 +1,44 @@
+"""data version triggers
+
+Revision ID: 7a4f2e9c1d63
+Revises: 5e9a0c3b7d21
+Create Date: 2026-10-17 18:02:37.514209
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7a4f2e9c1d63'
+down_revision = '5e9a0c3b7d21'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+TRIGGERS = (
+    ('task', 'INSERT'),
+    ('task', 'UPDATE'),
+    ('task', 'DELETE'),
+    ('tasks_tags', 'INSERT'),
+    ('tasks_tags', 'DELETE'),
+    ('project', 'UPDATE'),
+)
+
+
+def upgrade():
+    op.execute("INSERT OR IGNORE INTO counter (name, value) "
+               "VALUES ('data_version', 0)")
+    # env.py creates the app, which may already have created the triggers
+    for table, operation in TRIGGERS:
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS data_version_{0}_{1} "
+            "AFTER {2} ON {0} BEGIN "
+            "UPDATE counter SET value = value + 1 "
+            "WHERE name = 'data_version'; END".format(
+                table, operation.lower(), operation))
+
+
+def downgrade():
+    for table, operation in TRIGGERS:
+        op.execute("DROP TRIGGER IF EXISTS data_version_{}_{}".format(
+            table, operation.lower()))
+    op.execute("DELETE FROM counter WHERE name = 'data_version'")
@@ -0,0 +1,29 @@
+"""tasks_tags tag index
+
+Revision ID: 8d2b6c0e4f17
+Revises: 1b7f3a9e5c42
+Create Date: 2026-10-17 14:26:05.772310
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8d2b6c0e4f17'
+down_revision = '1b7f3a9e5c42'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # env.py creates the app, which may already have created the index
+    inspector = sa.inspect(op.get_bind())
+    indexes = [index['name'] for index in inspector.get_indexes('tasks_tags')]
+    if 'ix_tasks_tags_tag_id_task_id' not in indexes:
+        op.create_index('ix_tasks_tags_tag_id_task_id', 'tasks_tags',
+                        ['tag_id', 'task_id'])
+
+
+def downgrade():
+    op.drop_index('ix_tasks_tags_tag_id_task_id', 'tasks_tags')
@@ -0,0 +1,59 @@
+"""binary keys
+
+Revision ID: 9e1d4b7c2a58
+Revises: 7a4f2e9c1d63
+Create Date: 2026-10-17 21:24:05.318442
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9e1d4b7c2a58'
+down_revision = '7a4f2e9c1d63'
+branch_labels = None
+depends_on = None
+
+import sqlite3
+import uuid
+from alembic import op
+
+KEYS = (
+    ('project', ('id',)),
+    ('tag', ('id',)),
+    ('task', ('id', 'project_id')),
+    ('tasks_tags', ('task_id', 'tag_id')),
+)
+
+
+def uuid_blob(value):
+    if value is None or len(value) == 16:
+        return value
+    return sqlite3.Binary(uuid.UUID(value).bytes)
+
+
+def uuid_hex(value):
+    if value is None or len(value) == 32:
+        return value
+    return uuid.UUID(bytes=bytes(value)).hex
+
+
+def convert(function, storage):
+    connection = op.get_bind()
+    connection.connection.create_function(function.__name__, 1, function)
+    for table, columns in KEYS:
+        op.execute('UPDATE {} SET {} WHERE {}'.format(
+            table,
+            ', '.join('{0} = {1}({0})'.format(name, function.__name__)
+                      for name in columns),
+            ' OR '.join("typeof({}) = '{}'".format(name, storage)
+                        for name in columns)))
+
+
+def upgrade():
+    # env.py creates the app, which may already have converted the keys
+    convert(uuid_blob, 'text')
+
+
+def downgrade():
+    convert(uuid_hex, 'blob')
+    # so the app converts the keys again when it is upgraded
+    op.execute('PRAGMA user_version = 6')
@@ -0,0 +1,122 @@
+"""stats rollups
+
+Revision ID: c3f8a2d6e914
+Revises: 9e1d4b7c2a58
+Create Date: 2026-10-17 22:41:16.207385
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a2d6e914'
+down_revision = '9e1d4b7c2a58'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+TABLES = (('project_stats', 'project_id'), ('tag_stats', 'tag_id'))
+
+TRIGGERS = ('stats_task_insert', 'stats_task_update',
+            'stats_task_tags_update', 'stats_tag_insert', 'stats_tag_delete')
+
+
+def adjust(table, key, keys, day, column, delta):
+    statements = []
+    if delta > 0:
+        statements.append(
+            "INSERT OR IGNORE INTO {0} (day, {1}, created, completed) "
+            "SELECT {3}, key, 0, 0 FROM ({2}) WHERE {3} IS NOT NULL".format(
+                table, key, keys, day))
+    statements.append(
+        "UPDATE {0} SET {4} = {4} {5:+d} WHERE day = {3} AND {1} IN "
+        "(SELECT key FROM ({2}))".format(table, key, keys, day, column, delta))
+    if delta < 0:
+        statements.append(
+            "DELETE FROM {0} WHERE day = {3} AND {1} IN "
+            "(SELECT key FROM ({2})) AND created = 0 AND completed = 0"
+            .format(table, key, keys, day))
+    return statements
+
+
+def adjust_task(table, key, keys, row, delta):
+    return (adjust(table, key, keys, 'date({}.created)'.format(row),
+                   'created', delta) +
+            adjust(table, key, keys, 'date({}.completed)'.format(row),
+                   'completed', delta))
+
+
+def adjust_link(row, delta):
+    keys = 'SELECT {}.tag_id AS key'.format(row)
+    return sum((adjust('tag_stats', 'tag_id', keys,
+                       '(SELECT date({}) FROM task WHERE id = {}.task_id)'
+                       .format(column, row), column, delta)
+                for column in ('created', 'completed')), [])
+
+
+def upgrade():
+    # env.py creates the app, which may already have created the rollups
+    exists = op.get_bind().execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'stats_task_insert'"
+    ).scalar()
+    if exists:
+        return
+
+    for table, key in TABLES:
+        op.execute(
+            "CREATE TABLE IF NOT EXISTS {0} (day DATE NOT NULL, "
+            "{1} BLOB NOT NULL, created INTEGER NOT NULL, "
+            "completed INTEGER NOT NULL, PRIMARY KEY (day, {1}))".format(
+                table, key))
+
+    project = "SELECT ifnull({}.project_id, X'') AS key"
+    task_tags = "SELECT tag_id AS key FROM tasks_tags WHERE task_id = {}.id"
+    changed = ("old.created IS NOT new.created OR "
+               "old.completed IS NOT new.completed")
+    triggers = (
+        ('AFTER INSERT ON task', None,
+         adjust_task('project_stats', 'project_id', project.format('new'),
+                     'new', 1)),
+        ('AFTER UPDATE OF created, completed, project_id ON task',
+         changed + " OR old.project_id IS NOT new.project_id",
+         adjust_task('project_stats', 'project_id', project.format('old'),
+                     'old', -1) +
+         adjust_task('project_stats', 'project_id', project.format('new'),
+                     'new', 1)),
+        ('AFTER UPDATE OF created, completed ON task', changed,
+         adjust_task('tag_stats', 'tag_id', task_tags.format('old'),
+                     'old', -1) +
+         adjust_task('tag_stats', 'tag_id', task_tags.format('new'),
+                     'new', 1)),
+        ('AFTER INSERT ON tasks_tags', None, adjust_link('new', 1)),
+        ('AFTER DELETE ON tasks_tags',
+         'EXISTS (SELECT 1 FROM task WHERE id = old.task_id)',
+         adjust_link('old', -1)),
+    )
+    for name, (event, when, statements) in zip(TRIGGERS, triggers):
+        op.execute("CREATE TRIGGER IF NOT EXISTS {} {}{} BEGIN {}; END".format(
+            name, event, ' WHEN ' + when if when else '',
+            '; '.join(statements)))
+
+    op.execute(
+        "INSERT INTO project_stats (day, project_id, created, completed) "
+        "SELECT day, key, sum(created), sum(completed) FROM ("
+        "SELECT date(created) AS day, ifnull(project_id, X'') AS key, "
+        "1 AS created, 0 AS completed FROM task UNION ALL "
+        "SELECT date(completed), ifnull(project_id, X''), 0, 1 FROM task) "
+        "WHERE day IS NOT NULL GROUP BY day, key")
+    op.execute(
+        "INSERT INTO tag_stats (day, tag_id, created, completed) "
+        "SELECT day, key, sum(created), sum(completed) FROM ("
+        "SELECT date(created) AS day, tag_id AS key, 1 AS created, "
+        "0 AS completed FROM task JOIN tasks_tags ON task_id = id UNION ALL "
+        "SELECT date(completed), tag_id, 0, 1 "
+        "FROM task JOIN tasks_tags ON task_id = id) "
+        "WHERE day IS NOT NULL GROUP BY day, key")
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute("DROP TRIGGER IF EXISTS {}".format(name))
+    for table, key in TABLES:
+        op.execute("DROP TABLE IF EXISTS {}".format(table))
+    op.execute('PRAGMA user_version = 7')
@@ -0,0 +1,42 @@
+"""task urgency
+
+Revision ID: e5b0d7a3f182
+Revises: c3f8a2d6e914
+Create Date: 2026-10-17 23:52:40.913027
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e5b0d7a3f182'
+down_revision = 'c3f8a2d6e914'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+TRIGGERS = ('urgency_task_insert', 'urgency_task_update',
+            'urgency_tag_insert', 'urgency_tag_delete')
+
+
+def upgrade():
+    # env.py creates the app, which may already have added the column
+    columns = [row[1] for row in op.get_bind().execute(
+        "PRAGMA table_info(task)")]
+    if 'urgency' not in columns:
+        op.execute("ALTER TABLE task ADD COLUMN urgency FLOAT")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_task_pending_urgency "
+               "ON task (urgency DESC, number) WHERE completed IS NULL")
+    # the triggers depend on URGENCY_COEFFICIENTS, the app creates them and
+    # scores the tasks the first time it orders them by urgency
+    op.execute("DELETE FROM counter "
+               "WHERE name IN ('urgency_day', 'urgency_coefficients')")
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute("DROP TRIGGER IF EXISTS {}".format(name))
+    op.execute("DROP INDEX IF EXISTS ix_task_pending_urgency")
+    op.execute("ALTER TABLE task DROP COLUMN urgency")
+    op.execute("DELETE FROM counter "
+               "WHERE name IN ('urgency_day', 'urgency_coefficients')")
+    op.execute('PRAGMA user_version = 8')
@@ -0,0 +1,58 @@
+"""task sync
+
+Revision ID: f7a1c4e9b063
+Revises: e5b0d7a3f182
+Create Date: 2026-10-18 01:12:07.381544
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f7a1c4e9b063'
+down_revision = 'e5b0d7a3f182'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+SYNCED_COLUMNS = ('description', 'project_id', 'priority', 'due',
+                  'waituntil', 'completed', 'created', 'updated')
+
+EPOCH = "(SELECT value FROM counter WHERE name = 'sync_epoch')"
+
+TRIGGERS = (
+    ('sync_task_update',
+     'AFTER UPDATE OF {} ON task'.format(', '.join(SYNCED_COLUMNS)),
+     'new.revision', 'new.id'),
+    ('sync_tag_insert', 'AFTER INSERT ON tasks_tags',
+     '(SELECT revision FROM task WHERE id = new.task_id)', 'new.task_id'),
+    ('sync_tag_delete', 'AFTER DELETE ON tasks_tags',
+     '(SELECT revision FROM task WHERE id = old.task_id)', 'old.task_id'),
+)
+
+
+def upgrade():
+    # env.py creates the app, which may already have added the column
+    columns = [row[1] for row in op.get_bind().execute(
+        "PRAGMA table_info(task)")]
+    if 'revision' not in columns:
+        op.execute("ALTER TABLE task ADD COLUMN revision INTEGER")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_task_revision "
+               "ON task (revision)")
+    # existing tasks keep a NULL revision, the first sync sends them all
+    op.execute("INSERT OR IGNORE INTO counter (name, value) "
+               "VALUES ('sync_epoch', 1)")
+    for name, event, revision, key in TRIGGERS:
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS {0} {1} WHEN {2} < {3} BEGIN "
+            "UPDATE task SET revision = {3} WHERE id = {4}; END".format(
+                name, event, revision, EPOCH, key))
+
+
+def downgrade():
+    for name, _, _, _ in TRIGGERS:
+        op.execute("DROP TRIGGER IF EXISTS {}".format(name))
+    op.execute("DROP INDEX IF EXISTS ix_task_revision")
+    op.execute("ALTER TABLE task DROP COLUMN revision")
+    op.execute("DELETE FROM counter WHERE name IN ('sync_epoch', 'sync_id') "
+               "OR name LIKE 'sync_received:%'")
+    op.execute('PRAGMA user_version = 9')
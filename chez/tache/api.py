@@ -0,0 +1,215 @@
+import hashlib
+from flask import Blueprint, current_app, jsonify, request, url_for
+from sqlalchemy import sql
+from sqlalchemy.orm import joinedload, subqueryload
+from .changes import get_notifier
+from .models import db, Project, Task
+from .models.task import data_version
+from .services import (ArchiveService, ExportService, ProjectService,
+                       TaskService)
+from .services.task import TaskServiceParseException
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+#: seconds a long poll of /changes waits by default and at most
+CHANGES_TIMEOUT = 30
+MAX_CHANGES_TIMEOUT = 300
+#: seconds between two comments keeping an event stream open
+KEEPALIVE = 15
+
+
+def json_response(status=200, **kwargs):
+    response = jsonify(**kwargs)
+    response.status_code = status
+    return response
+
+
+def get_arguments(value):
+    """Filter arguments as in the command line, a list or a string"""
+    if value is None:
+        return []
+    if isinstance(value, basestring):  # noqa
+        return value.split()
+    if isinstance(value, list) and all(isinstance(arg, basestring)  # noqa
+                                       for arg in value):
+        return value
+    raise TaskServiceParseException("Invalid arguments: {}".format(value))
+
+
+def get_json():
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        raise TaskServiceParseException("Expected a JSON object")
+    return data
+
+
+def listing_etag(ts):
+    """
+    ETag of a listing, from the data version, the query string and the
+    current minute as filters may be relative to the time
+    """
+    key = u'{}\n{}\n{}'.format(
+        data_version(db.session.connection()),
+        ts.now.strftime('%Y-%m-%dT%H:%M'),
+        sorted(request.args.items(multi=True)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def with_relations(query):
+    """
+    Eager loads the project and tags of a page of tasks
+
+    Tags are loaded by a second query over the page, joining them in the
+    same SELECT makes SQLite materialize every task's tags.
+    """
+    return query.options(joinedload(Task.project),
+                         subqueryload(Task.tags_rel))
+
+
+def to_json(task):
+    return ExportService().to_row(task)
+
+
+@api.errorhandler(TaskServiceParseException)
+def parse_error(ex):
+    return json_response(400, error=ex.args[0])
+
+
+@api.route('/tasks')
+def list_tasks():
+    """
+    Lists tasks matching `filter`, pending ones unless `status=all`
+
+    Pages are `limit` tasks ordered by number, `next` is passed as `after`
+    to get the next page.
+    """
+    ts = TaskService()
+    etag = listing_etag(ts)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1),
+                MAX_LIMIT)
+    after = request.args.get('after', type=int)
+    status = request.args.get('status', 'pending')
+    if status not in ('pending', 'all'):
+        raise TaskServiceParseException(
+            "Invalid status: {}".format(status))
+
+    query = ts.baked_filter(get_arguments(request.args.get('filter')))
+    if status == 'pending':
+        query = ts.pending(query)
+    if after is not None:
+        query = query.with_criteria(lambda query: query.filter(
+            Task.number > sql.bindparam('after')))
+    query = query.with_criteria(lambda query: with_relations(
+        query.order_by(Task.number)).limit(limit + 1), limit)
+    tasks = ts.run(query).params(after=after).all()
+
+    more = len(tasks) > limit
+    tasks = tasks[:limit]
+    response = json_response(tasks=[to_json(task) for task in tasks],
+                             next=tasks[-1].number if more else None)
+    response.set_etag(etag)
+    return response
+
+
+@api.route('/tasks/<int:number>')
+def get_task(number):
+    task = with_relations(Task.query.filter_by(number=number)).first()
+    if task is None:
+        return json_response(404, error="No task {}".format(number))
+    return json_response(**to_json(task))
+
+
+@api.route('/tasks', methods=['POST'])
+def create_task():
+    """Creates a task from `arguments`, as for `ct add`"""
+    ts = TaskService()
+    task = ts.from_arguments(get_arguments(get_json().get('arguments')))
+    response = json_response(201, **to_json(task))
+    response.headers['Location'] = url_for('.get_task', number=task.number)
+    return response
+
+
+@api.route('/tasks/done', methods=['POST'])
+def done_tasks():
+    """Completes the tasks given by numbers or by `filter`"""
+    ts = TaskService()
+    count, missing = ts.done(get_arguments(get_json().get('filter')))
+    if missing:
+        return json_response(404, error="Invalid task id", missing=missing)
+    ArchiveService(ts).archive_expired()
+    return json_response(completed=count)
+
+
+@api.route('/tasks', methods=['PATCH'])
+def modify_tasks():
+    """Applies `changes` to the tasks given by numbers or by `filter`"""
+    data = get_json()
+    ts = TaskService()
+    count, missing = ts.modify(get_arguments(data.get('filter')),
+                               get_arguments(data.get('changes')))
+    if missing:
+        return json_response(404, error="Invalid task id", missing=missing)
+    return json_response(modified=count)
+
+
+@api.route('/projects')
+def list_projects():
+    projects = Project.query.order_by(Project.name)
+    return json_response(projects=[
+        {'id': str(project.id), 'name': project.name}
+        for project in projects])
+
+
+@api.route('/projects', methods=['POST'])
+def create_project():
+    name = get_json().get('name')
+    if not isinstance(name, basestring) or not name.strip():  # noqa
+        raise TaskServiceParseException("Invalid project name")
+    project = ProjectService().get_or_create(name)
+    return json_response(201, id=str(project.id), name=project.name)
+
+
+def change_events(notifier, version):
+    """Yields a server-sent event on every change, comments meanwhile"""
+    while True:
+        current = notifier.wait(version, KEEPALIVE)
+        if current == version:
+            yield b': keepalive\n\n'
+        else:
+            version = current
+            yield 'id: {0}\nevent: change\ndata: {{"version": {0}}}\n\n' \
+                .format(version).encode('ascii')
+
+
+@api.route('/changes')
+def changes():
+    """
+    Waits for tasks or projects to change
+
+    Answers with the data `version` once it differs from the `version`
+    given, or after `timeout` seconds with the same one. Clients asking for
+    `text/event-stream` get a `change` event on every change instead, the
+    `Last-Event-ID` header resuming from a version.
+
+    The view does not use the session: the server runs it outside of the
+    worker pool.
+    """
+    notifier = get_notifier(current_app._get_current_object())
+    if request.accept_mimetypes.best == 'text/event-stream':
+        version = request.headers.get('Last-Event-ID', type=int)
+        response = current_app.response_class(
+            change_events(notifier, version), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    version = request.args.get('version', type=int)
+    timeout = min(max(request.args.get('timeout', CHANGES_TIMEOUT,
+                                       type=float), 0), MAX_CHANGES_TIMEOUT)
+    return json_response(version=notifier.wait(version, timeout))
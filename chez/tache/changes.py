@@ -0,0 +1,102 @@
+"""
+Change notifications
+
+Clients waiting for tasks or projects to change share one thread polling
+the `data_version` counter, instead of each querying the database.
+"""
+import threading
+import time
+from .models import db
+from .models.task import data_version
+
+#: seconds between two reads of the data version while clients wait
+POLL_INTERVAL = 0.5
+
+
+class ChangeNotifier(object):
+    """
+    Wakes the threads waiting for the data version of an app's database to
+    change
+
+    The polling thread starts with the first wait and only reads the
+    database while threads are waiting. Waiting threads are woken after
+    every read, so timeouts are checked every `interval` seconds.
+    """
+
+    def __init__(self, app, interval=POLL_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self.version = None
+        self.waiting = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def current(self):
+        """Reads the data version"""
+        with db.get_engine(self.app).connect() as connection:
+            return data_version(connection)
+
+    def wait(self, version=None, timeout=None):
+        """
+        Waits until the data version differs from `version`
+
+        :param timeout: seconds after which to give up, None to wait until a
+                        change
+        :returns: the data version, `version` if it did not change in time
+        """
+        with self.condition:
+            if not self.waiting:
+                # nobody polled since the last waiter left
+                self.version = self.current()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.poll)
+                self.thread.daemon = True
+                self.thread.start()
+            self.waiting += 1
+            self.condition.notify_all()
+            deadline = None if timeout is None else time.time() + timeout
+            try:
+                while self.version == version and \
+                        not self.stopped.is_set() and \
+                        (deadline is None or time.time() < deadline):
+                    # Condition.wait with a timeout busy-waits in Python 2,
+                    # the polling thread wakes us up instead
+                    self.condition.wait()
+            finally:
+                self.waiting -= 1
+            return self.version
+
+    def poll(self):
+        while True:
+            with self.condition:
+                while not self.waiting and not self.stopped.is_set():
+                    self.condition.wait()
+            # Event.wait with a timeout busy-waits in Python 2 as well
+            time.sleep(self.interval)
+            if self.stopped.is_set():
+                return
+            version = self.current()
+            with self.condition:
+                self.version = version
+                self.condition.notify_all()
+
+    def stop(self):
+        """
+        Stops the polling thread, within `interval` seconds, and wakes every
+        waiting thread
+        """
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def get_notifier(app):
+    """The :class:`ChangeNotifier` of `app`, created on first use"""
+    notifier = app.extensions.get('tache_changes')
+    if notifier is None:
+        notifier = app.extensions.setdefault('tache_changes',
+                                             ChangeNotifier(app))
+    return notifier
@@ -0,0 +1,109 @@
+"""
+Entry point of `ct`, forwarding commands to `ct daemon` when it runs
+
+This module is imported on every call so it only uses modules the
+interpreter has already loaded, commands run in process when no daemon
+listens.
+"""
+import os
+import sys
+
+#: commands streaming stdin or stdout, serving or taking a file path, which
+#: always run in process
+LOCAL_COMMANDS = frozenset(['daemon', 'export', 'import', 'runserver',
+                            'serve', 'sync'])
+
+#: options of `ct` taking a value, which write files so their commands run in
+#: process
+FILE_OPTIONS = frozenset(['--profile-json', '--cprofile'])
+
+
+def socket_path():
+    """
+    Path of the daemon's socket, `$CT_SOCKET` or `~/.config/chez/tache.sock`
+
+    An empty `$CT_SOCKET` disables the daemon.
+    """
+    path = os.environ.get('CT_SOCKET')
+    if path is None:
+        path = os.path.join(os.path.expanduser('~'), '.config', 'chez',
+                            'tache.sock')
+    return path
+
+
+def command_name(args):
+    """Name of the command in the arguments, None if there is none"""
+    args = iter(args)
+    for arg in args:
+        if arg in FILE_OPTIONS:
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def runs_locally(args):
+    """Whether the command in the arguments always runs in process"""
+    for arg in args:
+        if not arg.startswith('-'):
+            return arg in LOCAL_COMMANDS
+        if arg.split('=', 1)[0] in FILE_OPTIONS:
+            return True
+    return False
+
+
+def forward(args, path):
+    """
+    Runs a command on the daemon listening on `path`
+
+    Arguments are sent separated by NUL bytes, the daemon answers with the
+    exit status and the length of the output on the first line followed by
+    the output and the error output.
+
+    :returns: tuple of the exit status, the output and the error output,
+              None if no daemon listens on `path`
+    """
+    # the socket module imports ssl, _socket alone is much faster to load
+    import _socket
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except _socket.error:
+            return None
+        sock.sendall(b'\0'.join(args))
+        sock.shutdown(_socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+
+    header, newline, data = b''.join(chunks).partition(b'\n')
+    if not newline:
+        return 1, b'', b'Error: ct daemon closed the connection\n'
+    status, length = header.split()
+    length = int(length)
+    return int(status), data[:length], data[length:]
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+
+    path = socket_path()
+    if path and not runs_locally(args):
+        result = forward(args, path)
+        if result is not None:
+            status, output, errors = result
+            for stream, data in ((sys.stdout, output), (sys.stderr, errors)):
+                stream = getattr(stream, 'buffer', stream)
+                stream.write(data)
+                stream.flush()
+            sys.exit(status)
+
+    from .commands import cli
+    cli(args, prog_name='ct')
@@ -1,107 +1,518 @@
+import json
+import time
+from contextlib import contextmanager
+from functools import update_wrapper
 import click
-import arrow
-import sqlalchemy
-from sqlalchemy.sql import or_
-from tabulate import tabulate
-from .factory import create_app
-from .models import db, Task, Project
-from .services import TaskService, ProjectService
+
+
+def get_app(ctx, settings=None):
+    """
+    Return the flask app for this invocation, creating it on first use
+
+    The app is created lazily so `--help` and usage errors never pay for
+    importing the ORM or touching the database. Passing ``obj`` to the root
+    context (e.g. from tests) reuses an existing app.
+
+    :param settings: config overrides of the app, when it is created
+    """
+    root = ctx.find_root()
+    startup = None
+    if root.obj is None:
+        from .factory import create_app
+        start = time.time()
+        root.obj = create_app(settings=settings)
+        startup = time.time() - start
+
+    profiler = get_profiler(ctx)
+    if profiler is None and root.obj.config['PROFILE']:
+        profiler = start_profiler(root, path=root.obj.config['PROFILE_OUTPUT'])
+        if startup is not None:
+            profiler.start = start
+    if profiler is not None and profiler.engine is None:
+        from .models import db
+        if startup is not None:
+            profiler.add_phase('startup', startup)
+        profiler.attach(db.get_engine(root.obj))
+    return root.obj
+
+
+def pass_app(f):
+    """Like :func:`click.pass_obj` but creates the app lazily"""
+    @click.pass_context
+    def new_func(ctx, *args, **kwargs):
+        return ctx.invoke(f, get_app(ctx), *args, **kwargs)
+    return update_wrapper(new_func, f)
+
+
+def get_profiler(ctx):
+    """Profiler of this invocation, None unless profiling"""
+    return getattr(ctx.find_root(), 'profiler', None)
+
+
+def start_profiler(root, stream=None, path=None, cprofile=None):
+    """
+    Profiles the command of the root context `root`, reporting when it ends
+
+    :param stream: file the report or JSON results are written to
+    :param path: file the JSON results are appended to
+    :param cprofile: file the cProfile statistics are written to
+    """
+    from .profiler import Profiler
+
+    profiler = Profiler(cprofile=cprofile is not None)
+    root.profiler = profiler
+
+    @root.call_on_close
+    def report():
+        profiler.stop()
+        profiler.name = u'ct {}'.format(root.invoked_subcommand or '')
+        if cprofile is not None:
+            profiler.dump_stats(cprofile)
+        if stream is not None and path is None:
+            stream.write(json.dumps(profiler.to_dict(), indent=2) + '\n')
+        else:
+            profiler.write(click.get_text_stream('stderr'), path=path)
+    return profiler
+
+
+@contextmanager
+def no_phase():
+    yield
+
+
+def phase(ctx, name):
+    """Times a phase of the command when profiling"""
+    profiler = get_profiler(ctx)
+    return profiler.phase(name) if profiler is not None else no_phase()
+
+
+class SeparatedCommand(click.Command):
+    """
+    Command whose arguments keep the first `--`, which click's parser drops,
+    to tell the arguments before it from the ones after it
+    """
+
+    def parse_args(self, ctx, args):
+        if '--' in args:
+            index = args.index('--')
+            # the first one still ends the options, the second is kept
+            args = args[:index] + ['--'] + args[index:]
+        return click.Command.parse_args(self, ctx, args)
 
 
 @click.group()
 @click.pass_context
-def cli(ctx):
-    app = create_app()
-    ctx.obj = app
+@click.option('--profile', '--stats', 'profile', is_flag=True,
+              help="Report timings and SQL statements on stderr")
+@click.option('--profile-json', type=click.File('w'),
+              help="Write timings and SQL statements as JSON to a file, "
+              "`-` for stdout")
+@click.option('--cprofile', type=click.Path(dir_okay=False, writable=True),
+              help="Write cProfile statistics to a file")
+def cli(ctx, profile, profile_json, cprofile):
+    if profile or profile_json or cprofile:
+        start_profiler(ctx, stream=profile_json, cprofile=cprofile)
+
+
+@cli.command()
+@pass_app
+@click.pass_context
+@click.option('--host', default='127.0.0.1', help="Interface to listen on")
+@click.option('--port', default=5000, help="Port to listen on")
+def runserver(ctx, app, host, port):
+    """Serve the JSON API under /api"""
+    if get_profiler(ctx) is not None:
+        # report each request rather than the whole run
+        app.config['PROFILE'] = True
+    app.run(host=host, port=port)
 
 
 @cli.command()
-@click.pass_obj
-def runserver(app):
-    app.run()
+@click.pass_context
+@click.option('--host', default='127.0.0.1', help="Interface to listen on")
+@click.option('--port', default=5000, help="Port to listen on")
+@click.option('--workers', default=8, type=click.IntRange(1),
+              help="Threads running requests, each with a pooled "
+              "database connection")
+def serve(ctx, host, port, workers):
+    """Serve the JSON API to many clients, with change notifications"""
+    from .server import serve
+
+    app = get_app(ctx, settings={'SQLALCHEMY_POOL_SIZE': workers})
+    click.echo("Serving on http://{}:{}/api".format(host, port), err=True)
+    serve(app, host, port, workers)
+
+
+@cli.command()
+@click.pass_context
+@click.option('--socket', 'path', help="Unix socket to listen on, "
+              "$CT_SOCKET or ~/.config/chez/tache.sock by default")
+def daemon(ctx, path):
+    """Keep a warm app serving the commands of `ct`"""
+    from .client import socket_path
+    from .daemon import DaemonException, POOL_SIZE, serve
+
+    path = path or socket_path()
+    if not path:
+        ctx.fail("No socket path, CT_SOCKET is empty")
+    app = get_app(ctx, settings={'SQLALCHEMY_POOL_SIZE': POOL_SIZE})
+    click.echo("Listening on {}".format(path), err=True)
+    try:
+        serve(app, path)
+    except DaemonException as ex:
+        ctx.fail(str(ex))
 
 
 @cli.command()
-@click.pass_obj
+@pass_app
 @click.pass_context
 @click.argument('arguments', nargs=-1)
 def add(ctx, app, arguments):
+    from .services import TaskService
+
     with app.app_context():
         ts = TaskService()
         try:
-            task = ts.from_arguments(arguments)
+            with phase(ctx, 'execute'):
+                task = ts.from_arguments(arguments)
             click.echo('Task {} created'.format(task.number))
         except Exception as ex:
             ctx.fail(ex.message)
 
 
 @cli.command()
-@click.pass_obj
+@pass_app
 @click.pass_context
-@click.option('--projects', is_flag=True, help="List projects")
+@click.option('--projects', is_flag=True,
+              help="List projects with their task counts")
+@click.option('--explain', is_flag=True,
+              help="Show the query plan instead of the tasks")
+@click.option('--rank', is_flag=True,
+              help="Order by relevance to the searched words")
+@click.option('--all', 'all_tasks', is_flag=True,
+              help="Include completed and archived tasks")
+@click.option('--sort', type=click.Choice(['number', 'urgency']),
+              default='number', help="Order of the tasks")
 @click.argument('arguments', nargs=-1)
-def list(ctx, app, projects, arguments):
+def list(ctx, app, projects, explain, rank, all_tasks, sort, arguments):
+    from tabulate import tabulate
+    from .services import ArchiveService, ProjectService, TaskService
+
     with app.app_context():
         if projects:
-            for project in Project.query:
-                click.echo(project.name)
+            rows = ProjectService().summary()
+            click.echo(tabulate(rows, headers=[
+                'Project', 'Pending', 'Overdue', 'Completed']))
             return
 
         ts = TaskService()
         defaults = ''
-        query = ts.filter_by_arguments(arguments, defaults=defaults)
-        query = query.filter(Task.completed == None)  # noqa
-        query = query.filter(
-            or_(Task.waituntil <= arrow.now(), Task.waituntil == None))  # noqa
-        if query.count():
-            table = {
-                '#': [],
-                'Pro': [],
-                'Description': [],
-            }
-            for task in query:
-                table['#'].append(task.number)
-                table['Pro'].append(task.project.name if task.project else '')
-                table['Description'].append(task.description)
-            click.echo(tabulate(table, headers="keys"))
-        else:
-            click.echo("No matching tasks")
+        with phase(ctx, 'parse'):
+            # the archive and the query plan need a plain query
+            if all_tasks or explain:
+                query = ts.filter_by_arguments(arguments, defaults=defaults,
+                                               rank=rank)
+            else:
+                query = ts.baked_filter(arguments, defaults=defaults,
+                                        rank=rank)
+        with phase(ctx, 'query'):
+            if not all_tasks:
+                query = ts.pending(query)
+            if sort == 'urgency':
+                query = ts.by_urgency(query)
+            else:
+                query = ts.by_number(query)
+        if explain:
+            for detail in ts.explain(query):
+                click.echo(detail)
+            return
+
+        with phase(ctx, 'execute'):
+            if all_tasks:
+                rows = ArchiveService(ts).list_rows(query)
+            else:
+                rows = ts.list_rows(query)
+        with phase(ctx, 'render'):
+            if rows:
+                table = [[number, project or '', ' '.join(tags), description]
+                         for number, project, tags, description in rows]
+                click.echo(tabulate(
+                    table, headers=['#', 'Pro', 'Tags', 'Description']))
+            else:
+                click.echo("No matching tasks")
+
+
+@cli.command()
+@pass_app
+@click.pass_context
+@click.option('--limit', default=10, help="Number of tasks")
+@click.argument('arguments', nargs=-1)
+def next(ctx, app, limit, arguments):
+    """Most urgent pending tasks matching a filter"""
+    from tabulate import tabulate
+    from .services import TaskService
+    from .services.task import TaskServiceParseException
+
+    with app.app_context():
+        ts = TaskService()
+        try:
+            with phase(ctx, 'parse'):
+                query = ts.filter_by_arguments(arguments)
+        except TaskServiceParseException as ex:
+            ctx.fail(str(ex))
+        with phase(ctx, 'execute'):
+            rows = ts.next_rows(query, limit=limit)
+        with phase(ctx, 'render'):
+            if rows:
+                table = [[number, urgency, project or '', ' '.join(tags),
+                          description] for number, project, tags,
+                         description, urgency in rows]
+                click.echo(tabulate(
+                    table, headers=['#', 'Urg', 'Pro', 'Tags', 'Description'],
+                    floatfmt='.1f'))
+            else:
+                click.echo("No matching tasks")
+
+
+@cli.command()
+@pass_app
+@click.pass_context
+@click.argument('arguments', nargs=-1)
+def done(ctx, app, arguments):
+    """Complete tasks by number, range (10-250,300) or filter"""
+    from .services import ArchiveService, TaskService
+    from .services.task import TaskServiceParseException
+
+    with app.app_context():
+        ts = TaskService()
+        try:
+            with phase(ctx, 'execute'):
+                count, missing = ts.done(arguments)
+        except TaskServiceParseException as ex:
+            ctx.fail(str(ex))
+        if not missing:
+            ArchiveService(ts).archive_expired()
+
+    if missing:
+        click.echo("Invalid task id: {}".format(
+            ', '.join(str(number) for number in missing)))
+        ctx.exit(1)
+    click.echo("Completed {} task{}".format(count, '' if count == 1 else 's'))
+
+
+@cli.command(cls=SeparatedCommand,
+             context_settings={'ignore_unknown_options': True})
+@pass_app
+@click.pass_context
+@click.option('--dry-run', is_flag=True,
+              help="Report what would change without changing anything")
+@click.argument('arguments', nargs=-1, required=True)
+def modify(ctx, app, dry_run, arguments):
+    """
+    Change the tasks given by numbers, ranges or a filter, followed by `--`
+    and the changes: ct modify pro:a +bug -- pro:b pri:h -bug
+    """
+    from .services import TaskService
+    from .services.task import TaskServiceParseException
+
+    if '--' not in arguments:
+        ctx.fail("Separate the tasks from the changes with --")
+    index = arguments.index('--')
+    tasks, changes = arguments[:index], arguments[index + 1:]
+
+    with app.app_context():
+        ts = TaskService()
+        report = {}
+        try:
+            with phase(ctx, 'execute'):
+                count, missing = ts.modify(tasks, changes, dry_run=dry_run,
+                                           report=report)
+        except TaskServiceParseException as ex:
+            ctx.fail(str(ex))
+
+    if missing:
+        click.echo("Invalid task id: {}".format(
+            ', '.join(str(number) for number in missing)))
+        ctx.exit(1)
+    click.echo("{} {} task{}".format(
+        'Would modify' if dry_run else 'Modified', count,
+        '' if count == 1 else 's'))
+    for change, rows in sorted(report.items()):
+        click.echo("  {}: {} task{} {}".format(
+            change, rows, '' if rows == 1 else 's',
+            'tagged' if change.startswith('+') else 'untagged'))
+
+
+@cli.command('import')
+@pass_app
+@click.pass_context
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']),
+              help="Input format, guessed from the file name by default")
+@click.option('--batch-size', default=1000, help="Tasks per transaction")
+@click.argument('source', type=click.File('rb'), default='-')
+def import_tasks(ctx, app, fmt, batch_size, source):
+    """Import tasks from a JSON lines or CSV file, `-` for stdin"""
+    from .services import ImportService
+    from .services.transfer import ImportServiceException
+
+    if fmt is None:
+        fmt = 'csv' if source.name.lower().endswith('.csv') else 'jsonl'
+
+    start = time.time()
+
+    def progress(count):
+        elapsed = time.time() - start
+        click.echo('{} tasks, {:.0f} rows/sec'.format(
+            count, count / elapsed if elapsed else 0), err=True)
+
+    with app.app_context():
+        service = ImportService(batch_size=batch_size)
+        rows = getattr(service, 'read_' + fmt)(source)
+        try:
+            count = service.import_rows(rows, progress=progress)
+        except ImportServiceException as ex:
+            ctx.fail(str(ex))
+
+    elapsed = time.time() - start
+    click.echo('Imported {} tasks in {:.2f}s ({:.0f} rows/sec)'.format(
+        count, elapsed, count / elapsed if elapsed else 0))
+
+
+@cli.command()
+@pass_app
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']),
+              default='jsonl', help="Output format")
+@click.option('--batch-size', default=1000, help="Tasks read per query")
+@click.option('--all', 'all_tasks', is_flag=True,
+              help="Include archived tasks")
+@click.argument('arguments', nargs=-1)
+def export(app, fmt, batch_size, all_tasks, arguments):
+    """Export tasks matching a filter, including completed ones"""
+    from .services import ArchiveService, ExportService, TaskService
+
+    stream = click.get_binary_stream('stdout')
+    with app.app_context():
+        ts = TaskService()
+        query = ts.filter_by_arguments(arguments)
+        if all_tasks:
+            query = ArchiveService(ts).queries(query)
+        ExportService(batch_size=batch_size).export(query, stream, fmt=fmt)
+    stream.flush()
+
+
+@cli.command()
+@pass_app
+@click.pass_context
+@click.option('--days', type=int,
+              help="Archive tasks completed more than this many days ago, "
+              "by default ARCHIVE_AFTER_DAYS or 30, 0 with arguments")
+@click.argument('arguments', nargs=-1)
+def archive(ctx, app, days, arguments):
+    """Move completed tasks to the archive database"""
+    from .services import ArchiveService, TaskService
+    from .services.archive import ArchiveServiceException
+    from .services.task import TaskServiceParseException
+
+    with app.app_context():
+        ts = TaskService()
+        service = ArchiveService(ts)
+        try:
+            query, missing = None, []
+            if arguments:
+                query, missing = ts.tasks_by_arguments(arguments)
+                days = days or 0
+            if not missing:
+                count = service.archive(service.expired(query, days))
+        except (ArchiveServiceException, TaskServiceParseException) as ex:
+            ctx.fail(str(ex))
+
+    if missing:
+        click.echo("Invalid task id: {}".format(
+            ', '.join(str(number) for number in missing)))
+        ctx.exit(1)
+    click.echo("Archived {} task{}".format(count, '' if count == 1 else 's'))
 
 
 @cli.command()
-@click.pass_obj
+@pass_app
 @click.pass_context
-@click.argument('ids', nargs=-1)
-def done(ctx, app, ids):
-    arguments = ids
-    ids = []
-    for arg in arguments:
-        for i in arg.split(','):
-            if i:
-                try:
-                    ids.append(int(i))
-                except ValueError:
-                    click.echo('Invalid task number: {}'.format(i))
-                    ctx.exit()
-    ids = set(ids)
-    if not ids:
-        return ctx.fail("No tasks ids defined")
+@click.option('--by', 'period', default='week',
+              type=click.Choice(['day', 'week', 'month', 'year']),
+              help="Length of the periods")
+@click.option('--group', type=click.Choice(['project', 'tag']),
+              help="Count per project or per tag")
+@click.option('--since', default='-1y', help="First day, e.g. 2026-01-01 "
+              "or -3m, `all` for every day")
+@click.option('--until', help="Last day, today by default")
+@click.option('--project', help="Only count the tasks of a project")
+@click.option('--tag', help="Only count the tasks with a tag")
+@click.option('--format', 'fmt', type=click.Choice(['table', 'csv', 'json']),
+              default='table', help="Output format")
+@click.option('--rebuild', is_flag=True,
+              help="Count every task again before reporting")
+def stats(ctx, app, period, group, since, until, project, tag, fmt, rebuild):
+    """Tasks created, completed and open per period"""
+    from .services import StatsService
+    from .services.stats import StatsServiceException
+    from .services.task import TaskServiceParseException
 
     with app.app_context():
-        tasks = []
-        for i in ids:
-            try:
-                task = Task.query.filter(Task.number == i).one()
-                tasks.append(task)
-            except sqlalchemy.orm.exc.NoResultFound:
-                click.echo("Invalid task id: {}".format(i))
-                ctx.exit()
-
-        now = arrow.now()
-        for task in tasks:
-            task.completed = now
-            db.session.add(task)
-        db.session.commit()
+        service = StatsService()
+        if rebuild:
+            service.rebuild()
+        try:
+            if since == 'all':
+                since = None
+            if since is not None:
+                since = service.parse_day(since)
+            if until is not None:
+                until = service.parse_day(until)
+            with phase(ctx, 'execute'):
+                rows = service.report(period, group, since=since, until=until,
+                                      project=project, tag=tag)
+        except (StatsServiceException, TaskServiceParseException) as ex:
+            ctx.fail(str(ex))
+
+    headers = ['Period', 'Created', 'Completed', 'Open']
+    if group:
+        headers.insert(1, group.capitalize())
+    else:
+        rows = [row[:1] + row[2:] for row in rows]
+
+    if fmt == 'json':
+        keys = [header.lower() for header in headers]
+        for row in rows:
+            click.echo(json.dumps(dict(zip(keys, row)), sort_keys=True))
+    elif fmt == 'csv':
+        import csv
+        writer = csv.writer(click.get_text_stream('stdout'))
+        writer.writerow([header.lower() for header in headers])
+        writer.writerows(rows)
+    elif rows:
+        from tabulate import tabulate
+        if group:
+            rows = [row._replace(group=row.group or '-') for row in rows]
+        click.echo(tabulate(rows, headers=headers))
+    else:
+        click.echo("No tasks")
+
+
+@cli.command()
+@pass_app
+@click.pass_context
+@click.argument('path', type=click.Path(dir_okay=False))
+def sync(ctx, app, path):
+    """Exchange the tasks changed since the last sync with a database file"""
+    from .services import SyncService
+    from .services.sync import SyncServiceException
+
+    with app.app_context():
+        try:
+            result = SyncService().sync(path)
+        except SyncServiceException as ex:
+            ctx.fail(str(ex))
+    click.echo("Sent {} task(s), received {} task(s), {} conflict(s)".format(
+        *result))
 
 
 @cli.group()
@@ -110,10 +521,12 @@ def create():
 
 
 @create.command()
-@click.pass_obj
+@pass_app
 @click.pass_context
 @click.argument('name', nargs=1)
 def project(ctx, app, name):
+    from .services import ProjectService
+
     with app.app_context():
         ps = ProjectService()
         project = ps.get_or_create(name=name)
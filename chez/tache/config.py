@@ -6,9 +6,35 @@ import tempfile
 class DefaultConfig(object):
     DEBUG = False
     TESTING = False
+    # Trust the schema version stamp instead of running create_all on every
+    # start. Disable to always check every table and index.
+    FAST_STARTUP = True
+    # Extra virtual tags by name, each matching filter arguments, e.g.
+    # {'URGENT': 'pri:h +OVERDUE'}
+    VIRTUAL_TAGS = {}
+    # Report the phase timings and SQL statements of every command and API
+    # request on stderr, or append them as JSON lines to PROFILE_OUTPUT
+    PROFILE = False
+    PROFILE_OUTPUT = None
     ROOT_DIRECTORY = os.path.expanduser('~/.config/chez')
     SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(os.path.join(
         ROOT_DIRECTORY, 'db.tache.sqlite'))
+    # Completed tasks are moved to the archive database by `ct archive`, and
+    # by `ct done` once a day when ARCHIVE_AFTER_DAYS is set
+    SQLALCHEMY_BINDS = {'archive': 'sqlite:///{}'.format(os.path.join(
+        ROOT_DIRECTORY, 'archive.tache.sqlite'))}
+    ARCHIVE_AFTER_DAYS = None
+    # SQLite pragmas run on every connection: `rollback`, SQLite's defaults
+    # syncing every commit, `wal`, faster but a power loss may drop the last
+    # commits, or `durable`, see chez.tache.storage, and pragmas overriding
+    # the profile's, e.g. {'synchronous': 'FULL', 'cache_size': -64000}
+    STORAGE_PROFILE = 'rollback'
+    STORAGE_PRAGMAS = {}
+    # Connections kept open for reuse, None opens one per command or request
+    SQLALCHEMY_POOL_SIZE = None
+    # Urgency coefficients overriding taskwarrior's defaults, e.g.
+    # {'priority.h': 8.0, 'tag.later': -5.0}, see chez.tache.models.urgency
+    URGENCY_COEFFICIENTS = {}
 
 
 class DevelopmentConfig(DefaultConfig):
@@ -16,9 +42,12 @@ class DevelopmentConfig(DefaultConfig):
     ROOT_DIRECTORY = '/tmp/chez'
     SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(os.path.join(
         ROOT_DIRECTORY, 'db.tache.sqlite'))
+    SQLALCHEMY_BINDS = {'archive': 'sqlite:///{}'.format(os.path.join(
+        ROOT_DIRECTORY, 'archive.tache.sqlite'))}
 
 
 class TestingConfig(DefaultConfig):
     TESTING = True
     ROOT_DIRECTORY = tempfile.mkdtemp()
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_BINDS = {'archive': 'sqlite://'}
@@ -0,0 +1,138 @@
+import contextlib
+import os
+import signal
+import socket
+import sys
+import traceback
+import SocketServer
+from cStringIO import StringIO
+from click.testing import CliRunner
+from .client import LOCAL_COMMANDS, command_name
+
+#: database connections kept open, commands run one at a time
+POOL_SIZE = 1
+
+
+class DaemonException(Exception):
+    pass
+
+
+class CommandRunner(CliRunner):
+    """Click's test runner, capturing the error output apart in `errors`"""
+
+    errors = None
+
+    def get_default_prog_name(self, cli):
+        return 'ct'
+
+    @contextlib.contextmanager
+    def isolation(self, *args, **kwargs):
+        # the test runner sends both streams to the same buffer, it restores
+        # sys.stderr on exit
+        with CliRunner.isolation(self, *args, **kwargs) as output:
+            self.errors = sys.stderr = StringIO()
+            yield output
+
+
+class CommandHandler(SocketServer.StreamRequestHandler):
+    """
+    Reads NUL separated arguments, writes the exit status and the length of
+    the output on a line, then the output and the error output
+    """
+
+    def handle(self):
+        data = self.rfile.read()
+        args = [arg.decode('utf-8') for arg in data.split(b'\0')] \
+            if data else []
+        status, output, errors = self.server.run(args)
+        self.wfile.write('{:d} {:d}\n'.format(status, len(output))
+                         .encode('ascii'))
+        self.wfile.write(output)
+        self.wfile.write(errors)
+
+
+class CommandServer(SocketServer.UnixStreamServer):
+    """
+    Runs `ct` commands sent by :func:`chez.tache.client.forward` against a
+    warm app
+
+    Commands run one at a time with their output captured by click's test
+    runner. The app, its session and the filter and virtual tag caches are
+    kept between commands, and so is its database connection when the app
+    pools :data:`POOL_SIZE` of them.
+    """
+
+    def __init__(self, app, path):
+        self.app = app
+        self.runner = CommandRunner()
+        remove_stale_socket(path)
+        SocketServer.UnixStreamServer.__init__(self, path, CommandHandler)
+
+    def server_bind(self):
+        # only the user may connect
+        umask = os.umask(0o077)
+        try:
+            SocketServer.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def run(self, args):
+        """
+        Runs a command
+
+        :returns: tuple of the exit status, the output and the error output
+        """
+        from .commands import cli
+
+        if command_name(args) in LOCAL_COMMANDS:
+            return 2, b'', b'Error: ct daemon does not run this command\n'
+
+        result = self.runner.invoke(cli, args, obj=self.app)
+        output = result.output_bytes
+        errors = self.runner.errors.getvalue()
+        status = result.exit_code
+        if result.exception is not None and \
+                not isinstance(result.exception, SystemExit):
+            errors += ''.join(traceback.format_exception(
+                *result.exc_info)).encode('utf-8')
+        if not isinstance(status, int):
+            status = 1 if status else 0
+        return status, output, errors
+
+
+def remove_stale_socket(path):
+    """
+    Removes the socket of a daemon which is gone
+
+    :raises DaemonException: if a daemon listens on `path`
+    """
+    if not os.path.exists(path):
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        os.unlink(path)
+    else:
+        raise DaemonException(
+            "A daemon is already listening on {}".format(path))
+    finally:
+        sock.close()
+
+
+def serve(app, path):
+    """Serves commands on the Unix socket `path` until interrupted"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    server = CommandServer(app, path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
@@ -1,27 +1,35 @@
 
 import os
 from flask import Flask
-from .models import db
+from .api import api
+from .models import db, ensure_schema
+from . import profiler, storage
 
 
-def create_app(name='chez.tache', config=None):
+def create_app(name='chez.tache', config=None, settings=None):
     """
     Flask App factory
 
+    :param settings: dictionary overriding the config, e.g. from command
+                     line options
     :return: flask app
     """
     app = Flask(name)
     app.config.from_object('chez.tache.config.DefaultConfig')
     if config:
         app.config.from_object(config)
+    app.config.update(settings or {})
 
     root_directory = app.config['ROOT_DIRECTORY']
     if not os.path.exists(root_directory):
         os.makedirs(root_directory)
 
     db.init_app(app)
+    storage.init_app(app)
+    app.register_blueprint(api)
+    profiler.init_app(app)
 
     with app.app_context():
-        db.create_all()
+        ensure_schema(app, force=not app.config['FAST_STARTUP'])
 
     return app
@@ -1,12 +1,17 @@
-
-from .base import db, Base
+from .base import db, Base, SCHEMA_VERSION, ensure_schema
+from .counter import Counter
 from .project import Project
 from .task import Task
 from .tag import Tag
+from .stats import project_stats, tag_stats
+from . import sync, urgency  # noqa
 
 __all__ = [
-    'db', 'Base',
+    'db', 'Base', 'SCHEMA_VERSION', 'ensure_schema',
+    'Counter',
     'Project',
     'Task',
     'Tag',
+    'project_stats',
+    'tag_stats',
 ]
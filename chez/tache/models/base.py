@@ -1,23 +1,159 @@
-
+import sqlite3
 import uuid
+from sqlalchemy import inspect
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.declarative import declared_attr
 from flask.ext.sqlalchemy import SQLAlchemy
 from sqlalchemy_utils import Timestamp
 from sqlalchemy_utils import ArrowType, UUIDType, ChoiceType
 
-db = SQLAlchemy()
+
+class Database(SQLAlchemy):
+    """
+    Pools the connections of SQLite files when `SQLALCHEMY_POOL_SIZE` is
+    set, Flask-SQLAlchemy opens one per session otherwise
+    """
+
+    def apply_driver_hacks(self, app, info, options):
+        super(Database, self).apply_driver_hacks(app, info, options)
+        if info.drivername == 'sqlite' and options.get('pool_size') and \
+                info.database not in (None, '', ':memory:'):
+            options['poolclass'] = QueuePool
+            # pooled connections are handed to the threads of the server
+            options['connect_args'] = {'check_same_thread': False}
+
+
+db = Database()
 db.Arrow = ArrowType
 db.UUID = UUIDType
 db.Choice = ChoiceType
 
+#: Version of the schema described by the models. Bump it whenever tables,
+#: indexes or other DDL change so existing databases get upgraded on startup.
+SCHEMA_VERSION = 10
+
+#: Schema version from which keys are stored as 16 byte blobs instead of 32
+#: hexadecimal characters
+BINARY_KEYS_VERSION = 7
+
+#: Schema version from which the `project_stats` and `tag_stats` rollups
+#: are maintained by triggers
+STATS_VERSION = 8
+
+#: Schema version from which tasks have an `urgency` column
+URGENCY_VERSION = 9
+
+#: Schema version from which tasks have a `revision` column stamped by the
+#: sync triggers
+SYNC_VERSION = 10
+
 
 class Base(db.Model, Timestamp):
     """Base model class"""
     __abstract__ = True
 
-    id = db.Column(db.UUID(binary=False), default=uuid.uuid4, primary_key=True)
+    # keys are 16 byte blobs, half the size of their hex strings in the
+    # tables and indexes and compared with memcmp in joins
+    id = db.Column(db.UUID(binary=True), default=uuid.uuid4, primary_key=True)
 
     @declared_attr
     def __tablename__(cls):
         """ Set __tablename__ to equal the class name to lower """
         return cls.__name__.lower()
+
+
+def uuid_blob(value):
+    """Converts a key stored as hexadecimal characters to its bytes"""
+    if value is None or len(value) == 16:
+        return value
+    return sqlite3.Binary(uuid.UUID(value).bytes)
+
+
+def convert_keys(connection):
+    """
+    Converts the keys of databases older than :data:`BINARY_KEYS_VERSION`
+    to blobs, keys already converted are left alone
+    """
+    connection.connection.create_function('uuid_blob', 1, uuid_blob)
+    for table in db.metadata.sorted_tables:
+        columns = [column.name for column in table.columns
+                   if isinstance(column.type, UUIDType)]
+        if not columns:
+            continue
+        connection.execute('UPDATE {} SET {} WHERE {}'.format(
+            table.name,
+            ', '.join('{0} = uuid_blob({0})'.format(name)
+                      for name in columns),
+            ' OR '.join("typeof({}) = 'text'".format(name)
+                        for name in columns)))
+
+
+def add_columns(connection, inspector):
+    """
+    Adds the columns of the models missing from existing tables, which
+    create_all leaves alone
+    """
+    for table in db.metadata.sorted_tables:
+        existing = set(column['name']
+                       for column in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name not in existing:
+                connection.execute('ALTER TABLE {} ADD COLUMN {}'.format(
+                    table.name, CreateColumn(column).compile(
+                        dialect=connection.dialect)))
+
+
+def ensure_schema(app=None, force=False, bind=None, engine=None):
+    """
+    Make sure the database schema matches the models
+
+    On SQLite the schema version is stamped in the ``user_version`` pragma so
+    an up to date database costs a single statement instead of reflecting
+    every table through ``create_all``.
+
+    :param force: create missing tables and indexes even if the stamp is
+                  current
+    :param bind: key of the database in `SQLALCHEMY_BINDS`, the main
+                 database by default
+    :param engine: engine of another database, instead of `bind`
+    :returns: True if the schema was checked and created
+    """
+    if engine is None:
+        engine = db.get_engine(db.get_app(app), bind=bind)
+    if engine.dialect.name != 'sqlite':
+        db.metadata.create_all(bind=engine)
+        return True
+
+    with engine.connect() as connection:
+        version = connection.execute('PRAGMA user_version').scalar()
+        if version >= SCHEMA_VERSION and not force:
+            return False
+
+        db.metadata.create_all(bind=connection)
+
+        inspector = inspect(connection)
+        if version < SYNC_VERSION:
+            add_columns(connection, inspector)
+
+        # create_all only creates indexes along with new tables
+        for table in db.metadata.sorted_tables:
+            existing = set(index['name']
+                           for index in inspector.get_indexes(table.name))
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+
+        if version < BINARY_KEYS_VERSION:
+            with connection.begin():
+                convert_keys(connection)
+
+        if version < STATS_VERSION:
+            from .stats import rebuild_stats
+            with connection.begin():
+                rebuild_stats(connection)
+
+        if version < SCHEMA_VERSION:
+            connection.execute(
+                'PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
+    return True
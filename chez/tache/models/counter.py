@@ -0,0 +1,60 @@
+from sqlalchemy import sql
+from .base import db
+
+
+class Counter(db.Model):
+    """Named counter, used to hand out task numbers and version data"""
+    name = db.Column(db.Unicode, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def allocate(cls, connection, name, count=1, seed=None):
+        """
+        Reserve `count` consecutive values of the counter `name`
+
+        The counter is incremented before it is read, so the UPDATE takes
+        SQLite's write lock and concurrent writers wait for the transaction
+        to finish instead of handing out the same values.
+
+        :param connection: connection of the transaction using the values
+        :param seed: scalar select giving the current value when the counter
+                     does not exist yet
+        :returns: first reserved value
+        """
+        table = cls.__table__
+        result = connection.execute(
+            table.update()
+            .where(table.c.name == name)
+            .values(value=table.c.value + count))
+        if not result.rowcount:
+            if seed is None:
+                seed = sql.literal(0)
+            connection.execute(table.insert().from_select(
+                ['name', 'value'],
+                sql.select([sql.literal(name), seed + count])))
+
+        value = connection.execute(
+            sql.select([table.c.value]).where(table.c.name == name)).scalar()
+        return value - count + 1
+
+    @classmethod
+    def advance(cls, connection, name, value):
+        """
+        Moves the counter `name` up to `value` if it is below, so values
+        taken without :meth:`allocate` are not handed out again
+
+        A counter which does not exist yet is left to its seed.
+        """
+        table = cls.__table__
+        connection.execute(
+            table.update()
+            .where(sql.and_(table.c.name == name, table.c.value < value))
+            .values(value=value))
+
+    @classmethod
+    def current(cls, connection, name):
+        """Returns the value of the counter `name`, 0 if it does not exist"""
+        table = cls.__table__
+        value = connection.execute(
+            sql.select([table.c.value]).where(table.c.name == name)).scalar()
+        return value or 0
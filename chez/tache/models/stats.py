@@ -0,0 +1,141 @@
+from sqlalchemy import event
+from .base import db
+
+#: key of the tasks without a project in `project_stats`
+NO_PROJECT = b''
+
+#: Daily counts of tasks created and completed per project and per tag,
+#: kept up to date by triggers. Days are UTC dates as stored in `created`
+#: and `completed`.
+project_stats = db.Table(
+    'project_stats',
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('project_id', db.LargeBinary, primary_key=True),
+    db.Column('created', db.Integer, nullable=False, default=0),
+    db.Column('completed', db.Integer, nullable=False, default=0))
+
+tag_stats = db.Table(
+    'tag_stats',
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('tag_id', db.LargeBinary, primary_key=True),
+    db.Column('created', db.Integer, nullable=False, default=0),
+    db.Column('completed', db.Integer, nullable=False, default=0))
+
+
+def adjust(table, key, keys, day, column, delta):
+    """
+    Statements adding `delta` to `column` of the rows of `day` for every key
+    selected by `keys`, creating missing rows and deleting emptied ones
+    """
+    statements = []
+    if delta > 0:
+        statements.append(
+            "INSERT OR IGNORE INTO {0} (day, {1}, created, completed) "
+            "SELECT {3}, key, 0, 0 FROM ({2}) WHERE {3} IS NOT NULL".format(
+                table, key, keys, day))
+    statements.append(
+        "UPDATE {0} SET {4} = {4} {5:+d} WHERE day = {3} AND {1} IN "
+        "(SELECT key FROM ({2}))".format(table, key, keys, day, column, delta))
+    if delta < 0:
+        statements.append(
+            "DELETE FROM {0} WHERE day = {3} AND {1} IN "
+            "(SELECT key FROM ({2})) AND created = 0 AND completed = 0"
+            .format(table, key, keys, day))
+    return statements
+
+
+def adjust_task(table, key, keys, row, delta):
+    """Statements counting the task `row` (`new` or `old`) `delta` times"""
+    return (adjust(table, key, keys, 'date({}.created)'.format(row),
+                   'created', delta) +
+            adjust(table, key, keys, 'date({}.completed)'.format(row),
+                   'completed', delta))
+
+
+def stats_triggers():
+    """Yields the statements creating the triggers maintaining the rollups"""
+    def project(row):
+        return "SELECT ifnull({}.project_id, X'') AS key".format(row)
+
+    def task_tags(row):
+        return "SELECT tag_id AS key FROM tasks_tags WHERE task_id = {}.id" \
+            .format(row)
+
+    def link(row, column):
+        return "(SELECT date({}) FROM task WHERE id = {}.task_id)".format(
+            column, row)
+
+    changed = ("old.created IS NOT new.created OR "
+               "old.completed IS NOT new.completed")
+    triggers = (
+        ('stats_task_insert', 'AFTER INSERT ON task', None,
+         adjust_task('project_stats', 'project_id', project('new'), 'new', 1)),
+        ('stats_task_update',
+         'AFTER UPDATE OF created, completed, project_id ON task',
+         changed + " OR old.project_id IS NOT new.project_id",
+         adjust_task('project_stats', 'project_id', project('old'), 'old',
+                     -1) +
+         adjust_task('project_stats', 'project_id', project('new'), 'new', 1)),
+        ('stats_task_tags_update',
+         'AFTER UPDATE OF created, completed ON task', changed,
+         adjust_task('tag_stats', 'tag_id', task_tags('old'), 'old', -1) +
+         adjust_task('tag_stats', 'tag_id', task_tags('new'), 'new', 1)),
+        ('stats_tag_insert', 'AFTER INSERT ON tasks_tags', None,
+         adjust('tag_stats', 'tag_id', 'SELECT new.tag_id AS key',
+                link('new', 'created'), 'created', 1) +
+         adjust('tag_stats', 'tag_id', 'SELECT new.tag_id AS key',
+                link('new', 'completed'), 'completed', 1)),
+        # archived tasks are deleted before their links and keep their counts
+        ('stats_tag_delete', 'AFTER DELETE ON tasks_tags',
+         'EXISTS (SELECT 1 FROM task WHERE id = old.task_id)',
+         adjust('tag_stats', 'tag_id', 'SELECT old.tag_id AS key',
+                link('old', 'created'), 'created', -1) +
+         adjust('tag_stats', 'tag_id', 'SELECT old.tag_id AS key',
+                link('old', 'completed'), 'completed', -1)),
+    )
+    for name, event_, when, statements in triggers:
+        yield "CREATE TRIGGER IF NOT EXISTS {} {}{} BEGIN {}; END".format(
+            name, event_, ' WHEN ' + when if when else '',
+            '; '.join(statements))
+
+
+def rebuild_stats(connection, schemas=('main',)):
+    """
+    Recomputes the rollups from the tasks of the databases `schemas`, e.g.
+    the main database and an attached archive
+    """
+    def counts(select):
+        return ' UNION ALL '.join(select.format(schema) for schema in schemas)
+
+    connection.execute("DELETE FROM project_stats")
+    connection.execute(
+        "INSERT INTO project_stats (day, project_id, created, completed) "
+        "SELECT day, key, sum(created), sum(completed) FROM ({}) "
+        "WHERE day IS NOT NULL GROUP BY day, key".format(counts(
+            "SELECT date(created) AS day, ifnull(project_id, X'') AS key, "
+            "1 AS created, 0 AS completed FROM {0}.task UNION ALL "
+            "SELECT date(completed), ifnull(project_id, X''), 0, 1 "
+            "FROM {0}.task")))
+    connection.execute("DELETE FROM tag_stats")
+    connection.execute(
+        "INSERT INTO tag_stats (day, tag_id, created, completed) "
+        "SELECT day, key, sum(created), sum(completed) FROM ({}) "
+        "WHERE day IS NOT NULL GROUP BY day, key".format(counts(
+            "SELECT date(created) AS day, tag_id AS key, 1 AS created, "
+            "0 AS completed FROM {0}.task JOIN {0}.tasks_tags "
+            "ON task_id = id UNION ALL "
+            "SELECT date(completed), tag_id, 0, 1 "
+            "FROM {0}.task JOIN {0}.tasks_tags ON task_id = id")))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_stats_triggers(target, connection, **kw):
+    """
+    Creates the triggers maintaining the rollups, :func:`ensure_schema`
+    counts the tasks of databases older than the rollups
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+
+    for trigger in stats_triggers():
+        connection.execute(trigger)
@@ -0,0 +1,57 @@
+from sqlalchemy import event, sql
+from .base import db
+from .counter import Counter
+
+#: Columns of `task` exchanged by :class:`SyncService`, the others are local
+#: to each database
+SYNCED_COLUMNS = ('description', 'project_id', 'priority', 'due',
+                  'waituntil', 'completed', 'created', 'updated')
+
+SYNC_TRIGGERS = ('sync_task_update', 'sync_tag_insert', 'sync_tag_delete')
+
+#: current sync epoch of the database, bumped by every sync
+EPOCH = "(SELECT value FROM counter WHERE name = 'sync_epoch')"
+
+
+def current_epoch():
+    """
+    Scalar select of the current sync epoch, for the bulk updates to stamp
+    the tasks themselves instead of leaving it to a trigger per row
+    """
+    return sql.select([Counter.value]).where(
+        Counter.name == u'sync_epoch').as_scalar()
+
+
+def sync_triggers():
+    """
+    Yields the statements creating the triggers stamping the `revision` of
+    changed tasks with the current epoch
+
+    New tasks keep a NULL revision, which the sync reads as changed, so
+    inserts cost nothing. Tasks stamped during the current epoch are left
+    alone.
+    """
+    stamp = 'UPDATE task SET revision = {} WHERE id = {{}}'.format(EPOCH)
+    triggers = (
+        ('AFTER UPDATE OF {} ON task'.format(', '.join(SYNCED_COLUMNS)),
+         'new.revision', 'new.id'),
+        ('AFTER INSERT ON tasks_tags',
+         '(SELECT revision FROM task WHERE id = new.task_id)', 'new.task_id'),
+        ('AFTER DELETE ON tasks_tags',
+         '(SELECT revision FROM task WHERE id = old.task_id)', 'old.task_id'),
+    )
+    for name, (event_, revision, key) in zip(SYNC_TRIGGERS, triggers):
+        yield "CREATE TRIGGER IF NOT EXISTS {} {} WHEN {} < {} BEGIN {}; END" \
+            .format(name, event_, revision, EPOCH, stamp.format(key))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_sync_triggers(target, connection, **kw):
+    """Creates the sync epoch and the triggers stamping changed tasks"""
+    if connection.dialect.name != 'sqlite':
+        return
+
+    connection.execute("INSERT OR IGNORE INTO counter (name, value) "
+                       "VALUES ('sync_epoch', 1)")
+    for trigger in sync_triggers():
+        connection.execute(trigger)
@@ -1,23 +1,37 @@
 
-from sqlalchemy import sql
+import weakref
+from sqlalchemy import event, exc, inspect, sql
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import Session
 from .base import db, Base
+from .counter import Counter
 from .project import Project
 from .tag import Tag
 
 
+def reserve_task_numbers(connection, count=1):
+    """
+    Reserve `count` consecutive task numbers
+
+    :returns: first reserved number
+    """
+    seed = sql.select([sql.func.ifnull(sql.func.max(Task.number), 0)])
+    return Counter.allocate(connection, u'task', count,
+                            seed=seed.as_scalar())
+
+
 def default_task_number(context):
-    return context.connection.execute(
-        sql.select([sql.func.ifnull(sql.func.max(Task.number), 0) + 1])
-    ).scalar()
+    return reserve_task_numbers(context.connection)
 
 
 tasks_tags = db.Table(
     'tasks_tags',
-    db.Column('task_id', db.UUID(binary=False), db.ForeignKey('task.id'),
+    db.Column('task_id', db.UUID(binary=True), db.ForeignKey('task.id'),
+              primary_key=True),
+    db.Column('tag_id', db.UUID(binary=True), db.ForeignKey('tag.id'),
               primary_key=True),
-    db.Column('tag_id', db.UUID(binary=False), db.ForeignKey('tag.id'),
-              primary_key=True))
+    # the primary key covers lookups by task, this one lookups by tag
+    db.Index('ix_tasks_tags_tag_id_task_id', 'tag_id', 'task_id'))
 
 
 class Task(Base):
@@ -27,9 +41,11 @@ class Task(Base):
         (u'h', u'High'),
     )
 
-    project_id = db.Column(db.UUID(binary=False), db.ForeignKey(Project.id))
-    project = db.relationship(Project,
-                              backref=db.backref("tasks", lazy='dynamic'))
+    project_id = db.Column(db.UUID(binary=True), db.ForeignKey(Project.id))
+    # the backrefs are view only so adding a task does not mark its project
+    # and tags dirty, which would bump their `updated` timestamp
+    project = db.relationship(Project, backref=db.backref(
+        "tasks", lazy='dynamic', viewonly=True))
 
     description = db.Column(db.UnicodeText, nullable=False)
     priority = db.Column(db.Choice(PRIORITY_VALUES))
@@ -38,8 +54,160 @@ class Task(Base):
     completed = db.Column(db.Arrow)
 
     number = db.Column(db.Integer, unique=True, default=default_task_number)
+    # scored by triggers and daily by TaskService.refresh_urgency, see
+    # models.urgency
+    urgency = db.Column(db.Float)
+    # sync epoch of the last change, NULL until the first sync after the
+    # task was created, see models.sync
+    revision = db.Column(db.Integer)
 
     tags_rel = db.relationship(Tag, secondary=tasks_tags,
-                               backref=db.backref('tasks', lazy='dynamic'))
+                               backref=db.backref('tasks', lazy='dynamic',
+                                                  viewonly=True))
     tags = association_proxy('tags_rel', 'name',
                              creator=lambda name: Tag(name=name))
+
+    __table_args__ = (
+        db.Index('ix_task_due', due),
+        db.Index('ix_task_project_id_completed', project_id, completed),
+        # pending tasks are a small slice of the table, partial indexes keep
+        # list, OVERDUE and waituntil lookups from walking completed rows
+        # while completed date ranges only look at completed ones
+        db.Index('ix_task_completed', completed,
+                 sqlite_where=completed != None),  # noqa
+        db.Index('ix_task_pending_due', due,
+                 sqlite_where=completed == None),  # noqa
+        db.Index('ix_task_pending_waituntil', waituntil,
+                 sqlite_where=completed == None),  # noqa
+        # the most urgent pending tasks are read from the head of the index
+        db.Index('ix_task_pending_urgency', urgency.desc(), number,
+                 sqlite_where=completed == None),  # noqa
+        # the tasks changed since a sync are a range of the index
+        db.Index('ix_task_revision', revision),
+    )
+
+
+@event.listens_for(Session, 'before_flush')
+def number_new_tasks(session, flush_context, instances):
+    """
+    Number every task of a flush with a single reservation, and move the
+    counter past the numbers given explicitly
+    """
+    new = [obj for obj in session.new if isinstance(obj, Task)]
+    numbered = [task.number for task in new if task.number is not None]
+    if numbered:
+        Counter.advance(session.connection(), u'task', max(numbered))
+    tasks = [task for task in new if task.number is None]
+    if not tasks:
+        return
+
+    tasks.sort(key=lambda task: inspect(task).insert_order)
+    first = reserve_task_numbers(session.connection(), len(tasks))
+    for number, task in enumerate(tasks, first):
+        task.number = number
+
+
+#: SQLite FTS5 index of task descriptions. It is an external content table
+#: keyed on the task number, kept in sync by triggers.
+task_fts = sql.table('task_fts', sql.column('rowid'), sql.column('rank'),
+                     sql.column('task_fts'))
+
+TASK_FTS_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task
+    BEGIN
+        INSERT INTO task_fts (rowid, description)
+        VALUES (new.number, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task
+    BEGIN
+        INSERT INTO task_fts (task_fts, rowid, description)
+        VALUES ('delete', old.number, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_update
+    AFTER UPDATE OF number, description ON task
+    BEGIN
+        INSERT INTO task_fts (task_fts, rowid, description)
+        VALUES ('delete', old.number, old.description);
+        INSERT INTO task_fts (rowid, description)
+        VALUES (new.number, new.description);
+    END""",
+)
+
+_fts_engines = weakref.WeakKeyDictionary()
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_task_fts(target, connection, **kw):
+    """Creates the full text index and its triggers if SQLite has FTS5"""
+    if connection.dialect.name != 'sqlite':
+        return
+
+    exists = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'task_fts'").scalar()
+    if not exists:
+        try:
+            connection.execute(
+                "CREATE VIRTUAL TABLE task_fts USING fts5("
+                "description, content='task', content_rowid='number', "
+                "prefix='2 3')")
+        except exc.OperationalError:
+            # SQLite built without FTS5, searches fall back to LIKE
+            _fts_engines[connection.engine] = False
+            return
+        connection.execute(
+            "INSERT INTO task_fts (task_fts) VALUES ('rebuild')")
+
+    for trigger in TASK_FTS_TRIGGERS:
+        connection.execute(trigger)
+    _fts_engines[connection.engine] = True
+
+
+#: Tables whose changes bump the `data_version` counter, e.g. to build ETags
+DATA_VERSION_TABLES = (
+    ('task', ('INSERT', 'UPDATE', 'DELETE')),
+    ('tasks_tags', ('INSERT', 'DELETE')),
+    ('project', ('UPDATE',)),
+)
+
+
+def data_version_triggers():
+    """Yields the statements creating the `data_version` triggers"""
+    for table, operations in DATA_VERSION_TABLES:
+        for operation in operations:
+            yield (
+                "CREATE TRIGGER IF NOT EXISTS data_version_{0}_{1} "
+                "AFTER {2} ON {0} BEGIN "
+                "UPDATE counter SET value = value + 1 "
+                "WHERE name = 'data_version'; END"
+            ).format(table, operation.lower(), operation)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_data_version_triggers(target, connection, **kw):
+    """Creates the triggers counting changes to tasks"""
+    if connection.dialect.name != 'sqlite':
+        return
+
+    connection.execute("INSERT OR IGNORE INTO counter (name, value) "
+                       "VALUES ('data_version', 0)")
+    for trigger in data_version_triggers():
+        connection.execute(trigger)
+
+
+def data_version(connection):
+    """
+    Returns a number which changes whenever tasks, their tags or projects
+    change
+    """
+    return Counter.current(connection, u'data_version')
+
+
+def has_task_fts(engine):
+    """True if the database of `engine` has the full text index"""
+    if engine not in _fts_engines:
+        exists = None
+        if engine.dialect.name == 'sqlite':
+            exists = engine.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'task_fts'").scalar()
+        _fts_engines[engine] = bool(exists)
+    return _fts_engines[engine]
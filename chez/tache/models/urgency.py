@@ -0,0 +1,148 @@
+import zlib
+from sqlalchemy import event
+from .base import db
+
+#: Coefficients of the urgency terms, as taskwarrior's defaults. `tag.<name>`
+#: entries add their coefficient to the tasks with the tag.
+DEFAULT_COEFFICIENTS = {
+    'priority.h': 6.0,
+    'priority.m': 3.9,
+    'priority.l': 1.8,
+    'due': 12.0,
+    'age': 2.0,
+    'project': 1.0,
+    'tags': 1.0,
+    'waiting': -3.0,
+    'tag.next': 15.0,
+}
+
+#: names of the urgency terms besides the `tag.<name>` ones
+TERMS = frozenset(name for name in DEFAULT_COEFFICIENTS
+                  if not name.startswith('tag.'))
+
+#: days after which a task counts as old as it gets
+MAX_AGE = 365.0
+
+URGENCY_TRIGGERS = ('urgency_task_insert', 'urgency_task_update',
+                    'urgency_tag_insert', 'urgency_tag_delete')
+
+
+class UrgencyCoefficientError(ValueError):
+    pass
+
+
+def coefficients(overrides=None):
+    """
+    The default coefficients updated with `overrides`
+
+    :raises UrgencyCoefficientError: on a name which is not a term
+    """
+    result = dict(DEFAULT_COEFFICIENTS)
+    for name in overrides or {}:
+        if name not in TERMS and not (name.startswith('tag.') and name[4:]):
+            raise UrgencyCoefficientError(
+                "Unknown urgency coefficient: {}, expected one of {} or "
+                "tag.<name>".format(name, ', '.join(sorted(TERMS))))
+    result.update(overrides or {})
+    return result
+
+
+def signature(coefficients):
+    """Number identifying a set of coefficients"""
+    return zlib.crc32(repr(sorted(coefficients.items()))) & 0x7fffffff
+
+
+def urgency_sql(coefficients):
+    """
+    SQL expression of the urgency of a row of `task` at the current time
+
+    Like taskwarrior's, it sums the priority, the closeness of the due date
+    (from 14 days ahead to 7 days overdue), the age, the project, the
+    number of tags and the tags given their own coefficient, and makes
+    waiting tasks less urgent.
+    """
+    now = "julianday('now')"
+    count_tags = "(SELECT count(*) FROM tasks_tags WHERE task_id = task.id)"
+    terms = {
+        'priority.h': "task.priority IS 'h'",
+        'priority.m': "task.priority IS 'm'",
+        'priority.l': "task.priority IS 'l'",
+        'due': ("CASE WHEN task.due IS NULL THEN 0 "
+                "WHEN {0} - julianday(task.due) >= 7 THEN 1.0 "
+                "WHEN {0} - julianday(task.due) >= -14 "
+                "THEN ({0} - julianday(task.due) + 14) * 0.8 / 21 + 0.2 "
+                "ELSE 0.2 END".format(now)),
+        'age': "max(min({} - julianday(task.created), {!r}), 0) / {!r}"
+               .format(now, MAX_AGE, MAX_AGE),
+        'project': "task.project_id IS NOT NULL",
+        'tags': ("CASE {} WHEN 0 THEN 0 WHEN 1 THEN 0.8 WHEN 2 THEN 0.9 "
+                 "ELSE 1.0 END".format(count_tags)),
+        'waiting': "ifnull(julianday(task.waituntil) > {}, 0)".format(now),
+    }
+    expressions = []
+    for name, coefficient in sorted(coefficients.items()):
+        if not coefficient:
+            continue
+        if name.startswith('tag.'):
+            term = ("EXISTS (SELECT 1 FROM tasks_tags JOIN tag "
+                    "ON tag.id = tasks_tags.tag_id "
+                    "WHERE task_id = task.id AND tag.name = '{}')".format(
+                        name[4:].lower().replace("'", "''")))
+        else:
+            term = terms[name]
+        expressions.append('{!r} * ({})'.format(float(coefficient), term))
+    return ' + '.join(expressions) or '0.0'
+
+
+def urgency_triggers(coefficients):
+    """
+    Yields the statements creating the triggers scoring pending tasks when
+    they or their tags change
+    """
+    update = 'UPDATE task SET urgency = {} WHERE id = {{}}'.format(
+        urgency_sql(coefficients))
+    triggers = (
+        ('AFTER INSERT ON task', 'new.completed IS NULL', 'new.id'),
+        ('AFTER UPDATE OF priority, due, waituntil, project_id, created '
+         'ON task', 'new.completed IS NULL', 'new.id'),
+        ('AFTER INSERT ON tasks_tags', None, 'new.task_id'),
+        ('AFTER DELETE ON tasks_tags', None, 'old.task_id'),
+    )
+    for name, (event_, when, key) in zip(URGENCY_TRIGGERS, triggers):
+        if when is None:
+            when = '(SELECT completed FROM task WHERE id = {}) IS NULL' \
+                .format(key)
+        yield "CREATE TRIGGER IF NOT EXISTS {} {} WHEN {} BEGIN {}; END" \
+            .format(name, event_, when, update.format(key))
+
+
+def create_urgency(connection, coefficients):
+    """
+    Replaces the urgency triggers by those of `coefficients` and scores
+    every pending task
+    """
+    for name in URGENCY_TRIGGERS:
+        connection.execute('DROP TRIGGER IF EXISTS {}'.format(name))
+    for trigger in urgency_triggers(coefficients):
+        connection.execute(trigger)
+    refresh_urgency(connection, coefficients)
+
+
+def refresh_urgency(connection, coefficients):
+    """Scores every pending task, e.g. once the day changed"""
+    connection.execute(
+        'UPDATE task SET urgency = {} WHERE completed IS NULL'.format(
+            urgency_sql(coefficients)))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_urgency_triggers(target, connection, **kw):
+    """
+    Creates the urgency triggers with the default coefficients,
+    :meth:`TaskService.refresh_urgency` replaces them by the configured ones
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+
+    for trigger in urgency_triggers(DEFAULT_COEFFICIENTS):
+        connection.execute(trigger)
@@ -0,0 +1,193 @@
+"""
+Timings of commands and API requests
+
+A :class:`Profiler` records the time spent in named phases, every SQL
+statement executed through the engine and, optionally, cProfile statistics.
+Commands are profiled with `ct --profile`, requests when the `PROFILE`
+setting is on.
+"""
+import cProfile
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import current_app, g, request
+from sqlalchemy import event
+from .models import db
+
+#: key of the statement start times in the connection's info
+START_TIMES = 'chez.tache.profiler'
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+class Profiler(object):
+    """
+    Records phases and SQL statements of a command or request
+
+    Only statements executed by the thread which attached the profiler are
+    recorded, so concurrent requests of a threaded server are not mixed.
+
+    :param name: what is profiled, e.g. `ct list` or `GET /api/tasks`
+    :param cprofile: also collect cProfile statistics
+    """
+
+    def __init__(self, name=None, cprofile=False):
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.phases = OrderedDict()
+        self.statements = []
+        self.engine = None
+        self.thread = None
+        self.cprofile = None
+        if cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @contextmanager
+    def phase(self, name):
+        """Times the enclosed block as phase `name`"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.time() - start)
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def attach(self, engine):
+        """Records the statements executed by the current thread on `engine`"""
+        self.detach()
+        self.engine = engine
+        self.thread = threading.current_thread()
+        event.listen(engine, 'before_cursor_execute', self.before_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+
+    def detach(self):
+        if self.engine is None:
+            return
+        event.remove(self.engine, 'before_cursor_execute', self.before_execute)
+        event.remove(self.engine, 'after_cursor_execute', self.after_execute)
+        self.engine = None
+
+    def before_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        if threading.current_thread() is self.thread:
+            conn.info.setdefault(START_TIMES, []).append(time.time())
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        if threading.current_thread() is self.thread and \
+                conn.info.get(START_TIMES):
+            start = conn.info[START_TIMES].pop()
+            self.statements.append((statement, time.time() - start))
+
+    def stop(self):
+        """Stops recording, the total time is taken here"""
+        if self.end is not None:
+            return
+        self.end = time.time()
+        self.detach()
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+    def to_dict(self, slowest=10):
+        """
+        Results as a dictionary serializable to JSON
+
+        :param slowest: number of the slowest statements to include
+        """
+        end = self.end if self.end is not None else time.time()
+        statements = sorted(self.statements, key=lambda s: s[1],
+                            reverse=True)[:slowest]
+        return {
+            'name': self.name,
+            'total_ms': ms(end - self.start),
+            'phases': OrderedDict((name, ms(seconds))
+                                  for name, seconds in self.phases.items()),
+            'sql': {
+                'count': len(self.statements),
+                'ms': ms(sum(seconds for _, seconds in self.statements)),
+                'slowest': [{'statement': statement, 'ms': ms(seconds)}
+                            for statement, seconds in statements],
+            },
+        }
+
+    def report(self, slowest=5):
+        """Results as lines of text"""
+        data = self.to_dict(slowest=slowest)
+        lines = ['{:<10} {:10.2f}ms'.format(data['name'] or 'total',
+                                            data['total_ms'])]
+        for name, value in data['phases'].items():
+            lines.append('  {:<8} {:10.2f}ms'.format(name, value))
+        sql = data['sql']
+        lines.append('{:<10} {:10.2f}ms in {} statement{}'.format(
+            'sql', sql['ms'], sql['count'], '' if sql['count'] == 1 else 's'))
+        for statement in sql['slowest']:
+            text = ' '.join(statement['statement'].split())
+            lines.append('  {:10.2f}ms {}'.format(
+                statement['ms'], text if len(text) <= 70 else
+                text[:67] + '...'))
+        return lines
+
+    def server_timing(self):
+        """Value of a `Server-Timing` header"""
+        data = self.to_dict(slowest=0)
+        metrics = ['{};dur={}'.format(name, value)
+                   for name, value in data['phases'].items()]
+        metrics.append('sql;dur={};desc="{} statements"'.format(
+            data['sql']['ms'], data['sql']['count']))
+        metrics.append('total;dur={}'.format(data['total_ms']))
+        return ', '.join(metrics)
+
+    def dump_stats(self, path):
+        """Writes the cProfile statistics, readable by :mod:`pstats`"""
+        self.cprofile.dump_stats(path)
+
+    def write(self, stream=None, path=None):
+        """
+        Writes the text report to `stream`, stderr by default, or appends
+        the results as a JSON line to the file `path`
+        """
+        if path:
+            with open(path, 'a') as output:
+                output.write(json.dumps(self.to_dict()) + '\n')
+        else:
+            stream = stream or sys.stderr
+            stream.write('\n'.join(self.report()) + '\n')
+
+
+def init_app(app):
+    """
+    Profiles the requests of `app` while its `PROFILE` setting is on
+
+    Each response gets a `Server-Timing` header and the results are written
+    as for commands, see :meth:`Profiler.write`.
+    """
+    @app.before_request
+    def start_request_profiler():
+        if current_app.config['PROFILE']:
+            g.profiler = Profiler(u'{} {}'.format(request.method,
+                                                  request.path))
+            g.profiler.attach(db.get_engine(current_app))
+
+    @app.after_request
+    def stop_request_profiler(response):
+        profiler = g.get('profiler')
+        if profiler is not None:
+            profiler.stop()
+            response.headers['Server-Timing'] = profiler.server_timing()
+            profiler.write(path=current_app.config['PROFILE_OUTPUT'])
+        return response
+
+    @app.teardown_request
+    def detach_request_profiler(exception):
+        profiler = g.get('profiler')
+        if profiler is not None:
+            profiler.detach()
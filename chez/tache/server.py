@@ -0,0 +1,89 @@
+"""
+API server for many concurrent clients
+
+Every connection gets a thread, which mostly waits on the network, while
+the requests run on a bounded pool of worker threads sharing a pool of
+`SQLALCHEMY_POOL_SIZE` database connections. Change notifications wait in
+the connection threads instead, so long polls and event streams never hold
+a worker.
+"""
+import signal
+import sys
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+from werkzeug.serving import ThreadedWSGIServer
+
+#: worker threads running requests
+WORKERS = 8
+
+#: paths of the views not using the database session
+UNPOOLED_PATHS = ('/api/changes',)
+
+
+class WorkerPool(object):
+    """
+    WSGI middleware running the requests to `app` on `workers` threads
+
+    Request bodies are read and responses buffered by the connection
+    threads, so slow clients do not hold a worker.
+    """
+
+    def __init__(self, app, workers=WORKERS, unpooled=UNPOOLED_PATHS):
+        self.app = app
+        self.unpooled = unpooled
+        self.pool = ThreadPool(workers)
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') in self.unpooled:
+            return self.app(environ, start_response)
+
+        length = environ.get('CONTENT_LENGTH')
+        body = environ['wsgi.input'].read(int(length)) if length else b''
+        environ['wsgi.input'] = BytesIO(body)
+        status, headers, output = self.pool.apply(self.run, (environ,))
+        start_response(status, headers)
+        return [output]
+
+    def run(self, environ):
+        """Runs a request, returns its status, headers and output"""
+        response = []
+        output = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+            return output.append
+
+        result = self.app(environ, start_response)
+        try:
+            output.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response[0], response[1], b''.join(output)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+class ApiServer(ThreadedWSGIServer):
+    """Serves `app` with :class:`WorkerPool`"""
+    daemon_threads = True
+
+    def __init__(self, app, host='127.0.0.1', port=5000, workers=WORKERS):
+        self.workers = WorkerPool(app, workers)
+        ThreadedWSGIServer.__init__(self, host, port, self.workers)
+
+    def server_close(self):
+        ThreadedWSGIServer.server_close(self)
+        self.workers.close()
+
+
+def serve(app, host='127.0.0.1', port=5000, workers=WORKERS):
+    """Serves the API of `app` until interrupted"""
+    server = ApiServer(app, host, port, workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
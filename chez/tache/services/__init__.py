@@ -1,8 +1,17 @@
 
+from .archive import ArchiveService
 from .project import ProjectService
+from .stats import StatsService
+from .sync import SyncService
 from .task import TaskService
+from .transfer import ImportService, ExportService
 
 __all__ = [
+    'ArchiveService',
     'ProjectService',
+    'StatsService',
+    'SyncService',
     'TaskService',
+    'ImportService',
+    'ExportService',
 ]
@@ -0,0 +1,185 @@
+import os
+from datetime import timedelta
+import arrow
+from flask import current_app
+from sqlalchemy.orm import Session
+from .base import BaseService, BaseServiceException
+from .task import TaskService
+from chez.tache.models import db, ensure_schema, Counter, Project, Tag, Task
+from chez.tache.models.task import tasks_tags
+
+#: bind key of the archive database in `SQLALCHEMY_BINDS`
+ARCHIVE_BIND = 'archive'
+
+#: days after completion tasks are archived by default
+DEFAULT_ARCHIVE_DAYS = 30
+
+
+class ArchiveServiceException(BaseServiceException):
+    pass
+
+
+class ArchiveService(BaseService):
+    """
+    Moves completed tasks out of the `task` table into the archive database
+
+    The archive is a second SQLite file with the same schema, configured as
+    the `archive` bind. Archived tasks keep their ids and numbers, their
+    projects and tags are copied along, so the queries built by
+    :class:`TaskService` run unchanged against :meth:`query`.
+    """
+
+    def __init__(self, task_service=None):
+        self.ts = task_service or TaskService()
+        self._session = None
+
+    @property
+    def engine(self):
+        return db.get_engine(current_app, bind=ARCHIVE_BIND)
+
+    @property
+    def path(self):
+        """
+        Path of the archive database file
+
+        :raises ArchiveServiceException: if the archive is not a SQLite file
+        """
+        url = self.engine.url
+        if url.get_backend_name() != 'sqlite' or \
+                url.database in (None, '', ':memory:'):
+            raise ArchiveServiceException(
+                "The archive must be a SQLite database file")
+        return url.database
+
+    def exists(self):
+        """True if tasks were ever archived"""
+        try:
+            return os.path.exists(self.path)
+        except ArchiveServiceException:
+            return False
+
+    @property
+    def session(self):
+        """Session of the archive database, for reads"""
+        if self._session is None:
+            self._session = Session(bind=self.engine)
+        return self._session
+
+    def query(self, query):
+        """The task query `query`, run against the archive"""
+        return query.with_session(self.session)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def attach(self, connection):
+        """Attaches the archive to `connection` as the `archive` schema"""
+        databases = [row[1] for row in
+                     connection.execute('PRAGMA database_list')]
+        if ARCHIVE_BIND not in databases:
+            connection.execute('ATTACH DATABASE ? AS {}'.format(ARCHIVE_BIND),
+                               (self.path,))
+
+    def expired(self, query=None, days=None):
+        """
+        Restricts a task query, all tasks by default, to the tasks completed
+        more than `days` days ago, by default `ARCHIVE_AFTER_DAYS` or
+        :data:`DEFAULT_ARCHIVE_DAYS`
+        """
+        if days is None:
+            days = current_app.config['ARCHIVE_AFTER_DAYS']
+        if days is None:
+            days = DEFAULT_ARCHIVE_DAYS
+        if query is None:
+            query = Task.query
+        return query.filter(
+            Task.completed != None,  # noqa
+            Task.completed < self.ts.now - timedelta(days=days))
+
+    def archive(self, query):
+        """
+        Moves the completed tasks of `query` to the archive
+
+        Tasks, their projects, tags and links are copied with one
+        INSERT ... SELECT per table into the attached archive and deleted
+        from the main database in the same transaction.
+
+        :returns: number of archived tasks
+        """
+        ensure_schema(bind=ARCHIVE_BIND)
+        connection = db.session.connection()
+        self.attach(connection)
+
+        self.ts.create_selection()
+        count = self.ts.select_tasks(
+            query.filter(Task.completed != None))  # noqa
+        if not count:
+            db.session.rollback()
+            return 0
+
+        selected = 'SELECT id FROM task_selection'
+        self.copy(connection, Project.__table__, 'OR IGNORE',
+                  'id IN (SELECT project_id FROM main.task WHERE id IN ({}))'
+                  .format(selected))
+        self.copy(connection, Tag.__table__, 'OR IGNORE',
+                  'id IN (SELECT tag_id FROM main.tasks_tags '
+                  'WHERE task_id IN ({}))'.format(selected))
+        self.copy(connection, Task.__table__, 'OR REPLACE',
+                  'id IN ({})'.format(selected))
+        self.copy(connection, tasks_tags, 'OR IGNORE',
+                  'task_id IN ({})'.format(selected))
+        # tasks first, so the rollups keep counting the archived tasks
+        connection.execute('DELETE FROM main.task WHERE id IN ({})'
+                           .format(selected))
+        connection.execute('DELETE FROM main.tasks_tags WHERE task_id IN ({})'
+                           .format(selected))
+        db.session.commit()
+        return count
+
+    def copy(self, connection, table, conflict, where):
+        columns = ', '.join(column.name for column in table.columns)
+        connection.execute(
+            'INSERT {0} INTO {1}.{2} ({3}) SELECT {3} FROM main.{2} '
+            'WHERE {4}'.format(conflict, ARCHIVE_BIND, table.name, columns,
+                               where))
+
+    def archive_expired(self):
+        """
+        Archives the tasks completed more than `ARCHIVE_AFTER_DAYS` days ago,
+        at most once a day and only if the setting is on
+
+        :returns: number of archived tasks
+        """
+        if current_app.config['ARCHIVE_AFTER_DAYS'] is None:
+            return 0
+
+        today = arrow.now().date().toordinal()
+        connection = db.session.connection()
+        if Counter.current(connection, u'archive_day') >= today:
+            return 0
+
+        count = self.archive(self.expired())
+        table = Counter.__table__
+        db.session.connection().execute(table.insert().prefix_with(
+            'OR REPLACE').values(name=u'archive_day', value=today))
+        db.session.commit()
+        return count
+
+    def list_rows(self, query):
+        """
+        Listing rows of `query` over the main database and the archive,
+        ordered by task number, see :meth:`TaskService.list_rows`
+        """
+        rows = self.ts.list_rows(query)
+        if self.exists():
+            rows.extend(self.ts.list_rows(self.query(query)))
+            rows.sort(key=lambda row: row[0])
+        return rows
+
+    def queries(self, query):
+        """`query` and, if there is an archive, the same query against it"""
+        if self.exists():
+            return [query, self.query(query)]
+        return [query]
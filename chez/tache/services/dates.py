@@ -0,0 +1,131 @@
+import re
+import arrow
+from arrow.locales import EnglishLocale
+
+
+class DateParser(object):
+    """
+    Parses date expressions relative to a `now` snapshot
+
+    Understands ISO dates and times, `now`, `today`, `yesterday`,
+    `tomorrow`, weekday names and their prefixes (the next such day, today
+    included), offsets such as `+3d` or `-2w` (`h`, `d`, `w`, `m` or `y`),
+    the start or end of the day, week, month or year (`sod`, `eow`, `eom`,
+    `soy`...) and ISO durations such as `P1W` or `-PT2H`.
+
+    Each distinct expression is parsed once, results are kept for the life
+    of the parser so it should not outlive its `now`.
+    """
+
+    ISO_REGEX = re.compile(
+        r'^(\d{4})-(\d\d)-(\d\d)'
+        r'(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6}))?)?)?$')
+    OFFSET_REGEX = re.compile(r'^([\+-]?)(\d+)([hdwmy])$')
+    DURATION_REGEX = re.compile(
+        r'^([\+-]?)P(?:(\d+)Y)?(?:(\d+)M)?(?:(\d+)W)?(?:(\d+)D)?'
+        r'(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$', re.IGNORECASE)
+    SPAN_REGEX = re.compile(r'^([se])o([dwmy])$')
+
+    OFFSET_UNITS = {'h': 'hours', 'd': 'days', 'w': 'weeks', 'm': 'months',
+                    'y': 'years'}
+    SPAN_UNITS = {'d': 'day', 'w': 'week', 'm': 'month', 'y': 'year'}
+    DURATION_UNITS = ('years', 'months', 'weeks', 'days', 'hours', 'minutes',
+                      'seconds')
+    WEEKDAYS = [name.lower() for name in EnglishLocale.day_names[1:]]
+
+    def __init__(self, now=None, maxsize=10000):
+        self.now = now or arrow.now()
+        self.maxsize = maxsize
+        self.cache = {}
+
+    def parse(self, value):
+        """
+        Parses a date expression
+
+        :returns: arrow object
+        :raises ValueError: on an invalid expression
+        """
+        value = value.strip()
+        try:
+            result = self.cache[value]
+        except KeyError:
+            result = self.parse_uncached(value)
+            if len(self.cache) >= self.maxsize:
+                self.cache.clear()
+            self.cache[value] = result
+        if result is None:
+            raise ValueError(u"Invalid date format: {}".format(value))
+        return result
+
+    def parse_uncached(self, value):
+        """Parses a date expression, returns None if it is invalid"""
+        match = self.ISO_REGEX.match(value)
+        if match:
+            # arrow takes out of range values such as 2015-13-45 for 2015-01-01
+            return self.parse_iso(match)
+
+        lower = value.lower()
+        for parser in (self.parse_word, self.parse_offset, self.parse_span,
+                       self.parse_duration, self.parse_weekday):
+            result = parser(lower)
+            if result is not None:
+                return result
+
+        try:
+            return arrow.get(value)
+        except (arrow.parser.ParserError, TypeError, ValueError):
+            return None
+
+    def parse_iso(self, match):
+        """Naive ISO dates and times, in UTC as `arrow.get` has them"""
+        parts = [int(part) for part in match.groups()[:6] if part]
+        microsecond = match.group(7)
+        if microsecond:
+            parts.append(int(microsecond.ljust(6, '0')))
+        try:
+            return arrow.Arrow(*parts)
+        except ValueError:
+            return None
+
+    def parse_word(self, value):
+        if value in ('now', 'today'):
+            return self.now
+        if value == 'yesterday':
+            return self.now.replace(days=-1)
+        if value == 'tomorrow':
+            return self.now.replace(days=1)
+        return None
+
+    def parse_offset(self, value):
+        match = self.OFFSET_REGEX.match(value)
+        if not match:
+            return None
+        sign, count, unit = match.groups()
+        count = -int(count) if sign == '-' else int(count)
+        return self.now.replace(**{self.OFFSET_UNITS[unit]: count})
+
+    def parse_span(self, value):
+        match = self.SPAN_REGEX.match(value)
+        if not match:
+            return None
+        edge, unit = match.groups()
+        start, end = self.now.span(self.SPAN_UNITS[unit])
+        return start if edge == 's' else end
+
+    def parse_duration(self, value):
+        match = self.DURATION_REGEX.match(value)
+        if not match or not any(match.groups()[1:]):
+            return None
+        sign = -1 if match.group(1) == '-' else 1
+        shifts = dict((name, sign * int(count)) for name, count in
+                      zip(self.DURATION_UNITS, match.groups()[1:]) if count)
+        return self.now.replace(**shifts)
+
+    def parse_weekday(self, value):
+        if not value.isalpha():
+            return None
+        today = self.now.weekday()
+        for days in range(7):
+            if self.WEEKDAYS[(today + days) % 7].startswith(value):
+                return self.now.replace(days=days)
+        return None
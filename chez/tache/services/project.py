@@ -1,14 +1,33 @@
-
-from chez.tache.models import db, Project
+from collections import namedtuple
+import arrow
+from sqlalchemy import case, func
+from chez.tache.models import db, Project, Task
 from .base import BaseService
 
+ProjectSummary = namedtuple('ProjectSummary',
+                            ['name', 'pending', 'overdue', 'completed'])
+
 
 class ProjectService(BaseService):
-    """Project Service manager"""
+    """
+    Project Service manager
+
+    Projects are cached by name once looked up or created, a service should
+    live for a single command or request.
+    """
+
+    def __init__(self):
+        self.cache = {}
 
     def get(self, name):
         """Get a project by name"""
-        return Project.query.filter_by(name=name.strip().lower()).first()
+        name = name.strip().lower()
+        project = self.cache.get(name)
+        if project is None:
+            project = Project.query.filter_by(name=name).first()
+            if project is not None:
+                self.cache[name] = project
+        return project
 
     def create(self, name, commit=True):
         """
@@ -16,10 +35,12 @@ class ProjectService(BaseService):
 
         :param commit: commit the created project if True
         """
-        project = Project(name=name.strip().lower())
+        name = name.strip().lower()
+        project = Project(name=name)
         if commit:
             db.session.add(project)
             db.session.commit()
+        self.cache[name] = project
         return project
 
     def get_or_create(self, name, commit=True):
@@ -27,3 +48,30 @@ class ProjectService(BaseService):
         if not project:
             project = self.create(name=name, commit=commit)
         return project
+
+    def summary(self, now=None):
+        """
+        Counts the tasks of every project with a single grouped query
+
+        Pending, overdue and completed tasks are counted as the `PENDING`,
+        `OVERDUE` and `COMPLETED` virtual tags match them.
+
+        :returns: list of :class:`ProjectSummary` ordered by project name
+        """
+        if now is None:
+            now = arrow.now()
+
+        def count(*conditions):
+            return func.ifnull(func.sum(case([(db.and_(*conditions), 1)],
+                                             else_=0)), 0)
+
+        # projects without tasks join a row of nulls
+        pending = db.and_(Task.id != None, Task.completed == None)  # noqa
+        rows = db.session.query(
+            Project.name,
+            count(pending),
+            count(pending, Task.due <= now),
+            count(Task.completed != None),  # noqa
+        ).outerjoin(Task, Task.project_id == Project.id).group_by(
+            Project.id).order_by(Project.name)
+        return [ProjectSummary(*row) for row in rows]
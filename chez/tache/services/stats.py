@@ -0,0 +1,128 @@
+from collections import namedtuple
+from sqlalchemy import func, literal_column, sql
+from .base import BaseService, BaseServiceException
+from .archive import ARCHIVE_BIND, ArchiveService
+from .task import TaskService
+from chez.tache.models import db, Project, Tag, project_stats, tag_stats
+from chez.tache.models.stats import rebuild_stats
+
+StatsRow = namedtuple('StatsRow',
+                      ['period', 'group', 'created', 'completed', 'open'])
+
+
+class StatsServiceException(BaseServiceException):
+    pass
+
+
+class StatsService(BaseService):
+    """
+    Burndown and velocity reports over the `project_stats` and `tag_stats`
+    rollups
+
+    The rollups hold the tasks created and completed per day, project and
+    tag, maintained by triggers on every write, so reports read a few rows
+    per day instead of scanning the tasks. Archived tasks stay counted.
+    """
+
+    #: SQL expressions of the period containing a day, weeks start on Monday
+    PERIODS = {
+        'day': lambda day: func.date(day),
+        'week': lambda day: func.date(day, 'weekday 0', '-6 days'),
+        'month': lambda day: func.strftime('%Y-%m', day),
+        'year': lambda day: func.strftime('%Y', day),
+    }
+
+    GROUPS = ('project', 'tag')
+
+    def __init__(self, task_service=None):
+        self.ts = task_service or TaskService()
+
+    def parse_day(self, value):
+        """
+        Parses a date expression, see :meth:`TaskService.parse_date`, to the
+        UTC day the rollups use
+
+        :raises TaskServiceParseException: on parse error
+        """
+        return self.ts.parse_date(value).to('utc').date()
+
+    def report(self, period='week', group=None, since=None, until=None,
+               project=None, tag=None):
+        """
+        Counts the tasks created and completed in every period
+
+        :param period: `day`, `week`, `month` or `year`
+        :param group: None for totals, `project` or `tag` for counts per
+                      project or per tag
+        :param since: first day counted, :class:`datetime.date`
+        :param until: last day counted, :class:`datetime.date`
+        :param project: only count the tasks of this project name, empty for
+                        the tasks without a project
+        :param tag: only count the tasks with this tag name
+        :returns: list of :class:`StatsRow` ordered by period and group,
+                  `open` is the number of tasks created and not completed at
+                  the end of the period, counting the days before `since`
+        :raises StatsServiceException: on an invalid combination
+        """
+        if period not in self.PERIODS:
+            raise StatsServiceException("Invalid period: {}".format(period))
+        if group not in (None,) + self.GROUPS:
+            raise StatsServiceException("Invalid group: {}".format(group))
+        by_tag = group == 'tag' or tag is not None
+        if by_tag and (group == 'project' or project is not None):
+            raise StatsServiceException(
+                "Tasks are counted per project or per tag, not both")
+
+        if by_tag:
+            table, model, key = tag_stats, Tag, tag_stats.c.tag_id
+        else:
+            table, model = project_stats, Project
+            key = project_stats.c.project_id
+        name = func.ifnull(model.name, u'') if group else sql.null()
+
+        def query(*columns):
+            q = db.session.query(name.label('name'), *columns).select_from(
+                table).outerjoin(model, model.id == key)
+            if until is not None:
+                q = q.filter(table.c.day <= until)
+            if project is not None:
+                q = q.filter(func.ifnull(Project.name, u'') ==
+                             project.strip().lower())
+            if tag is not None:
+                q = q.filter(Tag.name == tag.strip().lower())
+            return q.group_by(name)
+
+        # tasks still open when the report starts
+        totals = {}
+        if since is not None:
+            q = query(func.sum(table.c.created - table.c.completed))
+            totals = dict(q.filter(table.c.day < since))
+
+        bucket = self.PERIODS[period](table.c.day).label('period')
+        q = query(bucket, func.sum(table.c.created),
+                  func.sum(table.c.completed)).group_by(
+            literal_column('period')).order_by(literal_column('period'), name)
+        if since is not None:
+            q = q.filter(table.c.day >= since)
+
+        rows = []
+        for name_, period_, created, completed in q:
+            if not (created or completed):
+                continue
+            totals[name_] = totals.get(name_, 0) + created - completed
+            rows.append(StatsRow(period_, name_, created, completed,
+                                 totals[name_]))
+        return rows
+
+    def rebuild(self):
+        """
+        Recomputes the rollups from the tasks, archived ones included
+        """
+        archive = ArchiveService(self.ts)
+        schemas = ['main']
+        connection = db.session.connection()
+        if archive.exists():
+            archive.attach(connection)
+            schemas.append(ARCHIVE_BIND)
+        rebuild_stats(connection, schemas)
+        db.session.commit()
@@ -0,0 +1,273 @@
+import os
+import random
+from collections import namedtuple
+from sqlalchemy import create_engine
+from .base import BaseService, BaseServiceException
+from .archive import ARCHIVE_BIND, ArchiveService
+from .task import TaskService
+from chez.tache.models import db, ensure_schema
+from chez.tache.models.sync import SYNCED_COLUMNS
+
+#: schema name of the other database while syncing
+PEER = 'peer'
+
+SyncResult = namedtuple('SyncResult', ['sent', 'received', 'conflicts'])
+
+
+class SyncServiceException(BaseServiceException):
+    pass
+
+
+class SyncService(BaseService):
+    """
+    Exchanges the tasks changed since the last sync with another database
+    file
+
+    Every database stamps its changed tasks with its current sync epoch,
+    see :mod:`chez.tache.models.sync`, and counts in the `counter` table the
+    epoch of each other database up to which it received the changes. A
+    sync attaches the other database, reads the tasks of both with a
+    revision from these marks on through the `ix_task_revision` index and
+    copies them across in one transaction, then moves both epochs on. Tasks
+    copied by a sync are stamped below the new marks so they are not sent
+    back.
+
+    Tasks are matched by id, projects and tags by name, and task numbers
+    are local to each database. When a task changed on both sides, the one
+    updated last wins, ties going to the database with the greater sync id.
+    Archiving is not synced: changes to tasks in the local archive are
+    skipped.
+    """
+
+    def __init__(self, task_service=None):
+        self.ts = task_service or TaskService()
+
+    def sync(self, path):
+        """
+        Syncs with the database file `path`, created if it does not exist
+
+        :returns: :class:`SyncResult` of the number of tasks sent, received
+                  and changed on both sides
+        :raises SyncServiceException: if `path` is this database or a copy
+        """
+        if os.path.realpath(path) == os.path.realpath(
+                db.engine.url.database or ''):
+            raise SyncServiceException("Can't sync a database with itself")
+
+        engine = create_engine('sqlite:///{}'.format(path))
+        try:
+            ensure_schema(engine=engine)
+        finally:
+            engine.dispose()
+
+        archive = ArchiveService(self.ts)
+        connection = db.engine.connect()
+        try:
+            # ATTACH and CREATE commit on pysqlite, they come before the
+            # transaction
+            connection.execute('ATTACH DATABASE ? AS {}'.format(PEER),
+                               (path,))
+            try:
+                if archive.exists():
+                    archive.attach(connection)
+                for name in ('sync_outgoing', 'sync_incoming'):
+                    connection.execute(
+                        'CREATE TEMPORARY TABLE IF NOT EXISTS {} '
+                        '(id BLOB PRIMARY KEY)'.format(name))
+                    connection.execute('DELETE FROM temp.{}'.format(name))
+                connection.execute(
+                    'CREATE TEMPORARY TABLE IF NOT EXISTS sync_new '
+                    '(seq INTEGER PRIMARY KEY, id BLOB)')
+                with connection.begin():
+                    return self.exchange(connection, archive.exists())
+            finally:
+                connection.execute('DETACH DATABASE {}'.format(PEER))
+        finally:
+            connection.close()
+
+    def exchange(self, connection, archived):
+        """Copies the changed tasks both ways in the current transaction"""
+        # take the write locks first so no change slips between the reads
+        # of the epochs and their bump
+        for schema in ('main', PEER):
+            connection.execute("UPDATE {}.counter SET value = value "
+                               "WHERE name = 'sync_epoch'".format(schema))
+        local_id, peer_id = self.sync_id(connection, 'main'), \
+            self.sync_id(connection, PEER)
+        if local_id == peer_id:
+            raise SyncServiceException(
+                "The database is a copy of this one, they can't be synced")
+        local_epoch = self.counter(connection, 'main', u'sync_epoch')
+        peer_epoch = self.counter(connection, PEER, u'sync_epoch')
+
+        self.select_changes(connection, 'main', 'sync_outgoing', self.counter(
+            connection, PEER, u'sync_received:{}'.format(local_id)))
+        self.select_changes(connection, PEER, 'sync_incoming', self.counter(
+            connection, 'main', u'sync_received:{}'.format(peer_id)))
+        if archived:
+            connection.execute(
+                'DELETE FROM temp.sync_incoming WHERE id IN '
+                '(SELECT id FROM {}.task)'.format(ARCHIVE_BIND))
+        conflicts = self.resolve_conflicts(connection, local_id > peer_id)
+
+        received = self.apply(connection, PEER, 'main', 'sync_incoming',
+                              local_epoch)
+        sent = self.apply(connection, 'main', PEER, 'sync_outgoing',
+                          peer_epoch)
+
+        for schema, epoch, other, other_epoch in (
+                ('main', local_epoch, peer_id, peer_epoch),
+                (PEER, peer_epoch, local_id, local_epoch)):
+            # new tasks join the epoch ending now, which the marks include
+            connection.execute('UPDATE {}.task SET revision = ? '
+                               'WHERE revision IS NULL'.format(schema),
+                               (epoch,))
+            self.set_counter(connection, schema, u'sync_epoch', epoch + 1)
+            self.set_counter(connection, schema,
+                             u'sync_received:{}'.format(other),
+                             other_epoch + 1)
+        return SyncResult(sent, received, conflicts)
+
+    def counter(self, connection, schema, name):
+        value = connection.execute(
+            'SELECT value FROM {}.counter WHERE name = ?'.format(schema),
+            (name,)).scalar()
+        return value or 0
+
+    def set_counter(self, connection, schema, name, value):
+        connection.execute('INSERT OR REPLACE INTO {}.counter (name, value) '
+                           'VALUES (?, ?)'.format(schema), (name, value))
+
+    def sync_id(self, connection, schema):
+        """Random number identifying the database `schema`, created once"""
+        connection.execute(
+            "INSERT OR IGNORE INTO {}.counter (name, value) "
+            "VALUES ('sync_id', ?)".format(schema),
+            (random.getrandbits(62) + 1,))
+        return self.counter(connection, schema, u'sync_id')
+
+    def select_changes(self, connection, schema, selection, mark):
+        """
+        Selects the tasks of `schema` changed from the epoch `mark` on, and
+        the ones never synced
+        """
+        connection.execute(
+            'INSERT INTO temp.{1} (id) '
+            'SELECT id FROM {0}.task WHERE revision >= ? '
+            'UNION ALL SELECT id FROM {0}.task WHERE revision IS NULL'
+            .format(schema, selection), (mark,))
+
+    def resolve_conflicts(self, connection, local_wins_ties):
+        """
+        Keeps the tasks changed on both sides only in the selection of the
+        side which updated them last
+
+        :returns: number of tasks changed on both sides
+        """
+        conflicts = connection.execute(
+            'SELECT count(*) FROM temp.sync_incoming '
+            'WHERE id IN (SELECT id FROM temp.sync_outgoing)').scalar()
+        if not conflicts:
+            return 0
+
+        connection.execute(
+            'DELETE FROM temp.sync_incoming WHERE id IN ('
+            'SELECT local.id FROM temp.sync_outgoing selected '
+            'JOIN main.task local ON local.id = selected.id '
+            'JOIN {}.task peer ON peer.id = selected.id '
+            'WHERE local.updated > peer.updated OR '
+            '(local.updated = peer.updated AND ?))'.format(PEER),
+            (int(local_wins_ties),))
+        connection.execute(
+            'DELETE FROM temp.sync_outgoing WHERE id IN '
+            '(SELECT id FROM temp.sync_incoming)')
+        return conflicts
+
+    def apply(self, connection, source, target, selection, epoch):
+        """
+        Copies the selected tasks of `source` to `target` with their
+        projects and tags, stamped with the epoch `epoch` of `target`
+
+        :returns: number of copied tasks
+        """
+        selected = 'SELECT id FROM temp.{}'.format(selection)
+        count = connection.execute(
+            'SELECT count(*) FROM temp.{}'.format(selection)).scalar()
+        if not count:
+            return 0
+
+        values = dict(source=source, target=target, selected=selected)
+        # projects and tags missing by name, with the ids they have in source
+        connection.execute(
+            'INSERT OR IGNORE INTO {target}.project (id, name, created, '
+            'updated) SELECT min(id), name, created, updated '
+            'FROM {source}.project WHERE id IN (SELECT project_id '
+            'FROM {source}.task WHERE id IN ({selected})) AND name NOT IN '
+            '(SELECT name FROM {target}.project) GROUP BY name'
+            .format(**values))
+        connection.execute(
+            'INSERT OR IGNORE INTO {target}.tag (id, name, created, updated) '
+            'SELECT id, name, created, updated FROM {source}.tag '
+            'WHERE id IN (SELECT tag_id FROM {source}.tasks_tags '
+            'WHERE task_id IN ({selected}))'.format(**values))
+
+        columns = ', '.join(SYNCED_COLUMNS)
+        values['columns'] = ', '.join(
+            column if column != 'project_id' else
+            '(SELECT min(project.id) FROM {target}.project JOIN '
+            '{source}.project other ON other.name = project.name '
+            'WHERE other.id = changed.project_id)'.format(**values)
+            for column in SYNCED_COLUMNS)
+        connection.execute(
+            'UPDATE {target}.task SET ({0}) = (SELECT {columns} '
+            'FROM {source}.task changed WHERE changed.id = task.id), '
+            'revision = ? WHERE id IN ({selected})'.format(columns, **values),
+            (epoch,))
+
+        # new tasks numbered in their source order after the target's last
+        connection.execute('DELETE FROM temp.sync_new')
+        new = connection.execute(
+            'INSERT INTO temp.sync_new (id) SELECT id FROM {source}.task '
+            'WHERE id IN ({selected}) AND id NOT IN '
+            '(SELECT id FROM {target}.task) ORDER BY number'
+            .format(**values)).rowcount
+        if new:
+            first = self.reserve_numbers(connection, target, new)
+            # sequences of the emptied table start over at 1
+            connection.execute(
+                'INSERT INTO {target}.task (id, number, revision, {0}) '
+                'SELECT changed.id, ? + new.seq - 1, ?, {columns} '
+                'FROM temp.sync_new new JOIN {source}.task changed '
+                'ON changed.id = new.id'.format(columns, **values),
+                (first, epoch))
+
+        # links matched by tag name, the unchanged ones are left alone
+        links = ('SELECT link.task_id, tag.id FROM {source}.tasks_tags link '
+                 'JOIN {source}.tag other ON other.id = link.tag_id '
+                 'JOIN {target}.tag tag ON tag.name = other.name '
+                 'WHERE link.task_id IN ({selected})'.format(**values))
+        connection.execute(
+            'DELETE FROM {target}.tasks_tags WHERE task_id IN ({selected}) '
+            'AND (task_id, tag_id) NOT IN ({links})'
+            .format(links=links, **values))
+        connection.execute(
+            'INSERT OR IGNORE INTO {target}.tasks_tags (task_id, tag_id) '
+            '{links}'.format(links=links, **values))
+        return count
+
+    def reserve_numbers(self, connection, schema, count):
+        """
+        Reserves `count` task numbers of the database `schema`, see
+        :meth:`Counter.allocate`
+
+        :returns: first reserved number
+        """
+        updated = connection.execute(
+            "UPDATE {}.counter SET value = value + ? WHERE name = 'task'"
+            .format(schema), (count,)).rowcount
+        if not updated:
+            connection.execute(
+                "INSERT INTO {0}.counter (name, value) SELECT 'task', "
+                "ifnull(max(number), 0) + ? FROM {0}.task".format(schema),
+                (count,))
+        return self.counter(connection, schema, u'task') - count + 1
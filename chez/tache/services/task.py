@@ -2,19 +2,31 @@
 import re
 import arrow
 import copy
-from sqlalchemy import and_, not_
+import threading
+from collections import namedtuple, OrderedDict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import and_, not_, or_, sql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext import baked
 from sqlalchemy_utils import escape_like
 from .base import BaseService, BaseServiceException
 from .project import ProjectService
-from chez.tache.models import db, Task, Project, Tag
+from chez.tache.models import db, urgency, Counter, Task, Project, Tag
+from chez.tache.models.sync import current_epoch
+from chez.tache.models.task import tasks_tags, task_fts, has_task_fts
+from .dates import DateParser
+from .virtual import get_virtual_tags, time_params
 
 
 class Clause(object):
-    def __init__(self, name, value=None, isnot=False, clause=None):
+    def __init__(self, name, value=None, isnot=False, clause=None,
+                 dated=False):
         self.name = name
         self.value = value
         self.isnot = isnot
         self.clause = clause
+        self.dated = dated
 
     def get_clause(self):
         """Returns a sqlalchemy for this clause"""
@@ -55,17 +67,78 @@ class Clause(object):
         return column == None  # noqa
 
     def create_project_clause(self, column, value):
-        """Creates a clause for a Project"""
-        return column == value
+        """
+        Creates a clause for a Project
+
+        Projects are matched by name so the clause does not hold on to the
+        instance, which is not even saved when filtering on a new name.
+        """
+        project_ids = sql.select([Project.id]).where(
+            Project.name == value.name)
+        return Task.project_id.in_(project_ids)
 
     def create_text_clause(self, column, value):
         """Creates a clause for text"""
+        if self.name == 'description' and has_task_fts(db.engine):
+            return self.create_search_clause(value)
         return column.ilike(u'%{}%'.format(escape_like(value.strip())))
 
+    SEARCH_TOKEN_REGEX = re.compile(r'"([^"]*)"|(\S+)')
+
+    @classmethod
+    def search_query(cls, value):
+        """
+        Converts search text to an FTS5 query
+
+        Words match whole words, `word*` words starting with `word` and
+        `"some words"` the phrase. Anything else is quoted so it is never
+        taken as FTS5 syntax.
+        """
+        terms = []
+        for phrase, word in cls.SEARCH_TOKEN_REGEX.findall(value):
+            prefix = False
+            if word:
+                prefix = word.endswith('*')
+                phrase = word.rstrip('*')
+            if phrase.strip():
+                terms.append(u'"{}"{}'.format(phrase.replace('"', '""'),
+                                              '*' if prefix else ''))
+        return u' '.join(terms)
+
+    @classmethod
+    def create_search_clause(cls, value):
+        """Creates a clause matching tasks through the full text index"""
+        query = cls.search_query(value)
+        if not query:
+            return sql.true()
+        numbers = sql.select([task_fts.c.rowid]).where(
+            task_fts.c.task_fts.match(query))
+        return Task.number.in_(numbers)
+
     def create_tags_clause(self, tag):
-        """Creates a clause for a tag"""
+        """
+        Creates a clause for a tag
+
+        `tag` matches the tag name exactly, `tag*` matches names starting
+        with `tag` and `~tag` names containing `tag`. Matching tag ids are
+        selected once through the unique index on the name and their tasks
+        through the `tasks_tags` index on `tag_id`.
+        """
         tag = tag.lower()
-        return Task.tags.any(Tag.name.ilike(u'%{}%'.format(escape_like(tag))))
+        if tag.startswith('~'):
+            name = Tag.name.like(u'%{}%'.format(escape_like(tag[1:])),
+                                 escape='*')
+        elif tag.endswith('*'):
+            # a range rather than LIKE so the index on the name can be used
+            prefix = tag[:-1]
+            name = and_(Tag.name >= prefix, Tag.name < prefix + u'\uffff')
+        else:
+            name = Tag.name == tag
+
+        tag_ids = sql.select([Tag.id]).where(name)
+        task_ids = sql.select([tasks_tags.c.task_id]).where(
+            tasks_tags.c.tag_id.in_(tag_ids))
+        return Task.id.in_(task_ids)
 
     @classmethod
     def create_date_clause(cls, column, day):
@@ -73,71 +146,148 @@ class Clause(object):
         start, end = day.span('day')
         return and_(column >= start, column <= end)
 
-    @classmethod
-    def virtual_tags(cls):
-        """Creates the clauses for virtual tags"""
-        now = arrow.now()
-        return {
-            'TODAY': cls.create_date_clause(Task.due, now),
-            'YESTERDAY': cls.create_date_clause(
-                Task.due, now.replace(days=-1)),
-            'TOMORROW': cls.create_date_clause(Task.due, now.replace(days=1)),
-            'OVERDUE': and_(Task.due <= now, Task.completed == None),  # noqa
-        }
+
+#: Temporary table holding the ids of the tasks being archived or modified,
+#: see :meth:`TaskService.select_tasks`
+task_selection = sql.table('task_selection', sql.column('id'))
+
+
+#: Pending tasks, `now` being bound with the time parameters
+PENDING = and_(Task.completed == None,  # noqa
+               or_(Task.waituntil <= sql.bindparam('now'),
+                   Task.waituntil == None))  # noqa
+
+
+#: Parsed filter, `day` is set when it holds dates relative to that day
+CachedFilter = namedtuple('CachedFilter', ['criterion', 'search', 'day'])
+
+
+class FilterCache(object):
+    """Thread safe least recently used cache of parsed filters"""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the entry for `key` or None"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        """Stores `entry`, evicting the least recently used one if full"""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
 
 
 class TaskService(BaseService):
-    """Service to manage tasks"""
+    """
+    Service to manage tasks
+
+    Relative dates and virtual tags are evaluated against `now`, taken once
+    when the service is created, so a service should live for a single
+    command or request.
+    """
 
     DEFAULT_OPTION_REGEX = re.compile(r'^(\w+):(.*?)$')
-    DEFAULT_TAG_REGEX = re.compile(r'^([\+-])(\w+)$')
+    DEFAULT_TAG_REGEX = re.compile(r'^([\+-])(~?\w+\*?)$')
+    NUMBER_REGEX = re.compile(r'^(\d+)(?:-(\d+))?$')
+    #: missing task numbers reported at most
+    MAX_MISSING = 100
+
+    #: parsed filters, shared by every service of the process
+    filter_cache = FilterCache()
+    #: queries built and compiled from cached filters, see
+    #: :meth:`baked_filter`
+    bakery = staticmethod(baked.bakery())
 
     def __init__(self, option_regex=DEFAULT_OPTION_REGEX,
-                 tag_regex=DEFAULT_TAG_REGEX):
+                 tag_regex=DEFAULT_TAG_REGEX, now=None, virtual_tags=None):
         self.option_regex = option_regex
         self.tag_regex = tag_regex
+        self.now = now or arrow.now()
+        self._virtual_tags = virtual_tags
+        self._time_params = None
+        self._date_parser = None
+        self.projects = ProjectService()
+
+    @property
+    def virtual_tags(self):
+        """The :class:`VirtualTagRegistry` of the current app"""
+        if self._virtual_tags is None:
+            self._virtual_tags = get_virtual_tags(current_app)
+        return self._virtual_tags
+
+    def time_params(self):
+        """Values of the virtual tag time parameters for `now`"""
+        if self._time_params is None:
+            self._time_params = time_params(self.now)
+        return self._time_params
 
     def create(self, **kwargs):
         """Create a task with `**kwargs`"""
+        tags = kwargs.pop('tags', None)
         task = Task(**kwargs)
+        if tags:
+            task.tags_rel = self.get_or_create_tags(tags)
         db.session.add(task)
         db.session.commit()
         return task
 
+    def get_or_create_tags(self, names):
+        """
+        Get tags by name, creating the missing ones without committing
+
+        :raises TaskServiceParseException: on a tag pattern such as `~tag`
+        """
+        names = set(name.lower() for name in names)
+        for name in names:
+            if name.startswith('~') or name.endswith('*'):
+                raise TaskServiceParseException(
+                    "Invalid tag: {}".format(name))
+
+        tags = Tag.query.filter(Tag.name.in_(names)).all()
+        missing = names - set(tag.name for tag in tags)
+        if missing:
+            # a concurrent writer may be creating the same tags
+            db.session.execute(
+                Tag.__table__.insert().prefix_with('OR IGNORE'),
+                [{'name': name} for name in sorted(missing)])
+            tags = Tag.query.filter(Tag.name.in_(names)).all()
+        return tags
+
     def parse_date(self, value):
         """
-        Parses a date and returns the value as an arrow type
+        Parses a date expression relative to the service's `now`, see
+        :class:`DateParser`
 
         :returns: arrow object
         :raises TaskServiceParseException: on parse error
         """
-        value = value.strip()
-
-        # try to parse formated date
+        if self._date_parser is None:
+            self._date_parser = DateParser(self.now)
         try:
-            return arrow.get(value)
-        except arrow.parser.ParserError:
-            pass
-
-        shortcuts = {
-            'today': arrow.now(),
-            'yesterday': arrow.now().replace(days=-1),
-            'tomorrow': arrow.now().replace(days=1),
-        }
-        shortcut_value = value.lower()
-        if shortcut_value in shortcuts:
-            return shortcuts[shortcut_value]
-
-        weekday = value.lower()
-        now = arrow.now()
-        next_week = now.replace(days=8)
-        while now <= next_week:
-            if now.format('dddd').lower().startswith(weekday):
-                return now
-            now = now.replace(days=1)
-
-        raise TaskServiceParseException(
-            "Invalid date format: {}".format(value))
+            return self._date_parser.parse(value)
+        except ValueError as ex:
+            raise TaskServiceParseException(ex.args[0])
 
     def parse_project_option(self, options, name, value):
         """
@@ -155,8 +305,7 @@ class TaskService(BaseService):
             options['project'] = None
             return options
 
-        ps = ProjectService()
-        options['project'] = ps.get_or_create(value, commit=False)
+        options['project'] = self.projects.get_or_create(value, commit=False)
         return options
 
     def parse_priority_option(self, options, name, value):
@@ -181,6 +330,9 @@ class TaskService(BaseService):
         if name in options:
             raise TaskServiceParseException(
                 "More than one {} date defined".format(name))
+        if not value:
+            options[name] = None
+            return options
         try:
             options[name] = self.parse_date(value)
             return options
@@ -196,6 +348,17 @@ class TaskService(BaseService):
         """Parses waituntil date"""
         return self.parse_date_option(options, 'waituntil', value)
 
+    def parse_description_option(self, options, name, value):
+        """
+        Parses a description given as an option, e.g. `desc:'new words'`
+
+        :raises TaskServiceParseException: on an empty description
+        """
+        if not value.strip():
+            raise TaskServiceParseException("Invalid task description")
+        options['description'] = value.strip()
+        return options
+
     def parse_option(self, options, name, value):
         """
         Parses options and sets the proper options in the dictionary used for
@@ -208,6 +371,7 @@ class TaskService(BaseService):
             'priority': self.parse_priority_option,
             'due': self.parse_due_date,
             'waituntil': self.parse_waituntil_date,
+            'description': self.parse_description_option,
         }
         option_func = None
         for k, v in option_types.items():
@@ -238,14 +402,15 @@ class TaskService(BaseService):
                     options, option_match.group(1), option_match.group(2))
             elif tag_match:
                 sign = tag_match.group(1)
-                tag = tag_match.group(2).lower()
-                virtual_tags = Clause.virtual_tags()
+                tag = tag_match.group(2)
 
-                if tag.upper() in virtual_tags:
-                    clauses.append(Clause(name='virtual',
+                if tag in self.virtual_tags:
+                    clause, dated = self.virtual_tags.get(tag, self)
+                    clauses.append(Clause(name='virtual', value=tag.upper(),
                                           isnot=(sign == '-'),
-                                          clause=virtual_tags[tag.upper()]))
+                                          clause=clause, dated=dated))
                 else:
+                    tag = tag.lower()
                     if sign == '+':
                         tags.append(tag)
                     elif sign == '-':
@@ -264,23 +429,107 @@ class TaskService(BaseService):
 
     def from_arguments(self, arguments):
         """Parse command line arguments and create a task, project, etc"""
-        options = self.parse_arguments(arguments, with_clauses=False)
+        options = self.parse_arguments(arguments, with_clauses=True)
+        for clause in options.pop('clauses'):
+            if clause.name == 'virtual':
+                raise TaskServiceParseException(
+                    "Virtual tag {} can't be added".format(clause.value))
         if not options.get('description', None):
             raise TaskServiceParseException("Invalid task description")
 
         return self.create(**options)
 
-    def filter_by_arguments(self, arguments, defaults=None):
+    def filter_by_arguments(self, arguments, defaults=None, rank=False):
         """
         Parse command line arguments and create a sql query
 
+        Parsed filters are cached on the normalized arguments, times are
+        bound as parameters of the returned query.
+
         :params defaults: default options
+        :param rank: order by full text search relevance when the arguments
+                     search descriptions
+        """
+        entry = self.cached_filter(arguments, defaults, rank)[1]
+        return self.apply_filter(Task.query, entry).params(
+            **self.time_params())
+
+    def baked_filter(self, arguments, defaults=None, rank=False):
+        """
+        Parse command line arguments into a baked query
+
+        The query of a cached filter, with the steps added by
+        :meth:`pending`, :meth:`by_urgency`, :meth:`by_number` and
+        :meth:`list_rows`, is built and its statement compiled once per
+        process. Times stay bound parameters, given by :meth:`run`. Filters
+        which can't be cached are built again on every run.
+
+        :returns: :class:`~sqlalchemy.ext.baked.BakedQuery`
+        """
+        key, entry = self.cached_filter(arguments, defaults, rank)
+        query = self.bakery(lambda session: session.query(Task))
+        if key is None:
+            query.spoil(full=True)
+        return query.with_criteria(
+            lambda query: self.apply_filter(query, entry), key, entry.day)
+
+    def run(self, query):
+        """Runs a baked query in the current session at `now`"""
+        return query(db.session()).params(**self.time_params())
+
+    def cached_filter(self, arguments, defaults, rank):
+        """
+        Returns the filter cache key of the arguments and their
+        :class:`CachedFilter`, parsed again when dated to another day
+        """
+        key = self.filter_key(arguments, defaults, rank)
+        entry = self.filter_cache.get(key) if key is not None else None
+        if entry is not None and entry.day not in (None, self.now.date()):
+            entry = None
+        if entry is None:
+            entry = self.parse_filter(arguments, defaults, rank)
+            if key is not None:
+                self.filter_cache.set(key, entry)
+        return key, entry
+
+    def apply_filter(self, query, entry):
+        """Filters a task query by a :class:`CachedFilter`"""
+        if entry.criterion is not None:
+            query = query.filter(entry.criterion)
+        if entry.search:
+            query = self.order_by_rank(query, entry.search)
+        return query
+
+    def filter_key(self, arguments, defaults, rank):
+        """
+        Returns the filter cache key of the arguments, None if they can't be
+        cached
+        """
+        if isinstance(defaults, dict):
+            return None
+        if isinstance(defaults, basestring):  # noqa
+            defaults = defaults.split()
+        return (
+            tuple(arg.strip() for arg in arguments if arg.strip()),
+            tuple(arg.strip() for arg in defaults or () if arg.strip()),
+            bool(rank),
+            has_task_fts(db.engine),
+            self.virtual_tags,
+            self.option_regex,
+            self.tag_regex,
+        )
+
+    def parse_filter(self, arguments, defaults=None, rank=False):
+        """
+        Parse command line arguments into a filter
+
+        :returns: :class:`CachedFilter`
         """
         options = self.parse_arguments(arguments, with_clauses=True)
         clauses = options.pop('clauses', [])
 
         if isinstance(defaults, basestring):  # noqa
-            defaults = defaults.split(' ')
+            defaults = defaults.split()
         if isinstance(defaults, list):
             defaults = self.parse_arguments(defaults, with_clauses=True)
         if not defaults:
@@ -292,11 +541,411 @@ class TaskService(BaseService):
         for name, value in defaults.iteritems():
             clauses.append(Clause(name=name, value=value))
 
-        query = Task.query
-        for clause in clauses:
-            query = query.filter(clause.get_clause())
+        criterion = None
+        if clauses:
+            criterion = and_(*[clause.get_clause() for clause in clauses])
 
-        return query
+        day = None
+        if any(clause.dated or isinstance(clause.value, arrow.Arrow)
+               for clause in clauses):
+            day = self.now.date()
+
+        search = defaults.get('description') if rank else None
+        return CachedFilter(criterion, search, day)
+
+    def order_by_rank(self, query, text):
+        """Orders a task query by full text search relevance of `text`"""
+        search = Clause.search_query(text)
+        if not search or not has_task_fts(db.engine):
+            return query
+        return query.join(task_fts, task_fts.c.rowid == Task.number).filter(
+            task_fts.c.task_fts.match(search)).order_by(task_fts.c.rank)
+
+    def pending(self, query, now=None):
+        """
+        Restricts a task query to pending tasks
+
+        Pending tasks are not completed and not waiting until after `now`,
+        by default the service's. Baked queries take the bound `now`.
+        """
+        if isinstance(query, baked.BakedQuery):
+            return query.with_criteria(lambda query: query.filter(PENDING))
+        if now is None:
+            now = self.now
+        return query.filter(
+            Task.completed == None,  # noqa
+            or_(Task.waituntil <= now, Task.waituntil == None))  # noqa
+
+    def list_rows(self, query, with_urgency=False):
+        """
+        Reads the listing columns of a task query in a single SELECT
+
+        Tags are joined with plain outer joins which SQLite looks up through
+        the `tasks_tags` primary key and no ORM objects are loaded.
+
+        :param with_urgency: add the urgency to the columns
+        :returns: list of tuples of the task number, project name, sorted
+                  tag names, description and urgency if asked for
+        """
+        if isinstance(query, baked.BakedQuery):
+            rows = self.run(query.with_criteria(
+                lambda query: self.list_query(query, with_urgency),
+                with_urgency))
+        else:
+            rows = self.list_query(query, with_urgency)
+        return [(row[0], row[1], sorted(row[2].split()) if row[2] else [],
+                 row[3]) + tuple(row[4:])
+                for row in rows]
+
+    def list_query(self, query, with_urgency=False):
+        """The query of the listing columns, see :meth:`list_rows`"""
+        entities = [Task.number, Project.name,
+                    sql.func.group_concat(Tag.name, u' '), Task.description]
+        if with_urgency:
+            entities.append(Task.urgency)
+        return query.outerjoin(Task.project).outerjoin(
+            tasks_tags, tasks_tags.c.task_id == Task.id).outerjoin(
+            Tag, Tag.id == tasks_tags.c.tag_id).group_by(
+            Task.id).with_entities(*entities)
+
+    def refresh_urgency(self):
+        """
+        Scores every pending task again once a day, and when the
+        `URGENCY_COEFFICIENTS` changed, replacing the triggers which score
+        the tasks as they are written
+
+        The day and coefficients of the last scoring are kept in the
+        `urgency_day` and `urgency_coefficients` counters.
+
+        :returns: True if the tasks were scored
+        """
+        coefficients = urgency.coefficients(
+            current_app.config['URGENCY_COEFFICIENTS'])
+        stamp = urgency.signature(coefficients)
+        today = self.now.date().toordinal()
+        connection = db.session.connection()
+        table = Counter.__table__
+        counters = dict(connection.execute(
+            sql.select([table.c.name, table.c.value]).where(
+                table.c.name.in_([u'urgency_day', u'urgency_coefficients'])))
+            .fetchall())
+        if counters.get(u'urgency_coefficients') != stamp:
+            urgency.create_urgency(connection, coefficients)
+        elif counters.get(u'urgency_day', 0) < today:
+            urgency.refresh_urgency(connection, coefficients)
+        else:
+            return False
+
+        connection.execute(table.insert().prefix_with('OR REPLACE'), [
+            {'name': u'urgency_day', 'value': today},
+            {'name': u'urgency_coefficients', 'value': stamp}])
+        db.session.commit()
+        return True
+
+    def by_urgency(self, query):
+        """Orders a task query by decreasing urgency, then by number"""
+        self.refresh_urgency()
+        if isinstance(query, baked.BakedQuery):
+            return query.with_criteria(
+                lambda query: query.order_by(Task.urgency.desc(),
+                                             Task.number))
+        return query.order_by(Task.urgency.desc(), Task.number)
+
+    def by_number(self, query):
+        """Orders a task query by number"""
+        if isinstance(query, baked.BakedQuery):
+            return query.with_criteria(
+                lambda query: query.order_by(Task.number))
+        return query.order_by(Task.number)
+
+    def next_rows(self, query, limit=10):
+        """
+        Listing rows with urgency, see :meth:`list_rows`, of the `limit`
+        most urgent pending tasks of `query`
+
+        The tasks are picked from the head of the pending urgency index
+        before their projects and tags are joined.
+        """
+        top = self.by_urgency(self.pending(query)).with_entities(
+            Task.id).limit(limit).subquery()
+        query = Task.query.filter(Task.id.in_(sql.select([top.c.id])))
+        return self.list_rows(query.order_by(Task.urgency.desc(),
+                                             Task.number),
+                              with_urgency=True)
+
+    def parse_numbers(self, arguments):
+        """
+        Parses task numbers and ranges, e.g. `3 10-250,300`
+
+        :returns: tuple of a clause matching the numbers and the sorted list
+                  of `(start, end)` bounds of the numbers, overlapping and
+                  adjacent ranges merged
+        :raises TaskServiceParseException: on an invalid number
+        """
+        ranges = []
+        clauses = []
+        singles = []
+        for arg in arguments:
+            for value in arg.split(','):
+                if not value:
+                    continue
+                match = self.NUMBER_REGEX.match(value.strip())
+                if not match:
+                    raise TaskServiceParseException(
+                        "Invalid task number: {}".format(value))
+                start = int(match.group(1))
+                end = int(match.group(2) or start)
+                if start > end:
+                    start, end = end, start
+                if start == end:
+                    singles.append(start)
+                else:
+                    clauses.append(Task.number.between(start, end))
+                ranges.append((start, end))
+
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+
+        if singles:
+            clauses.append(Task.number.in_(singles))
+        return or_(*clauses), merged
+
+    def missing_numbers(self, ranges, limit=MAX_MISSING):
+        """
+        Returns the first `limit` numbers of `ranges` without a task
+
+        A single statement walks the ranges in order with a recursive CTE
+        and looks each number up in the unique index, stopping at the
+        `limit`-th missing one, so a range is never expanded in memory.
+        """
+        params = {'limit': limit}
+        values = []
+        for index, (start, end) in enumerate(ranges):
+            values.append('(:start{0}, :end{0})'.format(index))
+            params['start{}'.format(index)] = start
+            params['end{}'.format(index)] = end
+        # ordering the recursive step makes the queue yield numbers in order
+        statement = sql.text(
+            'WITH RECURSIVE requested (start, end) AS (VALUES {}), '
+            'requested_number (number, end) AS ('
+            'SELECT start, end FROM requested UNION ALL '
+            'SELECT number + 1, end FROM requested_number '
+            'WHERE number < end ORDER BY 1) '
+            'SELECT number FROM requested_number WHERE NOT EXISTS '
+            '(SELECT 1 FROM task WHERE task.number = requested_number.number) '
+            'LIMIT :limit'.format(', '.join(values)))
+        return [number for number, in db.session.execute(statement, params)]
+
+    def is_filter(self, arguments):
+        """True if the arguments contain an option or a tag"""
+        return any(self.option_regex.match(arg) or self.tag_regex.match(arg)
+                   for arg in arguments)
+
+    def is_numbers(self, arg):
+        """True if the argument is a list of numbers and ranges, `3,10-12`"""
+        values = [value for value in arg.split(',') if value]
+        return bool(values) and all(
+            self.NUMBER_REGEX.match(value.strip()) for value in values)
+
+    def tasks_by_arguments(self, arguments):
+        """
+        Returns the tasks given by numbers and ranges (`3 10-250,300`) or by
+        a filter (`pro:release +bug`)
+
+        Numbers are checked with a single SELECT counting their tasks, the
+        missing ones are only looked for, with a second one, when the count
+        falls short.
+
+        :returns: tuple of a task query and the sorted list of the first
+                  :attr:`MAX_MISSING` missing task numbers
+        :raises TaskServiceParseException: on invalid arguments, or numbers
+            mixed with a filter
+        """
+        if self.is_filter(arguments):
+            if any(self.is_numbers(arg) for arg in arguments):
+                raise TaskServiceParseException(
+                    "Task numbers can't be mixed with a filter")
+            return self.filter_by_arguments(arguments), []
+
+        clause, ranges = self.parse_numbers(arguments)
+        if not ranges:
+            raise TaskServiceParseException("No tasks ids defined")
+        query = Task.query.filter(clause)
+        found = query.with_entities(sql.func.count(Task.number)).scalar()
+        if found == sum(end - start + 1 for start, end in ranges):
+            return query, []
+        return query, self.missing_numbers(ranges)
+
+    def done(self, arguments, now=None):
+        """
+        Completes pending tasks given by numbers and ranges (`3 10-250,300`)
+        or by a filter (`pro:release +bug`)
+
+        Tasks are completed with a single UPDATE. Nothing is completed if any
+        number is missing.
+
+        :returns: tuple of the number of completed tasks and the sorted list
+                  of missing task numbers
+        :raises TaskServiceParseException: on invalid arguments
+        """
+        query, missing = self.tasks_by_arguments(arguments)
+        if missing:
+            return 0, missing
+
+        if now is None:
+            now = self.now
+        count = query.filter(Task.completed == None).update(  # noqa
+            {Task.completed: now, Task.updated: datetime.utcnow(),
+             Task.revision: current_epoch()},
+            synchronize_session=False)
+        db.session.commit()
+        return count, []
+
+    def parse_changes(self, changes):
+        """
+        Parses the changes of :meth:`modify`
+
+        :returns: tuple of the column values, the tags to add and the names
+                  of the tags to remove
+        :raises TaskServiceParseException: on invalid changes, such as words
+            which are not options or tags
+        """
+        for change in changes:
+            if not (self.option_regex.match(change) or
+                    self.tag_regex.match(change)):
+                raise TaskServiceParseException(
+                    "Invalid change: {}, the description is changed with "
+                    "desc:".format(change))
+        options = self.parse_arguments(changes, with_clauses=True)
+        removed = []
+        for clause in options.pop('clauses'):
+            if clause.name != 'tags':
+                raise TaskServiceParseException(
+                    "Virtual tag {} can't be changed".format(clause.value))
+            removed.append(clause.value)
+        for name in removed:
+            if name.startswith('~') or name.endswith('*'):
+                raise TaskServiceParseException(
+                    "Invalid tag: {}".format(name))
+        added = []
+        if 'tags' in options:
+            added = self.get_or_create_tags(options.pop('tags'))
+        if not (options or added or removed):
+            raise TaskServiceParseException("No changes defined")
+
+        # a new project needs its id before the bulk statements
+        project = options.pop('project', False)
+        if project:
+            db.session.add(project)
+            db.session.flush()
+        if project is not False:
+            options['project_id'] = project.id if project else None
+        return options, added, removed
+
+    def create_selection(self):
+        """
+        Creates the `task_selection` temporary table of the session's
+        connection if it is missing
+
+        pysqlite commits the open transaction before a CREATE, so this runs
+        before the writes a rollback has to undo.
+        """
+        db.session.connection().execute(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS "
+            "task_selection (id BLOB PRIMARY KEY)")
+
+    def select_tasks(self, query):
+        """
+        Stores the ids of the tasks of `query` in the `task_selection`
+        temporary table, see :meth:`create_selection`
+
+        :returns: number of selected tasks
+        """
+        connection = db.session.connection()
+        connection.execute(task_selection.delete())
+        result = connection.execute(task_selection.insert().from_select(
+            ['id'], query.with_entities(Task.id).statement))
+        return result.rowcount
+
+    def modify(self, arguments, changes, dry_run=False, report=None):
+        """
+        Modifies tasks given by numbers and ranges or by a filter
+
+        Changes are options setting columns (an empty value clears it, e.g.
+        `due:`, `desc:` replaces the description), `+tag` adding and `-tag`
+        removing a tag. Matching tasks are
+        selected once and each change is a single statement over the
+        selection: one UPDATE of the columns, one DELETE per removed tag and
+        one INSERT ... SELECT per added tag. Nothing is modified if any
+        number is missing.
+
+        :param dry_run: run the statements and roll them back
+        :param report: dictionary receiving the number of rows affected by
+                       each tag change, keyed by `+tag` and `-tag`
+        :returns: tuple of the number of modified tasks and the sorted list
+                  of missing task numbers
+        :raises TaskServiceParseException: on invalid arguments or changes
+        """
+        if not arguments:
+            raise TaskServiceParseException("No tasks filter defined")
+        self.create_selection()
+        query, missing = self.tasks_by_arguments(arguments)
+        if missing:
+            return 0, missing
+
+        count = self.select_tasks(query)
+        values, added, removed = self.parse_changes(changes)
+        if report is None:
+            report = {}
+        if count:
+            connection = db.session.connection()
+            selected = sql.select([task_selection.c.id])
+            values['updated'] = datetime.utcnow()
+            values['revision'] = current_epoch()
+            table = Task.__table__
+            connection.execute(
+                table.update().where(table.c.id.in_(selected)).values(values))
+            for name in removed:
+                tag_ids = sql.select([Tag.id]).where(Tag.name == name)
+                result = connection.execute(tasks_tags.delete().where(and_(
+                    tasks_tags.c.task_id.in_(selected),
+                    tasks_tags.c.tag_id.in_(tag_ids))))
+                report[u'-' + name] = result.rowcount
+            for tag in added:
+                tag_id = sql.literal(tag.id, type_=tasks_tags.c.tag_id.type)
+                tagged = sql.select([tasks_tags.c.task_id]).where(
+                    tasks_tags.c.tag_id == tag_id)
+                result = connection.execute(tasks_tags.insert().from_select(
+                    ['task_id', 'tag_id'],
+                    sql.select([task_selection.c.id, tag_id]).where(
+                        task_selection.c.id.notin_(tagged))))
+                report[u'+' + tag.name] = result.rowcount
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+        return count, []
+
+    def explain(self, query):
+        """
+        Returns SQLite's query plan for a query
+
+        Useful to check which indexes a filter from
+        :meth:`filter_by_arguments` ends up using.
+
+        :returns: list of plan detail strings
+        """
+        compiled = query.statement.compile(
+            dialect=sqlite.dialect(paramstyle='named'))
+        statement = sql.text('EXPLAIN QUERY PLAN ' + compiled.string)
+        statement = statement.bindparams(*[
+            sql.bindparam(name, value, type_=compiled.binds[name].type)
+            for name, value in compiled.params.items()])
+        return [row['detail'] for row in db.session.execute(statement)]
 
 
 class TaskServiceException(BaseServiceException):
@@ -0,0 +1,313 @@
+import csv
+import json
+import uuid
+from datetime import datetime
+from sqlalchemy import sql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, subqueryload
+from .base import BaseService, BaseServiceException
+from .task import TaskService, TaskServiceParseException
+from chez.tache.models import db, Task, Project, Tag
+from chez.tache.models.task import tasks_tags, reserve_task_numbers
+
+
+class ImportService(BaseService):
+    """
+    Bulk loads tasks from JSON lines or CSV
+
+    Rows are inserted in batches with executemany, one transaction per
+    batch. Projects and tags are resolved through in-memory caches which are
+    kept for the whole import.
+    """
+
+    DATE_FIELDS = ('due', 'waituntil', 'completed')
+    TIMESTAMP_FIELDS = ('created', 'updated')
+
+    def __init__(self, batch_size=1000, task_service=None):
+        self.batch_size = batch_size
+        self.ts = task_service or TaskService()
+        self.projects = {}
+        self.tags = {}
+
+    def read_jsonl(self, stream):
+        """
+        Yields the non-empty lines of JSON, decoded by :meth:`import_rows`
+        so a malformed line is reported as an invalid row
+        """
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield line
+
+    def decode_line(self, line):
+        """
+        Decodes a line of JSON into a dictionary
+
+        :raises ValueError: if the line is not a JSON object
+        """
+        row = json.loads(line.decode('utf-8'))
+        if not isinstance(row, dict):
+            raise ValueError("Not a JSON object")
+        return row
+
+    def read_csv(self, stream):
+        """Yields a dictionary per CSV row, the first row being the header"""
+        for row in csv.DictReader(stream):
+            yield dict((key, value.decode('utf-8'))
+                       for key, value in row.items() if value)
+
+    def parse_tags(self, value):
+        """Tags are a list or a string separated by spaces or commas"""
+        if not value:
+            return []
+        if isinstance(value, basestring):  # noqa
+            value = value.replace(',', ' ').split()
+        return sorted(set(tag.strip().lower() for tag in value))
+
+    def parse_row(self, row):
+        """
+        Converts an input row into column values
+
+        :returns: tuple of column values, project name and tag names
+        :raises TaskServiceParseException: on invalid values
+        """
+        description = (row.get('description') or u'').strip()
+        if not description:
+            raise TaskServiceParseException("Invalid task description")
+
+        values = {
+            'id': uuid.UUID(row['id']) if row.get('id') else uuid.uuid4(),
+            'description': description,
+        }
+        values.update(self.ts.parse_priority_option(
+            {}, 'priority', row.get('priority')))
+        for name in self.DATE_FIELDS:
+            values[name] = (self.ts.parse_date(row[name])
+                            if row.get(name) else None)
+        for name in self.TIMESTAMP_FIELDS:
+            if row.get(name):
+                values[name] = self.ts.parse_date(row[name]).to('utc').naive
+        project = (row.get('project') or u'').strip().lower() or None
+        return values, project, self.parse_tags(row.get('tags'))
+
+    def resolve_projects(self, connection, names):
+        """Fills the project cache, creating missing projects"""
+        names = set(names) - set(self.projects)
+        if not names:
+            return
+        table = Project.__table__
+        existing = connection.execute(
+            sql.select([table.c.id, table.c.name])
+            .where(table.c.name.in_(names)))
+        for id, name in existing:
+            self.projects.setdefault(name, id)
+
+        missing = [{'id': uuid.uuid4(), 'name': name}
+                   for name in names if name not in self.projects]
+        if missing:
+            connection.execute(table.insert(), missing)
+            self.projects.update((row['name'], row['id']) for row in missing)
+
+    def resolve_tags(self, connection, names):
+        """Fills the tag cache, creating missing tags"""
+        names = set(names) - set(self.tags)
+        if not names:
+            return
+        table = Tag.__table__
+        existing = connection.execute(
+            sql.select([table.c.id, table.c.name])
+            .where(table.c.name.in_(names)))
+        self.tags.update((name, id) for id, name in existing)
+
+        missing = [{'id': uuid.uuid4(), 'name': name}
+                   for name in names if name not in self.tags]
+        if missing:
+            connection.execute(table.insert(), missing)
+            self.tags.update((row['name'], row['id']) for row in missing)
+
+    def insert_batch(self, batch):
+        """
+        Inserts a batch of parsed rows and commits
+
+        :param batch: list of tuples returned by :meth:`parse_row`
+        """
+        connection = db.session.connection()
+        self.resolve_projects(
+            connection, [project for _, project, _ in batch if project])
+        self.resolve_tags(
+            connection, [tag for _, _, tags in batch for tag in tags])
+
+        # executemany needs the same keys on every row, so timestamps are set
+        # here rather than left to the column defaults
+        now = datetime.utcnow()
+        number = reserve_task_numbers(connection, len(batch))
+        tasks = []
+        links = []
+        for number, (values, project, tags) in enumerate(batch, number):
+            values['number'] = number
+            values['project_id'] = self.projects[project] if project else None
+            values.setdefault('created', now)
+            values.setdefault('updated', values['created'])
+            tasks.append(values)
+            links.extend({'task_id': values['id'], 'tag_id': self.tags[tag]}
+                         for tag in tags)
+
+        connection.execute(Task.__table__.insert(), tasks)
+        if links:
+            connection.execute(tasks_tags.insert(), links)
+        db.session.commit()
+
+    def import_rows(self, rows, progress=None):
+        """
+        Imports rows of task values
+
+        :param rows: iterable of dictionaries, or of lines of JSON from
+                     :meth:`read_jsonl`
+        :param progress: called with the number of imported rows after each
+                         batch
+        :returns: number of imported rows
+        :raises ImportServiceException: on an invalid row or a task id
+            already in the database, rows of previous batches stay imported
+        """
+        count = 0
+        batch = []
+        for line, row in enumerate(rows, 1):
+            try:
+                if not isinstance(row, dict):
+                    row = self.decode_line(row)
+                batch.append(self.parse_row(row))
+            except (TaskServiceParseException, ValueError) as ex:
+                db.session.rollback()
+                raise ImportServiceException(
+                    "Row {}: {}".format(line, ex))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch, count + 1)
+                count += len(batch)
+                batch = []
+                if progress:
+                    progress(count)
+        if batch:
+            self.import_batch(batch, count + 1)
+            count += len(batch)
+            if progress:
+                progress(count)
+        return count
+
+    def import_batch(self, batch, first):
+        """
+        Inserts a batch with :meth:`insert_batch`, `first` being the number
+        of its first row
+
+        :raises ImportServiceException: if the batch breaks a constraint,
+            e.g. when importing a dump of tasks already in the database
+        """
+        try:
+            self.insert_batch(batch)
+        except IntegrityError as ex:
+            db.session.rollback()
+            # the projects and tags created by the batch are gone as well
+            self.projects.clear()
+            self.tags.clear()
+            raise ImportServiceException("Rows {}-{}: {}".format(
+                first, first + len(batch) - 1, ex.orig))
+
+
+class ExportService(BaseService):
+    """
+    Streams tasks out as JSON lines or CSV
+
+    Tasks are read in keyset batches ordered by number with their project
+    and tags eager loaded, and the tasks of each batch are expunged from the
+    session before the next one is read, so memory does not grow with the
+    number of tasks. Objects the session held before are left alone.
+    """
+
+    FIELDS = ('id', 'number', 'description', 'project', 'priority', 'due',
+              'waituntil', 'completed', 'tags', 'created', 'updated')
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def iter_tasks(self, query):
+        """
+        Yields the tasks of `query` batch by batch
+
+        :param query: task query, e.g. from
+                      :meth:`TaskService.filter_by_arguments`
+        """
+        query = query.options(joinedload(Task.project),
+                              subqueryload(Task.tags_rel))
+        last = None
+        while True:
+            batch = query.order_by(Task.number)
+            if last is not None:
+                batch = batch.filter(Task.number > last)
+            tasks = batch.limit(self.batch_size).all()
+            if not tasks:
+                return
+            for task in tasks:
+                yield task
+            last = tasks[-1].number
+            for task in tasks:
+                query.session.expunge(task)
+
+    def to_row(self, task):
+        """Converts a task into a dictionary of plain values"""
+        def isoformat(value):
+            return value.isoformat() if value is not None else None
+
+        return {
+            'id': str(task.id),
+            'number': task.number,
+            'description': task.description,
+            'project': task.project.name if task.project else None,
+            'priority': task.priority.code if task.priority else None,
+            'due': isoformat(task.due),
+            'waituntil': isoformat(task.waituntil),
+            'completed': isoformat(task.completed),
+            'tags': sorted(tag.name for tag in task.tags_rel),
+            'created': isoformat(task.created),
+            'updated': isoformat(task.updated),
+        }
+
+    def write_jsonl(self, rows, stream):
+        """Writes a line of JSON per row"""
+        for row in rows:
+            stream.write(json.dumps(row, sort_keys=True).encode('utf-8'))
+            stream.write(b'\n')
+
+    def write_csv(self, rows, stream):
+        """Writes a header and a CSV line per row, tags space separated"""
+        writer = csv.writer(stream)
+        writer.writerow(self.FIELDS)
+        for row in rows:
+            row['tags'] = u' '.join(row['tags'])
+            writer.writerow([
+                u'' if row[field] is None else
+                unicode(row[field]).encode('utf-8')  # noqa
+                for field in self.FIELDS])
+
+    def export(self, query, stream, fmt='jsonl'):
+        """
+        Writes the tasks of `query` to `stream`
+
+        :param query: task query or list of queries, e.g. from
+                      :meth:`ArchiveService.queries`
+        :param fmt: `'jsonl'` or `'csv'`
+        :returns: number of exported tasks
+        """
+        counter = {'count': 0}
+        queries = query if isinstance(query, list) else [query]
+
+        def rows():
+            for query in queries:
+                for task in self.iter_tasks(query):
+                    counter['count'] += 1
+                    yield self.to_row(task)
+
+        getattr(self, 'write_' + fmt)(rows(), stream)
+        return counter['count']
+
+
+class ImportServiceException(BaseServiceException):
+    pass
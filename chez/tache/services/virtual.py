@@ -0,0 +1,146 @@
+import threading
+from sqlalchemy import and_, sql
+from chez.tache.models import Task
+
+APP_EXTENSION = 'chez.tache.virtual_tags'
+
+
+def span_clause(column, name):
+    """
+    Creates a clause matching the range between the `<name>_start` and
+    `<name>_end` time parameters
+    """
+    return and_(column >= sql.bindparam(name + '_start'),
+                column <= sql.bindparam(name + '_end'))
+
+
+def time_params(now):
+    """Values of the time parameters used by virtual tags"""
+    params = {'now': now}
+    spans = (
+        ('yesterday', now.replace(days=-1).span('day')),
+        ('today', now.span('day')),
+        ('tomorrow', now.replace(days=1).span('day')),
+        ('week', now.span('week')),
+        ('month', now.span('month')),
+    )
+    for name, (start, end) in spans:
+        params[name + '_start'] = start
+        params[name + '_end'] = end
+    return params
+
+
+#: Built in virtual tags. Each one compiles to a comparison on an indexed
+#: column with times left as bound parameters.
+BUILTIN_TAGS = {
+    'TODAY': lambda: span_clause(Task.due, 'today'),
+    'YESTERDAY': lambda: span_clause(Task.due, 'yesterday'),
+    'TOMORROW': lambda: span_clause(Task.due, 'tomorrow'),
+    'WEEK': lambda: span_clause(Task.due, 'week'),
+    'MONTH': lambda: span_clause(Task.due, 'month'),
+    'OVERDUE': lambda: and_(Task.due <= sql.bindparam('now'),
+                            Task.completed == None),  # noqa
+    'NODUE': lambda: Task.due == None,  # noqa
+    'WAITING': lambda: and_(Task.waituntil > sql.bindparam('now'),
+                            Task.completed == None),  # noqa
+    'PENDING': lambda: Task.completed == None,  # noqa
+    'COMPLETED': lambda: Task.completed != None,  # noqa
+}
+
+
+class VirtualTagRegistry(object):
+    """
+    Virtual tags such as `+OVERDUE`, by upper case name
+
+    Built in tags, :data:`BUILTIN_TAGS`, are matched in any case, e.g.
+    `+today`, and can't be used as plain tags. Tags registered from the
+    `VIRTUAL_TAGS` config are only matched in upper case, so their lower
+    case names stay plain tags.
+
+    Clauses are only built the first time a tag is used and then kept.
+    Tags defined as filter arguments holding absolute dates are built again
+    every time.
+    """
+
+    def __init__(self):
+        self.factories = {}
+        self.clauses = {}
+        self.building = set()
+        self.lock = threading.RLock()
+        for name, factory in BUILTIN_TAGS.items():
+            self.register(name, factory)
+
+    def __contains__(self, name):
+        return name in self.factories or name.upper() in BUILTIN_TAGS
+
+    def register(self, name, factory):
+        """
+        Registers a virtual tag
+
+        :param factory: callable returning the tag's clause
+        """
+        self.add(name, lambda service: (factory(), False))
+
+    def register_filter(self, name, arguments):
+        """
+        Registers a virtual tag matching filter arguments
+
+        :param arguments: list or string of filter arguments, e.g.
+                          `'pri:h +OVERDUE'`
+        """
+        if isinstance(arguments, basestring):  # noqa
+            arguments = arguments.split()
+
+        def factory(service):
+            entry = service.parse_filter(arguments)
+            criterion = entry.criterion
+            if criterion is None:
+                criterion = sql.true()
+            return criterion, entry.day is not None
+        self.add(name, factory)
+
+    def add(self, name, factory):
+        """
+        Registers a factory taking the task service and returning a tuple
+        of the clause and whether it holds absolute dates
+        """
+        with self.lock:
+            self.factories[name.upper()] = factory
+            self.clauses.clear()
+
+    def get(self, name, service):
+        """
+        Returns the clause of a virtual tag
+
+        :param service: task service used to parse filter tags
+        :returns: tuple of the clause and whether it holds absolute dates
+        :raises KeyError: if the tag does not exist
+        """
+        name = name.upper()
+        with self.lock:
+            if name in self.clauses:
+                return self.clauses[name], False
+
+            if name in self.building:
+                from .task import TaskServiceParseException
+                raise TaskServiceParseException(
+                    "Virtual tag {} refers to itself".format(name))
+            self.building.add(name)
+            try:
+                clause, dated = self.factories[name](service)
+            finally:
+                self.building.discard(name)
+            if not dated:
+                self.clauses[name] = clause
+            return clause, dated
+
+
+def get_virtual_tags(app):
+    """Returns the virtual tag registry of an app, with its config tags"""
+    registry = app.extensions.get(APP_EXTENSION)
+    if registry is None:
+        registry = VirtualTagRegistry()
+        for name, arguments in app.config.get('VIRTUAL_TAGS', {}).items():
+            registry.register_filter(name, arguments)
+        app.extensions[APP_EXTENSION] = registry
+    return registry
@@ -0,0 +1,88 @@
+"""
+SQLite storage profiles
+
+A profile is a set of pragmas run on every new connection of the main and
+archive databases, picked with the `STORAGE_PROFILE` setting and adjusted
+with `STORAGE_PRAGMAS`. The default, `rollback`, keeps SQLite's durability:
+`wal` trades the last commits before a power loss for faster writes and
+readers not blocked by writers. Connections are pooled when
+`SQLALCHEMY_POOL_SIZE` is set, otherwise every session opens its own.
+"""
+from collections import OrderedDict
+from sqlalchemy import event
+from .models import db
+
+#: busy handler timeout in milliseconds, as pysqlite's default
+BUSY_TIMEOUT = 5000
+
+#: readers see the last commit while a writer appends to the write-ahead
+#: log, which is only synced at checkpoints: a power loss may drop the last
+#: commits but never corrupts the database
+WAL_PRAGMAS = OrderedDict([
+    ('busy_timeout', BUSY_TIMEOUT),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),
+    ('mmap_size', 64 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+])
+
+PROFILES = {
+    # SQLite's defaults: writers block readers and every commit syncs
+    'rollback': OrderedDict([
+        ('busy_timeout', BUSY_TIMEOUT),
+        ('journal_mode', 'DELETE'),
+        ('synchronous', 'FULL'),
+    ]),
+    'wal': WAL_PRAGMAS,
+    # write-ahead log synced on every commit
+    'durable': OrderedDict(WAL_PRAGMAS, synchronous='FULL'),
+}
+
+
+class StorageProfileError(ValueError):
+    pass
+
+
+def profile_pragmas(config):
+    """
+    Pragmas of the `STORAGE_PROFILE` of `config`, updated with its
+    `STORAGE_PRAGMAS`
+
+    :raises StorageProfileError: on an unknown profile
+    """
+    name = config['STORAGE_PROFILE']
+    if name not in PROFILES:
+        raise StorageProfileError(
+            "Unknown storage profile: {}, expected one of {}".format(
+                name, ', '.join(sorted(PROFILES))))
+    pragmas = OrderedDict(PROFILES[name])
+    pragmas.update(config['STORAGE_PRAGMAS'])
+    return pragmas
+
+
+def apply_pragmas(connection, pragmas):
+    """
+    Runs `pragmas` on a DB-API connection, the busy timeout last so the
+    others wait for locks as long as pysqlite's timeout
+    """
+    cursor = connection.cursor()
+    try:
+        for name, value in sorted(pragmas.items(),
+                                  key=lambda item: item[0] == 'busy_timeout'):
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+    finally:
+        cursor.close()
+
+
+def init_app(app):
+    """Applies the storage profile of `app` to its engines' connections"""
+    pragmas = profile_pragmas(app.config)
+
+    def connect(connection, record):
+        apply_pragmas(connection, pragmas)
+
+    for bind in [None] + list(app.config['SQLALCHEMY_BINDS'] or ()):
+        engine = db.get_engine(app, bind=bind)
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', connect)
@@ -13,7 +13,7 @@ setup(
     platforms='any',
     entry_points={
         'console_scripts': [
-            'ct = chez.tache.commands:cli',
+            'ct = chez.tache.client:main',
         ]
     },
 )
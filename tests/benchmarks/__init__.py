@@ -0,0 +1,11 @@
+import time
+
+
+def best_of(func, repeat=5):
+    """Return the fastest of `repeat` timings of `func` in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
@@ -0,0 +1,64 @@
+"""
+Compares two results files of :mod:`tests.benchmarks.suite`
+
+    python -m tests.benchmarks.compare base.json results.json --threshold 1.2
+
+Exits with status 1 if a measurement got slower than `threshold` times its
+base or matched a different number of rows.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as stream:
+        data = json.load(stream)
+    return data, dict(((result['size'], result['group'], result['name']),
+                       result) for result in data['results'])
+
+
+def compare(base, current, threshold=1.2):
+    """
+    :returns: tuple of report lines and whether a measurement regressed
+    """
+    lines = []
+    regressed = False
+    for key in sorted(set(base) & set(current)):
+        old, new = base[key], current[key]
+        ratio = new['ms'] / old['ms'] if old['ms'] else float('inf')
+        flags = []
+        if ratio > threshold:
+            flags.append('SLOWER')
+        if old['rows'] != new['rows']:
+            flags.append('ROWS {} -> {}'.format(old['rows'], new['rows']))
+        regressed = regressed or bool(flags)
+        lines.append('{:>5} {:<8} {:<28} {:10.2f} {:10.2f} {:6.2f}x {}'.format(
+            key[0], key[1], key[2], old['ms'], new['ms'], ratio,
+            ' '.join(flags)).rstrip())
+    for key in sorted(set(base) ^ set(current)):
+        lines.append('{:>5} {:<8} {:<28} only in {}'.format(
+            key[0], key[1], key[2], 'base' if key in base else 'results'))
+    return lines, regressed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Compare two benchmark results files")
+    parser.add_argument('base')
+    parser.add_argument('results')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="slowdown ratio reported as a regression")
+    options = parser.parse_args(args)
+
+    base_data, base = load(options.base)
+    data, current = load(options.results)
+    lines, regressed = compare(base, current, options.threshold)
+    sys.stdout.write('{} -> {}\n'.format(base_data.get('commit'),
+                                         data.get('commit')))
+    sys.stdout.write('\n'.join(lines) + '\n')
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
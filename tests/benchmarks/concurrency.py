@@ -0,0 +1,188 @@
+"""
+Concurrency benchmark of the storage profiles, results as JSON
+
+    python -m tests.benchmarks.concurrency --writers 4 --readers 4
+
+For each profile, `--writers` processes add tasks and `--readers` processes
+list the pending tasks of one database for `--seconds`. Every process
+counts its operations and the ones failing with `database is locked`,
+reported as throughput and lock error rates per role.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from sqlalchemy.exc import OperationalError
+from chez.tache.factory import create_app
+from chez.tache.models import db, Task
+from chez.tache.services import ImportService, TaskService
+from chez.tache.storage import PROFILES
+from .dataset import generate_rows
+
+
+def profile_config(path, profile, pragmas=None, pool_size=None):
+    class ConcurrencyConfig(object):
+        ROOT_DIRECTORY = os.path.dirname(path)
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(path)
+        SQLALCHEMY_BINDS = {'archive': 'sqlite:///{}'.format(
+            os.path.join(ROOT_DIRECTORY, 'archive.sqlite'))}
+        SQLALCHEMY_POOL_SIZE = pool_size
+        STORAGE_PROFILE = profile
+        STORAGE_PRAGMAS = pragmas or {}
+    return ConcurrencyConfig
+
+
+def write(ts, index):
+    ts.create(description=u'concurrent task {}'.format(index))
+
+
+def read(ts, index):
+    # the added tasks have no project, reads cost the same during the run
+    query = ts.pending(ts.filter_by_arguments([u'pro:project1']))
+    ts.list_rows(query.order_by(Task.number))
+
+
+def worker(config, role, start, seconds, results):
+    """Runs `role` operations from `start` until `seconds` later"""
+    operation = write if role == 'writer' else read
+    operations = errors = 0
+    try:
+        app = create_app(config=config)
+        with app.app_context():
+            while time.time() < start:
+                time.sleep(0.001)
+            while time.time() < start + seconds:
+                try:
+                    operation(TaskService(), operations)
+                    operations += 1
+                except OperationalError as ex:
+                    if 'locked' not in str(ex):
+                        raise
+                    errors += 1
+                finally:
+                    db.session.remove()
+    finally:
+        results.put((role, operations, errors))
+
+
+def run_profile(data, profile, writers, readers, seconds, rows,
+                pragmas=None, pool_size=None):
+    """
+    Runs the writers and readers against a fresh database of `rows` tasks
+
+    :param pragmas: pragmas overriding the profile's
+    :param pool_size: connections pooled by each process, None for none
+
+    :returns: dictionary of the operations per second and lock error rate of
+              each role
+    """
+    path = os.path.join(data, 'concurrency-{}.sqlite'.format(profile))
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    config = profile_config(path, profile, pragmas, pool_size)
+    app = create_app(config=config)
+    with app.app_context():
+        ImportService(batch_size=5000).import_rows(generate_rows(rows))
+        db.session.remove()
+    db.get_engine(app).dispose()
+
+    results = multiprocessing.Queue()
+    # time for every process to create its app before the run
+    start = time.time() + 2
+    processes = [
+        multiprocessing.Process(target=worker, args=(
+            config, role, start, seconds, results))
+        for role in ['writer'] * writers + ['reader'] * readers]
+    for process in processes:
+        process.start()
+    totals = {}
+    for _ in processes:
+        role, operations, errors = results.get()
+        total = totals.setdefault(role, [0, 0])
+        total[0] += operations
+        total[1] += errors
+    for process in processes:
+        process.join()
+
+    measured = {'profile': profile, 'writers': writers, 'readers': readers,
+                'pragmas': pragmas or {}, 'pool_size': pool_size}
+    for role, (operations, errors) in totals.items():
+        measured[role + 's_per_sec'] = round(operations / float(seconds), 1)
+        measured[role + '_lock_errors'] = round(
+            errors / float(operations + errors or 1), 4)
+    return measured
+
+
+def run(profiles, writers=4, readers=4, seconds=5, rows=1000, data=None,
+        pragmas=None, pool_size=None):
+    """
+    Runs the benchmark for each profile
+
+    :returns: list of dictionaries, see :func:`run_profile`
+    """
+    remove = data is None
+    data = data or tempfile.mkdtemp()
+    results = []
+    try:
+        for profile in profiles:
+            result = run_profile(data, profile, writers, readers, seconds,
+                                 rows, pragmas, pool_size)
+            sys.stderr.write(
+                '{profile:<9} writes/s {writers_per_sec:>8} '
+                'errors {writer_lock_errors:>7.2%}  reads/s '
+                '{readers_per_sec:>8} errors {reader_lock_errors:>7.2%}\n'
+                .format(**dict({'writers_per_sec': 0, 'readers_per_sec': 0,
+                                'writer_lock_errors': 0,
+                                'reader_lock_errors': 0}, **result)))
+            results.append(result)
+    finally:
+        if remove:
+            shutil.rmtree(data)
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run the storage profiles concurrency benchmark")
+    parser.add_argument('--profiles', default=','.join(sorted(PROFILES)),
+                        help="comma separated storage profiles")
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=1000,
+                        help="tasks in the database before the run")
+    parser.add_argument('--busy-timeout', type=int,
+                        help="busy timeout in milliseconds, 0 to count "
+                        "every lock conflict as an error")
+    parser.add_argument('--pool-size', type=int,
+                        help="connections pooled by each process")
+    parser.add_argument('--output', default='-',
+                        help="JSON results file, - for stdout")
+    options = parser.parse_args(args)
+
+    profiles = options.profiles.split(',')
+    for profile in profiles:
+        if profile not in PROFILES:
+            parser.error("Unknown profile: {}".format(profile))
+
+    pragmas = {}
+    if options.busy_timeout is not None:
+        pragmas['busy_timeout'] = options.busy_timeout
+    results = run(profiles, options.writers, options.readers,
+                  options.seconds, options.rows, pragmas=pragmas,
+                  pool_size=options.pool_size)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output == '-':
+        sys.stdout.write(output + '\n')
+    else:
+        with open(options.output, 'w') as stream:
+            stream.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
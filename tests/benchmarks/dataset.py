@@ -0,0 +1,52 @@
+import random
+from datetime import datetime, timedelta
+
+#: dataset sizes of the benchmark suite
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+#: time generated datasets are relative to, so their contents do not
+#: depend on when they are generated
+NOW = datetime(2026, 1, 15, 12)
+
+
+def generate_rows(count, seed=0, projects=20, tags=50, completed=0.8,
+                  now=NOW):
+    """
+    Yields deterministic task rows as accepted by ImportService
+
+    Descriptions, projects and tags are drawn from skewed distributions so
+    a few values are common and most are rare, like a real task list. Tasks
+    are created over the year before `now` and most due dates fall within
+    a few weeks of creation, so old pending tasks are overdue and recent
+    ones due soon.
+    """
+    rng = random.Random(seed)
+    words = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf',
+             'hotel', 'india', 'juliet', 'kilo', 'lima', 'mike', 'november',
+             'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango']
+    start = now - timedelta(days=365)
+    step = timedelta(days=365) // max(count, 1)
+    for i in range(count):
+        row = {'description': u' '.join(rng.choice(words)
+                                        for _ in range(rng.randint(2, 6)))}
+        if rng.random() < 0.7:
+            row['project'] = u'project{}'.format(
+                int(rng.paretovariate(1.2)) % projects)
+        row['tags'] = sorted(set(
+            u'tag{}'.format(int(rng.paretovariate(1.0)) % tags)
+            for _ in range(rng.randint(0, 3))))
+        if rng.random() < 0.4:
+            row['priority'] = rng.choice(u'lmh')
+        created = start + step * i
+        row['created'] = created.isoformat()
+        if rng.random() < 0.5:
+            row['due'] = (created + timedelta(
+                days=int(rng.expovariate(1 / 14.0)))).strftime('%Y-%m-%d')
+        if rng.random() < 0.05:
+            row['waituntil'] = (created + timedelta(
+                days=rng.randint(1, 60))).strftime('%Y-%m-%d')
+        if rng.random() < completed:
+            done = created + timedelta(hours=rng.randint(1, 24 * 60))
+            if done < now:
+                row['completed'] = done.isoformat()
+        yield row
@@ -0,0 +1,258 @@
+"""
+Load test of the API servers, results as JSON
+
+    python -m tests.benchmarks.load --clients 16 --watchers 8
+
+For each server, `pooled` (`ct serve`) and `dev` (`ct runserver`), a fresh
+database is served by a child process while `--clients` threads send a mix
+of listings, task lookups and task creations for `--seconds`, and
+`--watchers` threads long poll `/api/changes`. Reports the request
+throughput, latency percentiles and errors, and the notifications received.
+"""
+import argparse
+import httplib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from chez.tache.factory import create_app
+from chez.tache.models import db
+from chez.tache.server import serve
+from chez.tache.services import ImportService
+from .concurrency import profile_config
+from .dataset import generate_rows
+
+SERVERS = ('pooled', 'dev')
+
+#: requests of each client, in turn
+MIX = (
+    ('GET', '/api/tasks?filter=pro:project1', None),
+    ('GET', '/api/tasks?filter=%2Btag2&limit=20', None),
+    ('GET', '/api/tasks/{index}', None),
+    ('GET', '/api/tasks?filter=pro:project3', None),
+    ('GET', '/api/projects', None),
+    ('GET', '/api/tasks?status=all&after={index}', None),
+    ('GET', '/api/tasks?filter=pri:h', None),
+    ('GET', '/api/tasks?filter=pro:project1', None),
+    ('GET', '/api/tasks/{index}', None),
+    ('POST', '/api/tasks', {'arguments': 'load test +load'}),
+)
+
+
+def free_port():
+    sock = socket.socket()
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def run_server(config, server, port, workers):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    if server == 'pooled':
+        app = create_app(config=config,
+                         settings={'SQLALCHEMY_POOL_SIZE': workers})
+        serve(app, port=port, workers=workers)
+    else:
+        create_app(config=config).run(port=port)
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def request(port, method, url, data=None, timeout=60):
+    connection = httplib.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request(method, url,
+                           json.dumps(data) if data is not None else None)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def client(port, index, stop, latencies, errors, mix=MIX):
+    """Sends the requests of `mix` in turn until `stop` is set"""
+    count = index
+    while not stop.is_set():
+        method, url, data = mix[count % len(mix)]
+        start = time.time()
+        try:
+            status, _ = request(port, method, url.format(index=count % 500),
+                                data)
+        except (socket.error, httplib.HTTPException):
+            status = None
+        if status in (200, 201, 404):
+            latencies.append(time.time() - start)
+        else:
+            errors.append(status)
+        count += 1
+
+
+def watcher(port, stop, notifications, errors):
+    """Long polls the changes until `stop` is set"""
+    version = None
+    while not stop.is_set():
+        url = '/api/changes?timeout=1'
+        if version is not None:
+            url += '&version={}'.format(version)
+        try:
+            status, body = request(port, 'GET', url)
+        except (socket.error, httplib.HTTPException):
+            status = None
+        if status != 200:
+            errors.append(status)
+            continue
+        current = json.loads(body)['version']
+        if version is not None and current != version:
+            notifications.append(current)
+        version = current
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_server_load(data, server, clients, watchers, seconds, rows,
+                    workers, read_only=False):
+    """
+    Loads `server` serving a fresh database of `rows` tasks
+
+    :param read_only: leave out the task creations, so long polls wait for
+                      their whole timeout
+
+    :returns: dictionary of the requests per second, latency percentiles in
+              milliseconds, errors and notifications
+    """
+    path = os.path.join(data, 'load-{}.sqlite'.format(server))
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    config = profile_config(path, 'wal')
+    app = create_app(config=config)
+    with app.app_context():
+        ImportService(batch_size=5000).import_rows(generate_rows(rows))
+        db.session.remove()
+    db.get_engine(app).dispose()
+
+    port = free_port()
+    process = multiprocessing.Process(target=run_server, args=(
+        config, server, port, workers))
+    process.start()
+    latencies, errors, notifications = [], [], []
+    mix = [entry for entry in MIX if not read_only or entry[0] == 'GET']
+    try:
+        wait_for(port)
+        stop = threading.Event()
+        threads = [threading.Thread(target=client, args=(
+            port, index, stop, latencies, errors, mix))
+            for index in range(clients)]
+        threads += [threading.Thread(target=watcher, args=(
+            port, stop, notifications, errors))
+            for _ in range(watchers)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+    finally:
+        process.terminate()
+        process.join()
+
+    latencies.sort()
+    measured = {'server': server, 'clients': clients, 'watchers': watchers,
+                'read_only': read_only,
+                'workers': workers if server == 'pooled' else 1,
+                'requests': len(latencies), 'errors': len(errors),
+                'notifications': len(notifications),
+                'requests_per_sec': round(len(latencies) / elapsed, 1)}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        measured[name + '_ms'] = round(
+            percentile(latencies, fraction) * 1000, 1) if latencies else None
+    measured['max_ms'] = round(latencies[-1] * 1000, 1) \
+        if latencies else None
+    return measured
+
+
+def run(servers=SERVERS, clients=16, watchers=0, seconds=5, rows=1000,
+        workers=8, read_only=False, data=None):
+    """
+    Runs the load test for each server
+
+    :returns: list of dictionaries, see :func:`run_server_load`
+    """
+    remove = data is None
+    data = data or tempfile.mkdtemp()
+    results = []
+    try:
+        for server in servers:
+            result = run_server_load(data, server, clients, watchers,
+                                     seconds, rows, workers, read_only)
+            sys.stderr.write(
+                '{server:<7} {requests_per_sec:>7} req/s  p50 {p50_ms} ms  '
+                'p90 {p90_ms} ms  p99 {p99_ms} ms  max {max_ms} ms  '
+                'errors {errors}  notifications {notifications}\n'
+                .format(**result))
+            results.append(result)
+    finally:
+        if remove:
+            shutil.rmtree(data)
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run the API servers load test")
+    parser.add_argument('--servers', default=','.join(SERVERS),
+                        help="comma separated servers")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--watchers', type=int, default=0,
+                        help="clients long polling the changes")
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=1000,
+                        help="tasks in the database before the run")
+    parser.add_argument('--workers', type=int, default=8,
+                        help="worker threads of the pooled server")
+    parser.add_argument('--read-only', action='store_true',
+                        help="only send listings and lookups")
+    parser.add_argument('--output', default='-',
+                        help="JSON results file, - for stdout")
+    options = parser.parse_args(args)
+
+    servers = options.servers.split(',')
+    for server in servers:
+        if server not in SERVERS:
+            parser.error("Unknown server: {}".format(server))
+
+    results = run(servers, options.clients, options.watchers,
+                  options.seconds, options.rows, options.workers,
+                  options.read_only)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output == '-':
+        sys.stdout.write(output + '\n')
+    else:
+        with open(options.output, 'w') as stream:
+            stream.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Benchmark suite over synthetic datasets, results as JSON
+
+    python -m tests.benchmarks.suite --sizes 1k,100k --output results.json
+    python -m tests.benchmarks.compare base.json results.json
+
+Each dataset is imported once into a SQLite file kept in `--data` and
+copied before every run, as `done` and `add` change it. Services are driven
+the way the commands drive them, with `now` fixed to the dataset's so the
+matching rows are the same on every run.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import arrow
+from chez.tache.factory import create_app
+from chez.tache.models import db, Task
+from chez.tache.services import ImportService, TaskService
+from .dataset import NOW, SIZES, generate_rows
+
+#: filters measured through the list path, by group
+FILTERS = (
+    ('list', [u'pro:project3']),
+    ('list', [u'+tag7']),
+    ('list', [u'pro:project1', u'+tag2', u'-tag3']),
+    ('list', [u'pri:h', u'pro:project1']),
+    ('virtual', [u'+OVERDUE']),
+    ('virtual', [u'+TODAY']),
+    ('virtual', [u'+WEEK']),
+    ('virtual', [u'+NODUE', u'pro:project2']),
+    ('virtual', [u'+MONTH', u'pri:h']),
+    ('search', [u'kilo']),
+    ('search', [u'"kilo tango"']),
+    ('search', [u'nov*', u'+tag1']),
+)
+
+
+def database_config(path):
+    class BenchmarkConfig(object):
+        ROOT_DIRECTORY = os.path.dirname(path)
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(path)
+    return BenchmarkConfig
+
+
+def median(timings):
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+def timed(func, repeat):
+    """Returns the median milliseconds of `repeat` calls and the last result"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        timings.append(time.time() - start)
+    return median(timings), result
+
+
+class Suite(object):
+    def __init__(self, data, repeat=5):
+        self.data = data
+        self.repeat = repeat
+        self.results = []
+
+    def record(self, size, group, name, ms, rows=None):
+        self.results.append({'size': size, 'group': group, 'name': name,
+                             'ms': round(ms, 3), 'rows': rows})
+        sys.stderr.write('{:>5} {:<8} {:<28} {:10.2f}ms {}\n'.format(
+            size, group, name, ms, '' if rows is None else rows))
+
+    def dataset(self, size):
+        """
+        Path of a working copy of the dataset, importing it first if needed
+        """
+        pristine = os.path.join(self.data, 'dataset-{}.sqlite'.format(size))
+        if not os.path.exists(pristine):
+            app = create_app(config=database_config(pristine))
+            with app.app_context():
+                start = time.time()
+                count = ImportService(batch_size=5000).import_rows(
+                    generate_rows(SIZES[size]))
+                self.record(size, 'import', 'import',
+                            (time.time() - start) * 1000, count)
+                db.session.remove()
+            db.get_engine(app).dispose()
+
+        working = os.path.join(self.data, 'working-{}.sqlite'.format(size))
+        shutil.copyfile(pristine, working)
+        return working
+
+    def run(self, size):
+        app = create_app(config=database_config(self.dataset(size)))
+        with app.app_context():
+            now = arrow.get(NOW).replace(tzinfo='local')
+            self.run_filters(size, now)
+            self.run_add(size, now)
+            self.run_done(size, now)
+
+    def run_filters(self, size, now):
+        for group, arguments in FILTERS:
+            def run():
+                ts = TaskService(now=now)
+                query = ts.filter_by_arguments(arguments)
+                query = ts.pending(query).order_by(Task.number)
+                return ts.list_rows(query)
+            TaskService.filter_cache.clear()
+            ms, rows = timed(run, self.repeat)
+            self.record(size, group, u' '.join(arguments), ms, len(rows))
+
+    def run_add(self, size, now):
+        arguments = u'benchmark task pro:project3 +tag1 +bench due:eow'
+        ms, _ = timed(lambda: TaskService(now=now).from_arguments(
+            arguments.split()), self.repeat * 10)
+        self.record(size, 'add', 'add', ms, 1)
+
+    def run_done(self, size, now, chunk=20):
+        """Completes the tasks of a filter, then ranges of `chunk` tasks"""
+        ms, count = timed(lambda: TaskService(now=now).done(
+            [u'pro:project2', u'+tag1'])[0], 1)
+        self.record(size, 'done', 'done pro:project2 +tag1', ms, count)
+
+        numbers = [number for number, in Task.query.filter(
+            Task.completed == None).order_by(  # noqa
+            Task.number).with_entities(Task.number).limit(chunk * self.repeat)]
+        ranges = iter(range(0, len(numbers), chunk))
+
+        def done_range():
+            first = next(ranges)
+            return TaskService(now=now).done([u'{}-{}'.format(
+                numbers[first], numbers[first + chunk - 1])])[0]
+        if len(numbers) == chunk * self.repeat:
+            ms, count = timed(done_range, self.repeat)
+            self.record(size, 'done', 'done range', ms, count)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=open(os.devnull, 'w')).strip().decode('ascii')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, data=None, repeat=5):
+    """
+    Runs the suite
+
+    :param sizes: names of :data:`SIZES`
+    :param data: directory keeping the imported datasets, a temporary one
+                 by default
+    :returns: dictionary of the environment and results
+    """
+    remove = data is None
+    data = data or tempfile.mkdtemp()
+    suite = Suite(data, repeat=repeat)
+    try:
+        for size in sizes:
+            suite.run(size)
+    finally:
+        if remove:
+            shutil.rmtree(data)
+
+    return {
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'results': suite.results,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument('--sizes', default='1k',
+                        help="comma separated sizes among {}".format(
+                            ', '.join(sorted(SIZES, key=SIZES.get))))
+    parser.add_argument('--data', help="directory keeping the datasets")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='-',
+                        help="JSON results file, - for stdout")
+    options = parser.parse_args(args)
+
+    sizes = options.sizes.split(',')
+    for size in sizes:
+        if size not in SIZES:
+            parser.error("Unknown size: {}".format(size))
+    if options.data and not os.path.exists(options.data):
+        os.makedirs(options.data)
+
+    results = run(sizes, options.data, options.repeat)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output == '-':
+        sys.stdout.write(output + '\n')
+    else:
+        with open(options.output, 'w') as stream:
+            stream.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
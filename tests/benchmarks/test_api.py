@@ -0,0 +1,34 @@
+import time
+import pytest
+from chez.tache.services import ImportService
+from .dataset import generate_rows
+
+pytestmark = pytest.mark.benchmark
+
+
+def requests_per_second(client, url, count=50, **kwargs):
+    start = time.time()
+    for _ in range(count):
+        response = client.get(url, **kwargs)
+        assert response.status_code in (200, 304)
+    return count / (time.time() - start)
+
+
+def test_api_listing(app, client):
+    """Listing requests/sec at 100k tasks, first and deep keyset pages"""
+    ImportService(batch_size=5000).import_rows(
+        generate_rows(100000, completed=0.5))
+
+    first = requests_per_second(client, '/api/tasks?status=all')
+    deep = requests_per_second(client, '/api/tasks?status=all&after=99000')
+    filtered = requests_per_second(
+        client, '/api/tasks?filter=pro:project1+%2Btag2&after=50000')
+    etag = client.get('/api/tasks?status=all').headers['ETag']
+    cached = requests_per_second(client, '/api/tasks?status=all',
+                                 headers={'If-None-Match': etag})
+
+    print('api at 100k tasks: first page {:.0f} req/s, page after 99000 '
+          '{:.0f} req/s, filtered {:.0f} req/s, not modified {:.0f} req/s'
+          .format(first, deep, filtered, cached))
+    assert deep > first / 2
+    assert cached > first
@@ -0,0 +1,17 @@
+import json
+import pytest
+from . import concurrency
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_concurrency(tmpdir):
+    results = concurrency.run(['rollback', 'wal'], writers=2, readers=2,
+                              seconds=1, rows=100, data=str(tmpdir))
+    assert json.loads(json.dumps(results)) == results
+    assert [result['profile'] for result in results] == ['rollback', 'wal']
+    for result in results:
+        assert result['writers_per_sec'] > 0
+        assert result['readers_per_sec'] > 0
+        assert 0 <= result['writer_lock_errors'] <= 1
+        assert 0 <= result['reader_lock_errors'] <= 1
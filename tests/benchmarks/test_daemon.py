@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from chez.tache import client
+from chez.tache.daemon import CommandServer, POOL_SIZE
+from chez.tache.factory import create_app
+from chez.tache.services import ImportService
+from .dataset import generate_rows
+
+pytestmark = pytest.mark.benchmark
+
+#: p50 in milliseconds of a command through the daemon
+TARGET = 10
+
+
+def p50(func, count):
+    timings = []
+    for _ in range(count):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return sorted(timings)[count // 2] * 1000
+
+
+def test_daemon_latency(file_config, tmpdir):
+    """p50 of `ct add` and `ct list` through the daemon and in process"""
+    app = create_app(config=file_config,
+                     settings={'SQLALCHEMY_POOL_SIZE': POOL_SIZE})
+    with app.app_context():
+        ImportService().import_rows(generate_rows(10000))
+
+    path = str(tmpdir.join('ct.sock'))
+    server = CommandServer(app, path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        add = p50(lambda: client.forward([b'add', b'benchmark', b'+bench'],
+                                         path), 200)
+        list_ = p50(lambda: client.forward([b'list', b'pro:project5'],
+                                           path), 200)
+
+        # whole processes, the in process one opens the same database
+        env = dict(os.environ, HOME=str(tmpdir),
+                   PYTHONPATH=os.pathsep.join(sys.path))
+        home = tmpdir.join('.config', 'chez')
+        home.ensure(dir=True)
+        tmpdir.join('db.tache.sqlite').copy(home.join('db.tache.sqlite'))
+        code = 'from chez.tache.client import main; main()'
+
+        def run(socket):
+            def run():
+                subprocess.check_call(
+                    [sys.executable, '-c', code, 'list', 'pro:project5'],
+                    env=dict(env, CT_SOCKET=socket), stdout=subprocess.PIPE)
+            return run
+
+        daemon = p50(run(path), 20)
+        local = p50(run(''), 20)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    print('daemon p50: add {:.2f}ms, list {:.2f}ms; process p50: ct list '
+          '{:.0f}ms through the daemon, {:.0f}ms in process'.format(
+              add, list_, daemon, local))
+    assert max(add, list_) < TARGET
+    assert daemon < local
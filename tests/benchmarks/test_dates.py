@@ -0,0 +1,54 @@
+import arrow
+import pytest
+from chez.tache.services import TaskService
+from . import best_of
+from .dataset import generate_rows
+
+pytestmark = pytest.mark.benchmark
+
+
+def legacy_parse_date(value):
+    """The parser TaskService used before DateParser, for reference"""
+    value = value.strip()
+    try:
+        return arrow.get(value)
+    except arrow.parser.ParserError:
+        pass
+
+    shortcuts = {
+        'today': arrow.now(),
+        'yesterday': arrow.now().replace(days=-1),
+        'tomorrow': arrow.now().replace(days=1),
+    }
+    if value.lower() in shortcuts:
+        return shortcuts[value.lower()]
+
+    weekday = value.lower()
+    now = arrow.now()
+    next_week = now.replace(days=8)
+    while now <= next_week:
+        if now.format('dddd').lower().startswith(weekday):
+            return now
+        now = now.replace(days=1)
+    raise ValueError(value)
+
+
+def test_parse_dates(app):
+    """Parsing the date fields of an import, old parser and DateParser"""
+    values = []
+    for i, row in enumerate(generate_rows(10000)):
+        values.extend(row[name] for name in ('due', 'created', 'completed')
+                      if name in row)
+        values.append(('tomorrow', 'fri', 'today', 'mo')[i % 4])
+
+    def parse(func):
+        def run():
+            for value in values:
+                func(value)
+        return run
+
+    legacy = best_of(parse(legacy_parse_date), repeat=3)
+    memoized = best_of(lambda: parse(TaskService().parse_date)(), repeat=3)
+    print('parse {} dates: legacy {:.3f}s, DateParser {:.3f}s'.format(
+        len(values), legacy, memoized))
+    assert memoized < legacy
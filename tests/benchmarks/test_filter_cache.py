@@ -0,0 +1,27 @@
+import pytest
+from chez.tache.services import TaskService
+from . import best_of
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_filter_cache(app):
+    """Listing a saved filter, parsed and built every time or baked"""
+    ts = TaskService()
+    ts.from_arguments([u'saved', u'pro:work', u'+bug'])
+    arguments = [u'pro:work', u'+bug', u'-wip', u'+overdue', u'report']
+
+    def uncached():
+        for _ in range(100):
+            ts.filter_cache.clear()
+            ts.list_rows(ts.pending(ts.filter_by_arguments(arguments)))
+
+    def baked():
+        for _ in range(100):
+            ts.list_rows(ts.pending(ts.baked_filter(arguments)))
+
+    uncached = best_of(uncached)
+    baked = best_of(baked)
+    print('filtered listing: uncached {:.3f}ms, baked {:.3f}ms'.format(
+        uncached * 10, baked * 10))
+    assert baked < uncached
@@ -0,0 +1,27 @@
+import time
+import pytest
+from chez.tache.models import Task
+from chez.tache.services import ImportService, TaskService
+from .dataset import generate_rows
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_import_throughput(app):
+    count = 20000
+    rows = list(generate_rows(count))
+
+    start = time.time()
+    ImportService(batch_size=1000).import_rows(rows)
+    bulk = count / (time.time() - start)
+
+    ts = TaskService()
+    start = time.time()
+    for row in rows[:1000]:
+        ts.create(description=row['description'])
+    single = 1000 / (time.time() - start)
+
+    print('import: {:.0f} rows/sec, TaskService.create: {:.0f} rows/sec'
+          .format(bulk, single))
+    assert Task.query.count() == count + 1000
+    assert bulk > single
@@ -0,0 +1,16 @@
+import json
+import pytest
+from . import load
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_load(tmpdir):
+    results = load.run(['pooled'], clients=2, watchers=1, seconds=1,
+                       rows=100, workers=2, data=str(tmpdir))
+    assert json.loads(json.dumps(results)) == results
+    result, = results
+    assert result['requests'] > 0
+    assert result['errors'] == 0
+    assert result['p50_ms'] <= result['p90_ms'] <= result['p99_ms'] <= \
+        result['max_ms']
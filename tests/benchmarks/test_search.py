@@ -0,0 +1,24 @@
+import pytest
+from sqlalchemy_utils import escape_like
+from chez.tache.models import Task
+from chez.tache.services import ImportService, TaskService
+from . import best_of
+from .dataset import generate_rows
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_search(app):
+    """Description search at 100k tasks, full text index against LIKE"""
+    ImportService(batch_size=5000).import_rows(generate_rows(100000))
+    ts = TaskService()
+
+    for words in ([u'kilo'], [u'kilo', u'tango'], [u'"kilo tango"'],
+                  [u'nov*']):
+        fts = best_of(ts.filter_by_arguments(words).count)
+        like = Task.query
+        for word in words:
+            like = like.filter(Task.description.ilike(
+                u'%{}%'.format(escape_like(word.strip('"*')))))
+        print('{:<16} fts {:7.2f}ms, ilike {:7.2f}ms'.format(
+            ' '.join(words), fts * 1000, best_of(like.count) * 1000))
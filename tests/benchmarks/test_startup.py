@@ -0,0 +1,34 @@
+import subprocess
+import sys
+import pytest
+from chez.tache.factory import create_app
+from . import best_of
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_schema_check(file_config):
+    """Stamp check against create_all on an existing database"""
+    create_app(config=file_config)
+
+    class FullConfig(file_config):
+        FAST_STARTUP = False
+
+    fast = best_of(lambda: create_app(config=file_config), repeat=20)
+    full = best_of(lambda: create_app(config=FullConfig), repeat=20)
+    print('create_app: stamp {:.2f}ms, create_all {:.2f}ms'.format(
+        fast * 1000, full * 1000))
+    assert fast < full
+
+
+def test_cold_start():
+    """Interpreter start plus import of the cli, with and without the ORM"""
+    def run(code):
+        subprocess.check_call([sys.executable, '-c', code])
+
+    lazy = best_of(lambda: run('from chez.tache.commands import cli'))
+    eager = best_of(lambda: run('from chez.tache.commands import cli\n'
+                                'from chez.tache.factory import create_app'))
+    print('cold start: cli {:.0f}ms, cli + orm {:.0f}ms'.format(
+        lazy * 1000, eager * 1000))
+    assert lazy < eager
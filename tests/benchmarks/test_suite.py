@@ -0,0 +1,28 @@
+import json
+import pytest
+from . import compare, suite
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_suite(tmpdir):
+    results = suite.run(['1k'], data=str(tmpdir), repeat=3)
+    assert json.loads(json.dumps(results)) == results
+
+    measured = dict(((result['group'], result['name']), result)
+                    for result in results['results'])
+    assert measured[('import', 'import')]['rows'] == 1000
+    for group, arguments in suite.FILTERS:
+        assert (group, u' '.join(arguments)) in measured
+    assert measured[('virtual', '+OVERDUE')]['rows'] > 0
+    assert measured[('done', 'done range')]['rows'] == 20
+
+    # the imported dataset is reused and the rows matched are the same
+    again = suite.run(['1k'], data=str(tmpdir), repeat=1)
+    base = dict(((r['size'], r['group'], r['name']), r)
+                for r in results['results'])
+    current = dict(((r['size'], r['group'], r['name']), r)
+                   for r in again['results'])
+    lines, regressed = compare.compare(base, current, threshold=1000)
+    assert not regressed
+    assert ('1k', 'import', 'import') not in current
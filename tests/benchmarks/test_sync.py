@@ -0,0 +1,47 @@
+import shutil
+import time
+import pytest
+from chez.tache.factory import create_app
+from chez.tache.models import db
+from chez.tache.services import ImportService, SyncService, TaskService
+from .dataset import generate_rows
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_delta_sync(file_config, tmpdir):
+    """Full and delta syncs at 100k tasks against copying the file"""
+    app = create_app(config=file_config)
+    path = str(tmpdir.join('peer.tache.sqlite'))
+    with app.app_context():
+        ImportService(batch_size=5000).import_rows(generate_rows(100000))
+        service = SyncService()
+
+        start = time.time()
+        assert service.sync(path).sent == 100000
+        full = time.time() - start
+
+        start = time.time()
+        shutil.copy(db.engine.url.database, str(tmpdir.join('copy.sqlite')))
+        copy = time.time() - start
+
+        ts = TaskService()
+        ts.modify([u'50000-50099'], [u'+synced'])
+        changed = ts.filter_by_arguments([u'+synced']).count()
+        for index in range(10):
+            ts.create(description=u'new {}'.format(index))
+        db.session.remove()
+
+        start = time.time()
+        assert service.sync(path).sent == changed + 10
+        delta = time.time() - start
+
+        start = time.time()
+        assert service.sync(path).sent == 0
+        empty = time.time() - start
+
+    print('sync at 100k tasks: full {:.2f}s, copying the file {:.3f}s, '
+          '{} changed tasks {:.1f}ms, nothing changed {:.1f}ms'.format(
+              full, copy, changed + 10, delta * 1000, empty * 1000))
+    assert delta < full / 10
+    assert empty < full / 100
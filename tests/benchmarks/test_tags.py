@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy_utils import escape_like
+from chez.tache.models import Task, Tag
+from chez.tache.services import ImportService, TaskService
+from . import best_of
+from .dataset import generate_rows
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_tag_filters(app):
+    """Tag filters at 100k tasks and 50 tags"""
+    ImportService(batch_size=5000).import_rows(
+        generate_rows(100000, tags=50))
+    ts = TaskService()
+
+    def legacy(tag):
+        # substring EXISTS clause used before exact matching
+        return Task.query.filter(Task.tags.any(
+            Tag.name.ilike(u'%{}%'.format(escape_like(tag))))).count
+
+    cases = [
+        ('common exact', ts.filter_by_arguments([u'+tag1']).count,
+         legacy(u'tag1')),
+        ('rare exact', ts.filter_by_arguments([u'+tag42']).count,
+         legacy(u'tag42')),
+        ('prefix', ts.filter_by_arguments([u'+tag4*']).count, None),
+        ('substring', ts.filter_by_arguments([u'+~ag4']).count, None),
+        ('negative', ts.filter_by_arguments([u'-tag1']).count, None),
+    ]
+    for name, indexed, substring in cases:
+        timing = best_of(indexed)
+        line = '{:<14} indexed {:7.2f}ms'.format(name, timing * 1000)
+        if substring is not None:
+            line += ', EXISTS ilike {:7.2f}ms'.format(
+                best_of(substring) * 1000)
+        print(line)
+
+    # exact matching no longer matches tag10..tag19
+    assert ts.filter_by_arguments([u'+tag1']).count() < legacy(u'tag1')()
@@ -1,9 +1,68 @@
-
 import pytest
+from click.testing import CliRunner
+from sqlalchemy import event
+from chez.tache.commands import cli
+from chez.tache.config import TestingConfig
 from chez.tache.factory import create_app
+from chez.tache.models import db
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', default=False,
+                     help="run the benchmarks in tests/benchmarks")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers',
+                            'benchmark: timing test, needs --benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason="needs --benchmark to run")
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
 
 
 @pytest.fixture
 def app():
     app = create_app(config='chez.tache.config.TestingConfig')
     return app
+
+
+@pytest.fixture
+def run(app):
+    """Invokes the cli against the testing app"""
+    runner = CliRunner()
+
+    def run(*args):
+        return runner.invoke(cli, args, obj=app, catch_exceptions=False)
+    return run
+
+
+@pytest.fixture
+def file_config(tmpdir):
+    """Testing config backed by a SQLite file in a temporary directory"""
+    class FileConfig(TestingConfig):
+        ROOT_DIRECTORY = str(tmpdir)
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(
+            tmpdir.join('db.tache.sqlite'))
+        SQLALCHEMY_BINDS = {'archive': 'sqlite:///{}'.format(
+            tmpdir.join('archive.tache.sqlite'))}
+    return FileConfig
+
+
+@pytest.fixture
+def statements(app):
+    """Records the SQL statements executed on the app's engine"""
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement)
+
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', record)
+    yield recorded
+    event.remove(engine, 'before_cursor_execute', record)
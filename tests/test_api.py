@@ -0,0 +1,103 @@
+import json
+import pytest
+from chez.tache.models import Task
+from chez.tache.services import ImportService
+
+
+def get_json(response):
+    return json.loads(response.data.decode('utf-8'))
+
+
+def send(client, method, url, data):
+    return getattr(client, method)(url, data=json.dumps(data),
+                                   content_type='application/json')
+
+
+class TestApi(object):
+
+    @pytest.fixture
+    def tasks(self, app):
+        rows = [{'description': u'task {}'.format(i),
+                 'project': u'work' if i % 2 else u'home',
+                 'tags': [u'bug'] if i % 3 == 0 else []}
+                for i in range(1, 11)]
+        ImportService().import_rows(rows)
+
+    def test_list_pages(self, client, tasks):
+        data = get_json(client.get('/api/tasks?limit=4&filter=pro:work'))
+        assert [task['number'] for task in data['tasks']] == [1, 3, 5, 7]
+        assert data['tasks'][0]['project'] == 'work'
+        assert data['next'] == 7
+
+        data = get_json(client.get('/api/tasks?limit=4&filter=pro:work'
+                                   '&after=7'))
+        assert [task['number'] for task in data['tasks']] == [9]
+        assert data['next'] is None
+
+    def test_list_status(self, client, tasks):
+        send(client, 'post', '/api/tasks/done', {'filter': '1-5'})
+        data = get_json(client.get('/api/tasks'))
+        assert [task['number'] for task in data['tasks']] == range(6, 11)
+        data = get_json(client.get('/api/tasks?status=all&limit=2'))
+        assert [task['number'] for task in data['tasks']] == [1, 2]
+        assert client.get('/api/tasks?status=other').status_code == 400
+
+    def test_etag(self, client, tasks):
+        response = client.get('/api/tasks')
+        etag = response.headers['ETag']
+        response = client.get('/api/tasks',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+        # another query or a change gives another ETag
+        assert client.get('/api/tasks?limit=2').headers['ETag'] != etag
+        send(client, 'post', '/api/tasks/done', {'filter': '10'})
+        response = client.get('/api/tasks',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 200
+
+    def test_create_and_get(self, client):
+        response = send(client, 'post', '/api/tasks',
+                        {'arguments': 'write docs pro:work +doc pri:h'})
+        assert response.status_code == 201
+        task = get_json(response)
+        assert task['description'] == 'write docs'
+        assert task['tags'] == ['doc']
+        assert response.headers['Location'].endswith(
+            '/api/tasks/{}'.format(task['number']))
+
+        assert get_json(client.get(response.headers['Location'])) == task
+        assert client.get('/api/tasks/999').status_code == 404
+
+        response = send(client, 'post', '/api/tasks', {'arguments': '+doc'})
+        assert response.status_code == 400
+        assert get_json(response)['error'] == 'Invalid task description'
+
+    def test_done(self, client, tasks):
+        response = send(client, 'post', '/api/tasks/done',
+                        {'filter': ['3', '20-21']})
+        assert response.status_code == 404
+        assert get_json(response)['missing'] == [20, 21]
+
+        response = send(client, 'post', '/api/tasks/done',
+                        {'filter': 'pro:home +bug'})
+        assert get_json(response) == {'completed': 1}
+
+    def test_modify(self, client, tasks):
+        response = send(client, 'patch', '/api/tasks',
+                        {'filter': '+bug', 'changes': 'pri:h -bug +triaged'})
+        assert get_json(response) == {'modified': 3}
+        task = get_json(client.get('/api/tasks/6'))
+        assert task['priority'] == 'h'
+        assert task['tags'] == ['triaged']
+
+    def test_projects(self, client, tasks):
+        response = send(client, 'post', '/api/projects', {'name': 'Garden'})
+        assert response.status_code == 201
+        data = get_json(client.get('/api/projects'))
+        assert [project['name'] for project in data['projects']] == [
+            'garden', 'home', 'work']
+        assert send(client, 'post', '/api/projects',
+                    {'name': ''}).status_code == 400
+        assert Task.query.count() == 10
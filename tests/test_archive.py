@@ -0,0 +1,112 @@
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+from chez.tache.factory import create_app
+from chez.tache.models import db, Counter, Task
+from chez.tache.services import ArchiveService, ExportService, \
+    ImportService, TaskService
+from chez.tache.services.archive import ArchiveServiceException
+
+
+def days_ago(days):
+    return (datetime.now() - timedelta(days=days)).isoformat()
+
+
+class TestArchiveService(object):
+
+    @pytest.fixture
+    def app(self, file_config):
+        app = create_app(config=file_config)
+        with app.app_context():
+            yield app
+
+    @pytest.fixture
+    def tasks(self, app):
+        ImportService().import_rows([
+            {'description': u'old report', 'project': u'work',
+             'tags': [u'a', u'b'], 'completed': days_ago(100)},
+            {'description': u'old groceries', 'completed': days_ago(40)},
+            {'description': u'recent report', 'project': u'work',
+             'completed': days_ago(2)},
+            {'description': u'pending report', 'project': u'work',
+             'tags': [u'a']},
+        ])
+
+    @pytest.fixture
+    def service(self, app):
+        service = ArchiveService()
+        yield service
+        service.close()
+
+    def test_archive(self, service, tasks):
+        assert service.archive(service.expired()) == 2
+        assert [task.number for task in Task.query] == [3, 4]
+
+        archived = service.query(Task.query.order_by(Task.number)).all()
+        assert [task.number for task in archived] == [1, 2]
+        assert archived[0].project.name == u'work'
+        assert sorted(archived[0].tags) == [u'a', u'b']
+
+        # filters, virtual tags and search run against the archive
+        ts = TaskService()
+        query = ts.filter_by_arguments([u'pro:work', u'+a', u'report'])
+        assert [row[0] for row in service.list_rows(query)] == [1, 4]
+        query = ts.filter_by_arguments([u'+COMPLETED'])
+        assert [row[0] for row in service.list_rows(query)] == [1, 2, 3]
+
+        # new tasks keep numbering after archived ones
+        assert ts.create(description=u'new').number == 5
+        assert service.archive(service.expired()) == 0
+
+    def test_archive_days(self, service, tasks):
+        assert service.archive(service.expired(days=50)) == 1
+        assert service.archive(service.expired(days=0)) == 2
+        assert [task.number for task in Task.query] == [4]
+
+    def test_archive_expired(self, app, service, tasks):
+        assert service.archive_expired() == 0
+        assert not service.exists()
+
+        app.config['ARCHIVE_AFTER_DAYS'] = 30
+        assert service.archive_expired() == 2
+        assert Counter.current(db.session.connection(), u'archive_day') == \
+            datetime.now().date().toordinal()
+
+        # once a day
+        app.config['ARCHIVE_AFTER_DAYS'] = 0
+        assert service.archive_expired() == 0
+        assert Task.query.count() == 2
+
+    def test_export_all(self, service, tasks):
+        service.archive(service.expired())
+        stream = io.BytesIO()
+        query = TaskService().filter_by_arguments([u'report'])
+        count = ExportService().export(service.queries(query), stream)
+        assert count == 3
+        rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert sorted(row['number'] for row in rows) == [1, 3, 4]
+
+    def test_memory_archive(self):
+        app = create_app(config='chez.tache.config.TestingConfig')
+        with app.app_context():
+            service = ArchiveService()
+            assert not service.exists()
+            with pytest.raises(ArchiveServiceException):
+                service.archive(Task.query)
+
+    def test_commands(self, tasks, run):
+        result = run('archive', '9')
+        assert result.exit_code == 1
+        assert result.output == 'Invalid task id: 9\n'
+        assert run('archive', '3', '4').output == 'Archived 1 task\n'
+        assert run('archive').output == 'Archived 2 tasks\n'
+
+        lines = run('list', '--all', 'report').output.splitlines()
+        assert [line.split()[0] for line in lines[2:]] == ['1', '3', '4']
+        lines = run('list', 'report').output.splitlines()
+        assert [line.split()[0] for line in lines[2:]] == ['4']
+
+        output = run('export', '--all').output.splitlines()
+        assert len(output) == 4
+        assert len(run('export').output.splitlines()) == 1
@@ -0,0 +1,115 @@
+import subprocess
+import sys
+import pytest
+from chez.tache.models import Tag
+from chez.tache.services import ImportService
+
+
+class TestCli(object):
+
+    def test_help_skips_orm(self):
+        """`ct --help` should not import the ORM or create the app"""
+        code = ("import sys\n"
+                "from chez.tache.commands import cli\n"
+                "try:\n"
+                "    cli(['--help'])\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "sys.stdout.write(str('sqlalchemy' in sys.modules))\n")
+        output = subprocess.check_output([sys.executable, '-c', code])
+        assert output.strip().endswith(b'False')
+
+
+class TestList(object):
+
+    @pytest.fixture
+    def tasks(self, app):
+        ImportService().import_rows(
+            {'description': u'task {}'.format(i),
+             'project': u'p{}'.format(i % 5),
+             'tags': [u't{}'.format(i % 3), u'all']}
+            for i in range(50))
+
+    def test_list(self, tasks, run):
+        result = run(u'list', u'pro:p1')
+        lines = result.output.splitlines()
+        assert len(lines) == 2 + 10
+        assert lines[2].split() == ['2', 'p1', 'all', 't1', 'task', '1']
+        assert all(' p1 ' in line for line in lines[2:])
+
+        result = run(u'list', u'nothing')
+        assert result.output.strip() == 'No matching tasks'
+
+    def test_single_query(self, tasks, run, statements):
+        run('list')
+        selects = [s for s in statements if s.startswith('SELECT')]
+        assert len(selects) == 1
+
+    def test_next(self, tasks, run):
+        run(u'add', u'urgent', u'pri:h', u'pro:work')
+        run(u'add', u'tagged', u'+next')
+        lines = run(u'next', u'--limit', u'3').output.splitlines()
+        assert lines[0].split() == ['#', 'Urg', 'Pro', 'Tags', 'Description']
+        assert [line.split()[:2] for line in lines[2:]] == [
+            ['52', '15.8'], ['51', '7.0'], ['1', '1.9']]
+
+        lines = run(u'list', u'--sort', u'urgency').output.splitlines()
+        assert [line.split()[0] for line in lines[2:4]] == ['52', '51']
+        assert run(u'next', u'nothing').output == 'No matching tasks\n'
+
+    def test_projects(self, tasks, run):
+        lines = run(u'list', u'--projects').output.splitlines()
+        assert lines[0].split() == ['Project', 'Pending', 'Overdue',
+                                    'Completed']
+        assert [line.split() for line in lines[2:4]] == [
+            ['p0', '10', '0', '0'], ['p1', '10', '0', '0']]
+        assert len(lines) == 2 + 5
+
+
+class TestModify(object):
+
+    @pytest.fixture
+    def tasks(self, app):
+        ImportService().import_rows(
+            {'description': u'task {}'.format(i),
+             'project': u'p{}'.format(i % 2),
+             'tags': [u'odd'] if i % 2 else []}
+            for i in range(10))
+
+    def test_modify(self, tasks, run):
+        result = run(u'modify', u'--dry-run', u'pro:p1', u'--', u'pro:p2',
+                     u'-odd', u'+new')
+        assert result.output.splitlines() == [
+            'Would modify 5 tasks', '  +new: 5 tasks tagged',
+            '  -odd: 5 tasks untagged']
+        assert 'p2' not in run(u'list').output
+        assert Tag.query.filter_by(name=u'new').count() == 0
+
+        result = run(u'modify', u'1-4', u'--', u'+odd', u'pri:h')
+        assert result.output.splitlines() == [
+            'Modified 4 tasks', '  +odd: 2 tasks tagged']
+        lines = run(u'list', u'+odd').output.splitlines()
+        assert [line.split()[0] for line in lines[2:]] == [
+            '1', '2', '3', '4', '6', '8', '10']
+
+        result = run(u'modify', u'pro:p0', u'+odd', u'--', u'pro:p2')
+        assert result.output == 'Modified 2 tasks\n'
+        lines = run(u'list', u'pro:p2').output.splitlines()
+        assert [line.split()[0] for line in lines[2:]] == ['1', '3']
+
+        result = run(u'modify', u'3', u'5', u'--', u'desc:new words')
+        assert result.output == 'Modified 2 tasks\n'
+        lines = run(u'list', u'new', u'words').output.splitlines()
+        assert [line.split()[0] for line in lines[2:]] == ['3', '5']
+
+    def test_modify_errors(self, tasks, run):
+        result = run(u'modify', u'5-12', u'--', u'pri:h')
+        assert result.exit_code == 1
+        assert result.output == 'Invalid task id: 11, 12\n'
+        assert run(u'modify', u'pro:p0', u'--', u'+OVERDUE').exit_code == 2
+        assert run(u'modify', u'pro:p0', u'--').exit_code == 2
+        # without the separator, and words which are not changes
+        assert run(u'modify', u'3', u'pri:h').exit_code == 2
+        result = run(u'modify', u'3', u'--', u'4', u'pri:h')
+        assert result.exit_code == 2
+        assert 'Invalid change: 4' in result.output
@@ -0,0 +1,81 @@
+import os
+import stat
+import threading
+import pytest
+from chez.tache import client
+from chez.tache.daemon import CommandServer, DaemonException
+from chez.tache.factory import create_app
+
+
+class TestDaemon(object):
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        return str(tmpdir.join('ct.sock'))
+
+    @pytest.fixture
+    def server(self, file_config, path):
+        # a file database, in memory ones are not shared between threads
+        server = CommandServer(create_app(config=file_config), path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    def test_forward(self, server, path):
+        assert client.forward([b'add', b'hello', b'+x'], path) == \
+            (0, b'Task 1 created\n', b'')
+        status, output, errors = client.forward([b'list'], path)
+        assert (status, errors) == (0, b'')
+        assert output.splitlines()[2].split() == [b'1', b'x', b'hello']
+
+        assert client.forward([b'done', b'7'], path) == \
+            (1, b'Invalid task id: 7\n', b'')
+        status, output, errors = client.forward([b'list', b'--bogus'], path)
+        assert (status, output) == (2, b'')
+        assert b'no such option: --bogus' in errors
+        status, output, errors = client.forward([b'export'], path)
+        assert (status, output) == (2, b'')
+        assert stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0
+
+    def test_no_daemon(self, path):
+        assert client.forward([b'list'], path) is None
+
+    def test_stale_socket(self, server, path, file_config):
+        with pytest.raises(DaemonException):
+            CommandServer(create_app(config=file_config), path)
+
+        server.shutdown()
+        server.server_close()
+        CommandServer(create_app(config=file_config), path).server_close()
+
+    def test_main(self, server, path, monkeypatch, capsys):
+        monkeypatch.setenv('CT_SOCKET', path)
+        with pytest.raises(SystemExit) as exit:
+            client.main([b'add', b'from', b'main'])
+        assert exit.value.code == 0
+        assert capsys.readouterr() == ('Task 1 created\n', '')
+
+        with pytest.raises(SystemExit) as exit:
+            client.main([b'done', b'--bogus'])
+        assert exit.value.code == 2
+        output, errors = capsys.readouterr()
+        assert output == ''
+        assert 'no such option: --bogus' in errors
+
+    def test_command_name(self):
+        assert client.command_name([b'--profile', b'list', b'+x']) == b'list'
+        assert client.command_name([b'--help']) is None
+        assert client.command_name(
+            [b'--profile-json', b'out.json', b'list']) == b'list'
+
+    def test_runs_locally(self):
+        assert client.runs_locally([b'export'])
+        assert client.runs_locally([b'serve', b'--workers', b'4'])
+        assert client.runs_locally([b'sync', b'laptop.sqlite'])
+        assert client.runs_locally([b'--cprofile', b'ct.prof', b'list'])
+        assert client.runs_locally([b'--profile-json=out.json', b'list'])
+        assert not client.runs_locally([b'--profile', b'list'])
+        assert not client.runs_locally([b'list', b'--cprofile'])
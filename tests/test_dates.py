@@ -0,0 +1,64 @@
+import pytest
+import arrow
+from chez.tache.services.dates import DateParser
+
+
+class TestDateParser(object):
+
+    @pytest.fixture
+    def now(self):
+        # a Wednesday
+        return arrow.get(2026, 10, 14, 15, 30)
+
+    @pytest.fixture
+    def parser(self, now):
+        return DateParser(now)
+
+    def test_iso(self, parser):
+        for value in ('2015-07-22', '2015-07-22T10:05', '2015-07-22 10:05:03',
+                      '2015-01-01T00:05:00.25', '2015-07-22T10:05:03+02:00'):
+            assert parser.parse(value) == arrow.get(value)
+
+    def test_words(self, parser, now):
+        assert parser.parse('today') == now
+        assert parser.parse('Yesterday') == now.replace(days=-1)
+        assert parser.parse(' tomorrow ') == now.replace(days=1)
+
+    def test_weekdays(self, parser, now):
+        assert parser.parse('we') == now
+        assert parser.parse('Th') == now.replace(days=1)
+        assert parser.parse('t') == now.replace(days=1)
+        assert parser.parse('monday') == now.replace(days=5)
+
+    def test_offsets(self, parser, now):
+        assert parser.parse('+3d') == now.replace(days=3)
+        assert parser.parse('-2w') == now.replace(weeks=-2)
+        assert parser.parse('4h') == now.replace(hours=4)
+        assert parser.parse('+1m') == now.replace(months=1)
+        assert parser.parse('-1y') == now.replace(years=-1)
+
+    def test_spans(self, parser, now):
+        assert parser.parse('eod') == now.ceil('day')
+        assert parser.parse('eow') == arrow.get(2026, 10, 18).ceil('day')
+        assert parser.parse('eom') == arrow.get(2026, 10, 31).ceil('day')
+        assert parser.parse('eoy') == arrow.get(2026, 12, 31).ceil('day')
+        assert parser.parse('sow') == arrow.get(2026, 10, 12)
+
+    def test_durations(self, parser, now):
+        assert parser.parse('P1W') == now.replace(weeks=1)
+        assert parser.parse('p1y2m3d') == now.replace(years=1, months=2,
+                                                      days=3)
+        assert parser.parse('-PT2H30M') == now.replace(hours=-2, minutes=-30)
+
+    def test_invalid(self, parser):
+        for value in ('Mayday', 'P', 'PT', '+3x', '2015-13-45'):
+            with pytest.raises(ValueError):
+                parser.parse(value)
+
+    def test_cache(self, parser):
+        assert parser.parse('+3d') is parser.parse('+3d ')
+        assert len(parser.cache) == 1
+
+        parser.maxsize = 1
+        parser.parse('eow')
+        assert list(parser.cache) == ['eow']
@@ -0,0 +1,54 @@
+from chez.tache.factory import create_app
+from chez.tache.models import db, SCHEMA_VERSION, Task, ensure_schema
+from chez.tache.services import ImportService
+
+
+class TestEnsureSchema(object):
+
+    def user_version(self, app):
+        engine = db.get_engine(app)
+        return engine.execute('PRAGMA user_version').scalar()
+
+    def test_stamp(self, file_config):
+        app = create_app(config=file_config)
+        assert self.user_version(app) == SCHEMA_VERSION
+
+        # stamped database skips create_all
+        assert ensure_schema(app) is False
+        assert ensure_schema(app, force=True) is True
+        assert self.user_version(app) == SCHEMA_VERSION
+
+    def test_upgrade_old_stamp(self, file_config):
+        app = create_app(config=file_config)
+        engine = db.get_engine(app)
+        engine.execute('PRAGMA user_version = 0')
+        engine.execute('DROP TABLE tag')
+
+        assert ensure_schema(app) is True
+        assert engine.has_table('tag')
+        assert self.user_version(app) == SCHEMA_VERSION
+
+    def test_convert_keys(self, file_config):
+        app = create_app(config=file_config)
+        with app.app_context():
+            ImportService().import_rows([
+                {'description': u'one', 'project': u'home', 'tags': [u'x']},
+                {'description': u'two'}])
+        engine = db.get_engine(app)
+        # keys as stored before BINARY_KEYS_VERSION
+        engine.execute('UPDATE task SET id = hex(id)')
+        engine.execute('UPDATE task SET project_id = lower(hex(project_id)) '
+                       'WHERE project_id IS NOT NULL')
+        engine.execute('UPDATE project SET id = lower(hex(id))')
+        engine.execute('UPDATE tasks_tags SET task_id = hex(task_id)')
+        engine.execute('PRAGMA user_version = 6')
+
+        assert ensure_schema(app) is True
+        assert engine.execute(
+            "SELECT count(*) FROM task WHERE typeof(id) != 'blob' "
+            "OR typeof(project_id) = 'text'").scalar() == 0
+        with app.app_context():
+            tasks = Task.query.order_by(Task.number).all()
+            assert tasks[0].project.name == u'home'
+            assert list(tasks[0].tags) == [u'x']
+            assert tasks[1].project is None
@@ -0,0 +1,78 @@
+import json
+import pstats
+import threading
+import pytest
+from chez.tache.models import db, Task
+from chez.tache.profiler import Profiler
+from chez.tache.services import ImportService
+
+
+@pytest.fixture
+def tasks(app):
+    ImportService().import_rows({'description': u'task {}'.format(i),
+                                 'project': u'p{}'.format(i % 2)}
+                                for i in range(10))
+
+
+class TestProfiler(object):
+
+    def test_statements(self, app):
+        profiler = Profiler(u'test')
+        profiler.attach(db.get_engine(app))
+        with profiler.phase('count'):
+            Task.query.count()
+        other = threading.Thread(target=lambda: Task.query.count())
+        other.start()
+        other.join()
+        profiler.stop()
+        Task.query.count()
+
+        data = profiler.to_dict()
+        assert data['name'] == 'test'
+        assert list(data['phases']) == ['count']
+        assert data['sql']['count'] == 1
+        assert data['sql']['slowest'][0]['statement'].startswith('SELECT')
+        assert 'sql;dur=' in profiler.server_timing()
+        assert profiler.report()[-1].split()[1].startswith('SELECT')
+
+    def test_command(self, run, tasks):
+        result = run('--profile', 'list', 'pro:p1')
+        lines = result.output.splitlines()
+        assert len([line for line in lines if ' p1 ' in line]) == 5
+        assert [line.split()[0] for line in lines[-8:-2]] == \
+            ['ct', 'parse', 'query', 'execute', 'render', 'sql']
+        assert lines[-8].split()[1] == 'list'
+        assert 'SELECT task.number' in result.output
+
+    def test_json(self, run, tasks, tmpdir):
+        result = run('--profile-json', '-', 'done', '1-3')
+        output, _, data = result.output.partition('\n')
+        assert output == 'Completed 3 tasks'
+        data = json.loads(data)
+        assert data['name'] == 'ct done'
+        assert list(data['phases']) == ['execute']
+        assert data['sql']['count'] >= 2
+
+        path = str(tmpdir.join('ct.prof'))
+        run('--cprofile', path, 'list')
+        assert pstats.Stats(path).total_calls > 0
+
+    def test_config(self, app, run, tasks, tmpdir):
+        output = tmpdir.join('profile.jsonl')
+        app.config.update(PROFILE=True, PROFILE_OUTPUT=str(output))
+        run('list')
+        run('done', '4')
+        names = [json.loads(line)['name'] for line in output.readlines()]
+        assert names == ['ct list', 'ct done']
+
+    def test_request(self, app, client, tasks, tmpdir):
+        assert 'Server-Timing' not in client.get('/api/tasks').headers
+
+        output = tmpdir.join('profile.jsonl')
+        app.config.update(PROFILE=True, PROFILE_OUTPUT=str(output))
+        response = client.get('/api/tasks?filter=pro:p1')
+        assert response.status_code == 200
+        assert 'desc="' in response.headers['Server-Timing']
+        data = json.loads(output.read())
+        assert data['name'] == 'GET /api/tasks'
+        assert data['sql']['count'] >= 1
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+import pytest
+from chez.tache.models import db, Project
+from chez.tache.services import ImportService, ProjectService, TaskService
+
+
+class TestProjectService(object):
+
+    @pytest.fixture
+    def service(self, app):
+        return ProjectService()
+
+    def test_cache(self, service, statements):
+        project = service.get_or_create(u'Home')
+        assert service.get(u' home ') is project
+        assert service.get_or_create(u'HOME') is project
+        assert service.get(u'missing') is None
+        assert service.get(u'missing') is None
+        selects = [s for s in statements if s.startswith('SELECT')]
+        assert len(selects) == 3
+
+    def test_cache_per_command(self, app, statements):
+        ts = TaskService()
+        ts.from_arguments([u'one', u'pro:home'])
+        ts.from_arguments([u'two', u'pro:home'])
+        assert Project.query.count() == 1
+        lookups = [s for s in statements if 'WHERE project.name' in s]
+        assert len(lookups) == 1
+
+    def test_summary(self, service, statements):
+        past = (datetime.now() - timedelta(days=3)).isoformat()
+        ImportService().import_rows([
+            {'description': u'a', 'project': u'work', 'due': past},
+            {'description': u'b', 'project': u'work'},
+            {'description': u'c', 'project': u'work', 'completed': past},
+            {'description': u'd', 'project': u'home', 'completed': past},
+            {'description': u'e'},
+        ])
+        service.create(u'empty')
+        del statements[:]
+
+        assert service.summary() == [
+            (u'empty', 0, 0, 0),
+            (u'home', 0, 0, 1),
+            (u'work', 2, 1, 1),
+        ]
+        assert len(statements) == 1
+        assert service.summary()[0].name == u'empty'
+        db.session.rollback()
@@ -0,0 +1,104 @@
+import httplib
+import json
+import threading
+import pytest
+from chez.tache.changes import ChangeNotifier
+from chez.tache.factory import create_app
+from chez.tache.models import db
+from chez.tache.server import ApiServer
+from chez.tache.services import TaskService
+
+
+class TestServer(object):
+
+    @pytest.fixture
+    def server(self, file_config):
+        app = create_app(config=file_config,
+                         settings={'SQLALCHEMY_POOL_SIZE': 2})
+        server = ApiServer(app, port=0, workers=2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield server
+        server.shutdown()
+        thread.join()
+
+    def request(self, server, method, url, data=None, headers=None):
+        connection = httplib.HTTPConnection(*server.server_address)
+        body = json.dumps(data) if data is not None else None
+        connection.request(method, url, body, headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_requests(self, server):
+        status, data = self.request(server, 'POST', '/api/tasks',
+                                    {'arguments': 'hello +x'})
+        assert (status, data['number']) == (201, 1)
+        status, data = self.request(server, 'GET', '/api/tasks')
+        assert [task['description'] for task in data['tasks']] == \
+            ['hello']
+        assert self.request(server, 'POST', '/api/tasks', []) == \
+            (400, {'error': 'Expected a JSON object'})
+
+    def test_long_poll(self, server):
+        status, data = self.request(server, 'GET', '/api/changes')
+        version = data['version']
+        assert self.request(server, 'GET', '/api/changes?timeout=0.1&'
+                            'version={}'.format(version)) == \
+            (200, {'version': version})
+
+        # a waiting client does not hold one of the two workers
+        results = []
+        polls = [threading.Thread(target=lambda: results.append(
+            self.request(server, 'GET', '/api/changes?version={}'.format(
+                version))[1]['version'])) for _ in range(3)]
+        for poll in polls:
+            poll.start()
+        self.request(server, 'POST', '/api/tasks', {'arguments': 'hello'})
+        for poll in polls:
+            poll.join()
+        assert len(results) == 3
+        assert all(result > version for result in results)
+
+    def test_events(self, server):
+        connection = httplib.HTTPConnection(*server.server_address)
+        connection.request('GET', '/api/changes',
+                           headers={'Accept': 'text/event-stream'})
+        response = connection.getresponse()
+        assert response.getheader('Content-Type').startswith(
+            'text/event-stream')
+
+        def event():
+            lines = []
+            while not lines or lines[-1]:
+                lines.append(response.fp.readline().rstrip('\n'))
+            return lines
+
+        first = event()
+        version = int(first[0].split()[1])
+        assert first == ['id: {}'.format(version), 'event: change',
+                         'data: {{"version": {}}}'.format(version), '']
+        self.request(server, 'POST', '/api/tasks', {'arguments': 'hello'})
+        assert int(event()[0].split()[1]) > version
+        connection.close()
+
+
+def test_notifier(file_config):
+    app = create_app(config=file_config)
+    notifier = ChangeNotifier(app, interval=0.01)
+    version = notifier.wait()
+    assert notifier.wait(version, timeout=0.05) == version
+
+    with app.app_context():
+        TaskService().create(description=u'hello')
+        db.session.remove()
+    version, previous = notifier.wait(version, timeout=5), version
+    assert version > previous
+
+    # stopping wakes the waiting threads
+    results = []
+    waiting = threading.Thread(
+        target=lambda: results.append(notifier.wait(version)))
+    waiting.start()
+    notifier.stop()
+    waiting.join()
+    assert results == [version]
@@ -0,0 +1,130 @@
+import json
+from datetime import date
+import pytest
+from chez.tache.factory import create_app
+from chez.tache.models import db, project_stats, tag_stats, Project, \
+    Task
+from chez.tache.services import ArchiveService, ImportService, \
+    StatsService, TaskService
+from chez.tache.services.stats import StatsRow, StatsServiceException
+
+
+def rollups():
+    connection = db.session.connection()
+    return [sorted(tuple(row) for row in connection.execute(table.select()))
+            for table in (project_stats, tag_stats)]
+
+
+class TestStatsService(object):
+
+    @pytest.fixture
+    def app(self, file_config):
+        app = create_app(config=file_config)
+        with app.app_context():
+            yield app
+
+    @pytest.fixture
+    def tasks(self, app):
+        # 2026-01-05 is a Monday
+        ImportService().import_rows([
+            {'description': u'a', 'project': u'work', 'tags': [u'x'],
+             'created': u'2026-01-05T12:00:00',
+             'completed': u'2026-01-13T12:00:00'},
+            {'description': u'b', 'project': u'work', 'tags': [u'x', u'y'],
+             'created': u'2026-01-06T12:00:00'},
+            {'description': u'c', 'created': u'2026-01-12T12:00:00',
+             'completed': u'2026-02-02T12:00:00'},
+            {'description': u'd', 'project': u'home',
+             'created': u'2026-02-03T12:00:00'},
+        ])
+
+    @pytest.fixture
+    def service(self, app):
+        return StatsService()
+
+    def test_report(self, service, tasks):
+        assert service.report('week') == [
+            StatsRow(u'2026-01-05', None, 2, 0, 2),
+            StatsRow(u'2026-01-12', None, 1, 1, 2),
+            StatsRow(u'2026-02-02', None, 1, 1, 2),
+        ]
+        assert service.report('month') == [
+            StatsRow(u'2026-01', None, 3, 1, 2),
+            StatsRow(u'2026-02', None, 1, 1, 2),
+        ]
+        assert service.report('year', group='project') == [
+            StatsRow(u'2026', u'', 1, 1, 0),
+            StatsRow(u'2026', u'home', 1, 0, 1),
+            StatsRow(u'2026', u'work', 2, 1, 1),
+        ]
+        assert service.report('month', group='tag') == [
+            StatsRow(u'2026-01', u'x', 2, 1, 1),
+            StatsRow(u'2026-01', u'y', 1, 0, 1),
+        ]
+
+    def test_report_filters(self, service, tasks):
+        # tasks open before `since` are carried over
+        assert service.report('month', since=date(2026, 2, 1)) == [
+            StatsRow(u'2026-02', None, 1, 1, 2)]
+        assert service.report('day', until=date(2026, 1, 5)) == [
+            StatsRow(u'2026-01-05', None, 1, 0, 1)]
+        assert service.report('year', project=u'Work') == [
+            StatsRow(u'2026', None, 2, 1, 1)]
+        assert service.report('year', project=u'') == [
+            StatsRow(u'2026', None, 1, 1, 0)]
+        assert service.report('year', tag=u'y') == [
+            StatsRow(u'2026', None, 1, 0, 1)]
+        with pytest.raises(StatsServiceException):
+            service.report('year', group='project', tag=u'x')
+        with pytest.raises(StatsServiceException):
+            service.report('hour')
+
+    def test_incremental(self, service, tasks):
+        ts = TaskService()
+        task = Task.query.filter_by(number=2).one()
+        task.project = Project.query.filter_by(name=u'home').one()
+        task.tags.remove(u'x')
+        db.session.commit()
+        ts.done([u'2'], now=ts.parse_date(u'2026-02-04T12:00:00'))
+        ts.create(description=u'e')
+        expected = rollups()
+        service.rebuild()
+        assert rollups() == expected
+        assert service.report('year', group='project',
+                              until=date(2026, 6, 30)) == [
+            StatsRow(u'2026', u'', 1, 1, 0),
+            StatsRow(u'2026', u'home', 2, 1, 1),
+            StatsRow(u'2026', u'work', 1, 1, 0),
+        ]
+
+    def test_archive(self, service, tasks):
+        before = service.report('week', group='tag')
+        archive = ArchiveService()
+        assert archive.archive(archive.expired(days=0)) == 2
+        archive.close()
+        assert service.report('week', group='tag') == before
+        service.rebuild()
+        assert service.report('week', group='tag') == before
+
+    def test_command(self, tasks, run):
+        lines = run('stats', '--by', 'month', '--since', 'all').output \
+            .splitlines()
+        assert lines[0].split() == ['Period', 'Created', 'Completed', 'Open']
+        assert [line.split() for line in lines[2:]] == [
+            ['2026-01', '3', '1', '2'], ['2026-02', '1', '1', '2']]
+
+        lines = run('stats', '--by', 'year', '--group', 'project',
+                    '--since', '2026-01-01', '--format', 'csv').output
+        assert lines.splitlines() == [
+            'period,project,created,completed,open',
+            '2026,,1,1,0', '2026,home,1,0,1', '2026,work,2,1,1']
+
+        output = run('stats', '--by', 'year', '--tag', u'x', '--since', 'all',
+                     '--format', 'json', '--rebuild').output
+        assert [json.loads(line) for line in output.splitlines()] == [
+            {'period': '2026', 'created': 2, 'completed': 1, 'open': 1}]
+
+        result = run('stats', '--since', 'never')
+        assert result.exit_code == 2
+        assert run('stats', '--since', 'all', '--until', '2025-01-01') \
+            .output == 'No tasks\n'
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy.pool import NullPool, QueuePool
+from chez.tache.factory import create_app
+from chez.tache.models import db
+from chez.tache.services import TaskService
+from chez.tache.storage import StorageProfileError
+
+
+def pragmas(engine, *names):
+    with engine.connect() as connection:
+        return [connection.execute('PRAGMA {}'.format(name)).scalar()
+                for name in names]
+
+
+class TestStorage(object):
+
+    def make_app(self, file_config, **settings):
+        config = type('StorageConfig', (file_config,), settings)
+        return create_app(config=config)
+
+    def test_wal(self, file_config):
+        app = self.make_app(file_config, STORAGE_PROFILE='wal')
+        for bind in (None, 'archive'):
+            engine = db.get_engine(app, bind=bind)
+            assert isinstance(engine.pool, NullPool)
+            assert pragmas(engine, 'journal_mode', 'synchronous',
+                           'busy_timeout', 'temp_store') == \
+                ['wal', 1, 5000, 2]
+
+    def test_profiles(self, file_config):
+        # SQLite's defaults unless a faster profile is picked
+        app = self.make_app(file_config)
+        assert pragmas(db.get_engine(app), 'journal_mode',
+                       'synchronous') == ['delete', 2]
+
+        app = self.make_app(file_config, STORAGE_PROFILE='rollback',
+                            STORAGE_PRAGMAS={'cache_size': -1234})
+        assert pragmas(db.get_engine(app), 'journal_mode', 'synchronous',
+                       'cache_size') == ['delete', 2, -1234]
+
+        app = self.make_app(file_config, STORAGE_PROFILE='durable')
+        assert pragmas(db.get_engine(app), 'journal_mode',
+                       'synchronous') == ['wal', 2]
+
+        with pytest.raises(StorageProfileError):
+            self.make_app(file_config, STORAGE_PROFILE='fast')
+
+    def test_pool(self, file_config):
+        app = self.make_app(file_config, STORAGE_PROFILE='wal',
+                            SQLALCHEMY_POOL_SIZE=2)
+        engine = db.get_engine(app)
+        assert isinstance(engine.pool, QueuePool)
+
+        connections = set()
+        for description in (u'one', u'two'):
+            with app.app_context():
+                TaskService().create(description=description)
+                connections.add(id(db.session.connection().connection
+                                   .connection))
+        assert len(connections) == 1
+        assert pragmas(engine, 'journal_mode') == ['wal']
@@ -0,0 +1,142 @@
+import pytest
+from click.testing import CliRunner
+from chez.tache.commands import cli
+from chez.tache.factory import create_app
+from chez.tache.models import db, Task
+from chez.tache.services import ArchiveService, ImportService, \
+    SyncService, TaskService
+from chez.tache.services.sync import SyncResult, SyncServiceException
+
+
+class TestSyncService(object):
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        return str(tmpdir.join('peer.tache.sqlite'))
+
+    @pytest.fixture
+    def app(self, file_config):
+        return create_app(config=file_config)
+
+    @pytest.fixture
+    def peer(self, file_config, path, tmpdir):
+        config = type('PeerConfig', (file_config,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}'.format(path),
+            'SQLALCHEMY_BINDS': {'archive': 'sqlite:///{}'.format(
+                tmpdir.join('peer-archive.tache.sqlite'))}})
+        return create_app(config=config)
+
+    def sync(self, app, path):
+        with app.app_context():
+            return SyncService().sync(path)
+
+    def rows(self, app):
+        with app.app_context():
+            ts = TaskService()
+            return ts.list_rows(ts.filter_by_arguments([]).order_by(
+                Task.number))
+
+    def run(self, app, func):
+        with app.app_context():
+            func(TaskService())
+            db.session.remove()
+
+    def test_sync(self, app, peer, path):
+        self.run(app, lambda ts: ImportService().import_rows([
+            {'description': u'one', 'project': u'work', 'tags': [u'x']},
+            {'description': u'two', 'tags': [u'x', u'y']},
+        ]))
+        self.run(peer, lambda ts: ts.from_arguments([u'three', u'+y']))
+
+        assert self.sync(app, path) == SyncResult(2, 1, 0)
+        # numbers are local, tags are matched by name
+        assert self.rows(app) == [(1, u'work', [u'x'], u'one'),
+                                  (2, None, [u'x', u'y'], u'two'),
+                                  (3, None, [u'y'], u'three')]
+        assert self.rows(peer) == [(1, None, [u'y'], u'three'),
+                                   (2, u'work', [u'x'], u'one'),
+                                   (3, None, [u'x', u'y'], u'two')]
+        # nothing is sent back
+        assert self.sync(app, path) == SyncResult(0, 0, 0)
+
+        self.run(app, lambda ts: ts.modify([u'1'], [u'-x', u'+z', u'pri:h']))
+        self.run(peer, lambda ts: ts.done([u'1']))
+        assert self.sync(app, path) == SyncResult(1, 1, 0)
+        assert self.rows(peer)[1] == (2, u'work', [u'z'], u'one')
+        with app.app_context():
+            task = Task.query.filter_by(number=3).one()
+            assert task.completed is not None
+            assert sorted(task.tags) == [u'y']
+        assert self.sync(peer, self.path_of(app)) == SyncResult(0, 0, 0)
+
+    def path_of(self, app):
+        with app.app_context():
+            return db.engine.url.database
+
+    def test_conflict(self, app, peer, path):
+        self.run(app, lambda ts: ts.from_arguments([u'shared']))
+        self.sync(app, path)
+
+        # the last update wins on both sides
+        self.run(app, lambda ts: ts.modify([u'1'], [u'desc:local', u'+a']))
+        self.run(peer, lambda ts: ts.modify([u'1'], [u'desc:peer', u'+b']))
+        assert self.sync(app, path) == SyncResult(0, 1, 1)
+        assert self.rows(app) == [(1, None, [u'b'], u'peer')]
+        assert self.rows(peer) == [(1, None, [u'b'], u'peer')]
+
+        # ties go to the database with the greater sync id
+        for other, description in ((peer, u'peer tie'), (app, u'local tie')):
+            self.run(other, lambda ts: ts.modify(
+                [u'1'], [u'desc:' + description]))
+            with other.app_context():
+                db.engine.execute("UPDATE task SET updated = "
+                                  "'2026-01-01 00:00:00.000000'")
+        with app.app_context():
+            ids = [db.engine.execute("SELECT value FROM counter WHERE "
+                                     "name = 'sync_id'").scalar()]
+        with peer.app_context():
+            ids.append(db.engine.execute("SELECT value FROM counter WHERE "
+                                         "name = 'sync_id'").scalar())
+        assert self.sync(peer, self.path_of(app)) == \
+            SyncResult(int(ids[1] > ids[0]), int(ids[0] > ids[1]), 1)
+        winner = u'local tie' if ids[0] > ids[1] else u'peer tie'
+        assert self.rows(app)[0][3] == self.rows(peer)[0][3] == winner
+
+    def test_archived(self, app, peer, path):
+        self.run(app, lambda ts: ts.from_arguments([u'done']))
+        self.sync(app, path)
+        self.run(app, lambda ts: ts.done([u'1']))
+        with app.app_context():
+            archive = ArchiveService()
+            assert archive.archive(archive.expired(days=-1)) == 1
+            archive.close()
+
+        # changes to tasks archived here are skipped
+        self.run(peer, lambda ts: ts.modify([u'1'], [u'+late']))
+        assert self.sync(app, path) == SyncResult(0, 0, 0)
+        assert self.rows(app) == []
+
+    def test_errors(self, app, peer, path, tmpdir):
+        with pytest.raises(SyncServiceException):
+            self.sync(app, self.path_of(app))
+
+        copy = str(tmpdir.join('copy.tache.sqlite'))
+        self.sync(app, path)
+        tmpdir.join('peer.tache.sqlite').copy(tmpdir.join(
+            'copy.tache.sqlite'))
+        with pytest.raises(SyncServiceException):
+            self.sync(peer, copy)
+        # the failed sync left the connection usable
+        assert self.sync(app, path) == SyncResult(0, 0, 0)
+
+    def test_command(self, app, path):
+        self.run(app, lambda ts: ts.from_arguments([u'one']))
+        runner = CliRunner()
+        result = runner.invoke(cli, ['sync', path], obj=app,
+                               catch_exceptions=False)
+        assert result.output == \
+            'Sent 1 task(s), received 0 task(s), 0 conflict(s)\n'
+
+        result = runner.invoke(cli, ['sync', self.path_of(app)], obj=app)
+        assert result.exit_code == 2
+        assert "Can't sync a database with itself" in result.output
@@ -0,0 +1,77 @@
+import multiprocessing
+from chez.tache.factory import create_app
+from chez.tache.models import db, Counter, Task
+from chez.tache.services import TaskService
+
+
+def add_tasks(config, count, queue):
+    app = create_app(config=config)
+    numbers = []
+    with app.app_context():
+        ts = TaskService()
+        for i in range(count):
+            numbers.append(ts.create(description=u'task {}'.format(i)).number)
+    queue.put(numbers)
+
+
+class TestTaskNumber(object):
+
+    def counter(self):
+        return Counter.query.get(u'task').value
+
+    def test_sequential(self, app):
+        ts = TaskService()
+        first = ts.create(description=u'first')
+        second = ts.create(description=u'second')
+        assert second.number == first.number + 1
+        assert self.counter() == second.number
+
+    def test_batch(self, app):
+        tasks = [Task(description=u'task {}'.format(i)) for i in range(5)]
+        db.session.add_all(tasks)
+        db.session.commit()
+
+        numbers = [task.number for task in tasks]
+        assert numbers == list(range(numbers[0], numbers[0] + 5))
+        assert self.counter() == numbers[-1]
+
+    def test_explicit_number(self, app):
+        ts = TaskService()
+        task = ts.create(description=u'explicit', number=1000)
+        assert task.number == 1000
+        assert Counter.query.get(u'task') is None
+        assert ts.create(description=u'seeded').number == 1001
+
+        # an existing counter is moved past explicit numbers
+        ts.create(description=u'explicit', number=2000)
+        assert self.counter() == 2000
+        assert ts.create(description=u'next').number == 2001
+        ts.create(description=u'lower', number=5)
+        assert self.counter() == 2001
+
+    def test_seed_from_existing(self, app):
+        db.session.execute(Task.__table__.insert().values(
+            description=u'imported', number=41))
+        db.session.commit()
+
+        task = TaskService().create(description=u'next')
+        assert task.number == 42
+
+    def test_concurrent(self, file_config):
+        create_app(config=file_config)
+        processes, count = 4, 25
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=add_tasks,
+                                           args=(file_config, count, queue))
+                   for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            assert worker.exitcode == 0
+
+        numbers = []
+        for _ in workers:
+            numbers.extend(queue.get(timeout=5))
+
+        assert sorted(numbers) == list(range(1, processes * count + 1))
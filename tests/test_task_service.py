@@ -2,6 +2,8 @@
 import pytest
 import arrow
 from chez.tache.models import db, Task, Project, Tag
+from chez.tache.models.task import data_version
+from chez.tache.models.urgency import UrgencyCoefficientError
 from chez.tache.services import TaskService
 from chez.tache.services.task import TaskServiceParseException
 
@@ -198,3 +200,374 @@ class TestTaskService(object):
             assert query is not None
             assert query.count() > 0
             assert task in query.all()
+
+    def test_explain(self, ts):
+        query = ts.filter_by_arguments(['+overdue'])
+        plan = ' '.join(ts.explain(query))
+        assert 'ix_task_pending_due' in plan
+
+        query = ts.filter_by_arguments(['+today'])
+        plan = ' '.join(ts.explain(query))
+        assert 'ix_task_due' in plan
+
+    def test_parse_numbers(self, ts):
+        clause, ranges = ts.parse_numbers([u'3', u'10-12,20', u'7-5,11-13'])
+        assert ranges == [(3, 3), (5, 7), (10, 13), (20, 20)]
+
+        with pytest.raises(TaskServiceParseException):
+            ts.parse_numbers([u'3,abc'])
+
+    def test_done(self, ts, statements):
+        tasks = [ts.create(description=u'task {}'.format(i))
+                 for i in range(10)]
+        numbers = [task.number for task in tasks]
+        del statements[:]
+
+        count, missing = ts.done([u'{}-{},{}'.format(
+            numbers[0], numbers[4], numbers[7])])
+        assert (count, missing) == (6, [])
+        assert [s.split()[0] for s in statements] == ['SELECT', 'UPDATE']
+
+        pending = ts.pending(Task.query).with_entities(Task.number)
+        assert sorted(n for n, in pending) == [
+            numbers[5], numbers[6], numbers[8], numbers[9]]
+        completed = Task.query.filter(Task.number == numbers[0]).one()
+        assert completed.completed is not None
+
+        # completed tasks are not completed again
+        assert ts.done([str(numbers[0])]) == (0, [])
+
+    def test_done_missing(self, ts):
+        task = ts.create(description=u'task')
+        missing = task.number + 100
+        count, missing_numbers = ts.done(
+            [u'{},{}'.format(task.number, missing)])
+        assert (count, missing_numbers) == (0, [missing])
+        assert ts.pending(Task.query).count() == 1
+
+        with pytest.raises(TaskServiceParseException):
+            ts.done([u'hello'])
+
+    def test_done_large_range(self, ts, statements):
+        numbers = [ts.create(description=u'task {}'.format(i)).number
+                   for i in range(5)]
+        Task.query.filter(Task.number == numbers[2]).delete()
+        db.session.commit()
+
+        # ranges are not expanded, the missing numbers are capped and found
+        # by a second SELECT
+        del statements[:]
+        count, missing = ts.done([u'{}-100000000'.format(numbers[0])])
+        assert len(statements) == 2
+        assert count == 0
+        assert missing[:3] == [numbers[2], numbers[4] + 1, numbers[4] + 2]
+        assert len(missing) == ts.MAX_MISSING
+        assert ts.missing_numbers([(0, 100000000)], limit=3) == [
+            0, numbers[2], numbers[4] + 1]
+        assert ts.pending(Task.query).count() == 4
+        assert ts.missing_numbers([(numbers[2], numbers[2]), (
+            numbers[4] + 3, numbers[4] + 3)]) == [numbers[2], numbers[4] + 3]
+
+    def test_done_numbers_and_filter(self, ts):
+        task = ts.from_arguments(u'fix 5 things +bug'.split(' '))
+        for arguments in ([u'5', u'+bug'], [u'+bug', u'1,2'],
+                          [u'pro:a', u'3-4']):
+            with pytest.raises(TaskServiceParseException):
+                ts.done(arguments)
+        assert ts.done([u'things', u'+bug']) == (1, [])
+        assert Task.query.get(task.id).completed is not None
+
+    def test_done_filter(self, ts):
+        ts.from_arguments(u'release notes pro:release'.split(' '))
+        ts.from_arguments(u'tag it pro:release +bug'.split(' '))
+        ts.from_arguments(u'other +bugs'.split(' '))
+
+        assert ts.done([u'pro:release', u'+bug']) == (1, [])
+        assert ts.done([u'pro:release']) == (1, [])
+        assert ts.pending(Task.query).count() == 1
+
+    def test_tag_matching(self, ts):
+        home = ts.from_arguments(u'clean +home'.split(' '))
+        work = ts.from_arguments(u'essay +homework'.split(' '))
+        other = ts.from_arguments(u'call +phone'.split(' '))
+
+        def find(arguments):
+            return set(ts.filter_by_arguments(arguments.split(' ')).all())
+
+        assert find(u'+home') == set([home])
+        assert find(u'+home*') == set([home, work])
+        assert find(u'+~ome') == set([home, work])
+        assert find(u'+~ome -home') == set([work])
+        assert find(u'-home*') == set([other])
+        assert find(u'+missing') == set()
+
+    def test_existing_tags(self, ts):
+        first = ts.from_arguments(u'first +shared +one'.split(' '))
+        second = ts.from_arguments(u'second +shared'.split(' '))
+        assert Tag.query.filter_by(name=u'shared').count() == 1
+        shared = (set(tag.id for tag in first.tags_rel) &
+                  set(tag.id for tag in second.tags_rel))
+        assert len(shared) == 1
+
+        with pytest.raises(TaskServiceParseException):
+            ts.from_arguments(u'pattern +home*'.split(' '))
+
+    def test_tags_plan(self, ts):
+        plan = ' '.join(ts.explain(ts.filter_by_arguments([u'+home'])))
+        assert 'ix_tasks_tags_tag_id_task_id' in plan
+        assert 'sqlite_autoindex_tag' in plan
+
+    def test_search(self, ts):
+        first = ts.create(description=u'Write the release notes')
+        second = ts.create(description=u'Release the kraken, then notes')
+        third = ts.create(description=u'Unrelated "quoted" chore')
+
+        def find(*arguments):
+            return set(ts.filter_by_arguments(arguments).all())
+
+        assert find(u'release') == set([first, second])
+        assert find(u'release', u'kraken') == set([second])
+        assert find(u'rel*') == set([first, second])
+        assert find(u'"release notes"') == set([first])
+        assert find(u'rele') == set()
+        assert find(u'"quoted"') == set([third])
+        assert find(u'notes"') == set([first, second])
+
+        # the index follows updates and deletes
+        first.description = u'Write the changelog'
+        db.session.commit()
+        assert find(u'release') == set([second])
+        assert find(u'changelog') == set([first])
+        db.session.delete(second)
+        db.session.commit()
+        assert find(u'release') == set()
+
+    def test_search_rank(self, ts):
+        ts.create(description=u'notes about many other things entirely')
+        best = ts.create(description=u'notes notes')
+        query = ts.filter_by_arguments([u'notes'], rank=True)
+        assert query.first() == best
+        assert query.count() == 2
+
+    def test_filter_cache(self, ts):
+        cache = TaskService.filter_cache
+        cache.clear()
+        task = ts.from_arguments(u'cached +test pro:cache'.split(' '))
+
+        arguments = [u'+test', u'pro:cache']
+        assert ts.filter_by_arguments(arguments).all() == [task]
+        assert (cache.hits, cache.misses) == (0, 1)
+        assert ts.filter_by_arguments([u' +test', u'pro:cache', u'']).all() \
+            == [task]
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # different defaults are a different filter
+        assert ts.filter_by_arguments(arguments, defaults=u'-test').all() \
+            == []
+        assert cache.misses == 2
+
+    def test_filter_cache_time_params(self, ts):
+        TaskService.filter_cache.clear()
+        task = ts.from_arguments(u'later due:tomorrow'.split(' '))
+        query = ts.filter_by_arguments([u'+today'])
+        assert query.all() == []
+
+        # the cached clause takes the day from its parameters
+        tomorrow = arrow.now().replace(days=1)
+        query = TaskService(now=tomorrow).filter_by_arguments([u'+today'])
+        assert query.all() == [task]
+        assert TaskService.filter_cache.hits == 1
+
+    def test_filter_cache_dates(self, ts):
+        cache = TaskService.filter_cache
+        cache.clear()
+        ts.filter_by_arguments([u'due:today'])
+        key = ts.filter_key([u'due:today'], None, False)
+        entry = cache.get(key)
+        assert entry.day == arrow.now().date()
+
+        # dates parsed on another day are parsed again
+        cache.set(key, entry._replace(day=entry.day.replace(year=2000)))
+        ts.filter_by_arguments([u'due:today'])
+        assert cache.get(key).day == arrow.now().date()
+
+    def test_baked_filter(self, ts, monkeypatch):
+        TaskService.filter_cache.clear()
+        due = ts.from_arguments(u'baked due:tomorrow +bake'.split(' '))
+        ts.from_arguments(u'baked other +bake'.split(' '))
+        arguments = [u'+bake', u'+today']
+        query = ts.by_number(ts.pending(ts.filter_by_arguments(arguments)))
+        assert ts.list_rows(ts.by_number(ts.pending(
+            ts.baked_filter(arguments)))) == ts.list_rows(query) == []
+
+        built = []
+        apply_filter = TaskService.apply_filter
+        monkeypatch.setattr(TaskService, 'apply_filter', lambda *args: (
+            built.append(args) or apply_filter(*args)))
+
+        # the baked query is not built again and binds the next day
+        ts = TaskService(now=arrow.now().replace(days=1))
+        rows = ts.list_rows(ts.by_number(ts.pending(
+            ts.baked_filter(arguments))))
+        assert rows == [(due.number, None, [u'bake'], u'baked')]
+        assert built == []
+
+    def test_more_virtual_tags(self, ts):
+        now = arrow.get(2026, 10, 14, 12)
+        ts = TaskService(now=now)
+        week = ts.create(description=u'week', due=now.replace(days=3))
+        month = ts.create(description=u'month', due=now.replace(days=15))
+        nodue = ts.create(description=u'nodue')
+        waiting = ts.create(description=u'waiting',
+                            waituntil=now.replace(days=1))
+        done = ts.create(description=u'done', completed=now)
+
+        def numbers(arguments):
+            query = ts.filter_by_arguments(arguments.split(' '))
+            return sorted(task.number for task in query)
+
+        assert numbers(u'+WEEK') == [week.number]
+        assert numbers(u'+MONTH') == [week.number, month.number]
+        assert numbers(u'+NODUE -COMPLETED') == [nodue.number,
+                                                 waiting.number]
+        assert numbers(u'+WAITING') == [waiting.number]
+        assert numbers(u'+COMPLETED') == [done.number]
+        assert numbers(u'-PENDING') == [done.number]
+
+        # built in tags match in any case
+        assert numbers(u'+week') == numbers(u'+WEEK')
+        assert numbers(u'+Waiting') == numbers(u'+WAITING')
+        assert numbers(u'+today') == numbers(u'+TODAY')
+
+    def test_add_virtual_tags(self, ts):
+        for arguments in (u'plan trip +WEEK', u'plan trip -OVERDUE',
+                          u'plan trip +today', u'plan trip +week'):
+            with pytest.raises(TaskServiceParseException) as info:
+                ts.from_arguments(arguments.split(' '))
+            assert "can't be added" in str(info.value)
+        assert Task.query.count() == 0
+
+    def test_virtual_tags_lazy(self, app, ts):
+        registry = ts.virtual_tags
+        registry.clauses.clear()
+        ts.filter_by_arguments([u'+NODUE'], rank=True)
+        assert list(registry.clauses) == ['NODUE']
+
+    def test_config_virtual_tags(self, app):
+        app.config['VIRTUAL_TAGS'] = {'URGENT': 'pri:h +OVERDUE',
+                                      'LOOP': '+LOOP'}
+        app.extensions.pop('chez.tache.virtual_tags', None)
+        ts = TaskService()
+        yesterday = arrow.now().replace(days=-1)
+        urgent = ts.create(description=u'urgent', priority=u'h',
+                           due=yesterday)
+        ts.create(description=u'low', priority=u'l', due=yesterday)
+
+        assert ts.filter_by_arguments([u'+URGENT']).all() == [urgent]
+        assert urgent not in ts.filter_by_arguments([u'-URGENT']).all()
+        with pytest.raises(TaskServiceParseException):
+            ts.filter_by_arguments([u'+LOOP'])
+
+        # configured tags are only virtual in upper case
+        tagged = ts.from_arguments(u'tagged +urgent'.split(' '))
+        assert ts.filter_by_arguments([u'+urgent']).all() == [tagged]
+
+    def test_modify(self, ts):
+        first = ts.from_arguments(u'first pro:a +x due:tomorrow'.split(' '))
+        second = ts.from_arguments(u'second pro:a'.split(' '))
+        other = ts.from_arguments(u'other pro:b +x'.split(' '))
+
+        count, missing = ts.modify([u'pro:a'], u'pro:c due: +y -x'.split(' '))
+        assert (count, missing) == (2, [])
+        db.session.expire_all()
+        for task in (first, second):
+            assert task.project.name == u'c'
+            assert task.due is None
+            assert sorted(task.tags) == [u'y']
+        assert other.project.name == u'b'
+        assert sorted(other.tags) == [u'x']
+
+        count, missing = ts.modify([u'{}'.format(other.number)],
+                                   [u'desc:renamed task'])
+        assert count == 1
+        assert Task.query.get(other.id).description == u'renamed task'
+
+        assert ts.modify([u'99'], [u'pri:h']) == (0, [99])
+        # words are not taken as the description
+        for changes in ([], [u'+overdue'], [u'-~x'], [u'4', u'pri:h'],
+                        [u'desc:']):
+            with pytest.raises(TaskServiceParseException):
+                ts.modify([u'pro:a'], changes)
+        with pytest.raises(TaskServiceParseException):
+            ts.modify([], [u'pri:h'])
+
+    def test_modify_dry_run(self, ts):
+        task = ts.from_arguments(u'task pro:a'.split(' '))
+        count, missing = ts.modify(u'pro:new +new'.split(' '),
+                                   u'pro:other +other'.split(' '),
+                                   dry_run=True)
+        assert (count, missing) == (0, [])
+        assert ts.modify([u'pro:a'], u'pro:new +new'.split(' '),
+                         dry_run=True) == (1, [])
+        db.session.expire_all()
+        assert [project.name for project in Project.query] == [u'a']
+        assert Tag.query.count() == 0
+        assert task.project.name == u'a'
+
+    def test_data_version(self, ts):
+        def version():
+            return data_version(db.session.connection())
+
+        before = version()
+        task = ts.create(description=u'versioned')
+        assert version() > before
+
+        before = version()
+        ts.done([u'{}'.format(task.number)])
+        assert version() > before
+
+    def test_filter_new_project(self, ts):
+        ts.from_arguments(u'no project'.split(' '))
+        assert ts.filter_by_arguments([u'pro:nothing']).all() == []
+        assert Project.query.count() == 0
+
+    def test_urgency(self, app, ts):
+        plain = ts.from_arguments([u'plain'])
+        high = ts.from_arguments([u'high', u'pri:h'])
+        due = ts.from_arguments([u'due', u'due:-1d'])
+        tagged = ts.from_arguments([u'tagged', u'pro:a', u'+x', u'+y'])
+        ts.from_arguments([u'waiting', u'pri:h', u'wait:tomorrow'])
+        ts.from_arguments([u'completed', u'pri:h'])
+        ts.done([u'6'])
+
+        assert ts.refresh_urgency()
+        assert not ts.refresh_urgency()
+        query = ts.by_urgency(ts.pending(Task.query))
+        assert query.all() == [due, high, tagged, plain]
+        urgencies = [round(task.urgency, 2) for task in query]
+        assert urgencies == [9.26, 6.0, 1.9, 0.0]
+
+        # writes are scored by the triggers
+        plain.tags.append(u'next')
+        db.session.commit()
+        assert ts.by_urgency(ts.pending(Task.query)).first() == plain
+        plain.tags.remove(u'next')
+        db.session.commit()
+        assert round(Task.query.get(plain.id).urgency, 2) == 0.0
+
+        rows = ts.next_rows(ts.filter_by_arguments([u'-tagged']), limit=2)
+        assert [(row[0], round(row[4], 2)) for row in rows] == [
+            (due.number, 9.26), (high.number, 6.0)]
+
+        # changed coefficients replace the triggers and score every task
+        app.config['URGENCY_COEFFICIENTS'] = {'priority.h': 20.0, 'due': 0}
+        assert ts.refresh_urgency()
+        assert ts.by_urgency(ts.pending(Task.query)).first() == high
+        plain.priority = u'h'
+        db.session.commit()
+        assert round(Task.query.get(plain.id).urgency, 2) == 20.0
+
+        app.config['URGENCY_COEFFICIENTS'] = {'priority.x': 1.0}
+        with pytest.raises(UrgencyCoefficientError) as info:
+            ts.refresh_urgency()
+        assert 'priority.x' in str(info.value)
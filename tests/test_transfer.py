@@ -0,0 +1,200 @@
+import io
+import json
+import pytest
+from chez.tache.models import db, Task, Project, Tag
+from chez.tache.models.task import tasks_tags
+from chez.tache.services import ImportService, ExportService, TaskService
+from chez.tache.services.transfer import ImportServiceException
+
+
+class TestImportService(object):
+
+    @pytest.fixture
+    def service(self, app):
+        return ImportService(batch_size=2)
+
+    def jsonl(self, rows):
+        return io.BytesIO(b'\n'.join(json.dumps(row).encode('utf-8')
+                                     for row in rows))
+
+    def test_import_jsonl(self, service):
+        rows = [
+            {'description': u'one', 'project': u'Home', 'tags': [u'a', u'b']},
+            {'description': u'two', 'project': u'home', 'tags': u'b'},
+            {'description': u'three', 'priority': u'High', 'due': u'today'},
+            {'description': u'four', 'completed': u'2015-07-22'},
+        ]
+        progress = []
+        count = service.import_rows(service.read_jsonl(self.jsonl(rows)),
+                                    progress=progress.append)
+        assert count == 4
+        assert progress == [2, 4]
+        assert Project.query.count() == 1
+        assert Tag.query.count() == 2
+
+        tasks = Task.query.order_by(Task.number).all()
+        assert [task.description for task in tasks] == [
+            'one', 'two', 'three', 'four']
+        assert len(set(task.number for task in tasks)) == 4
+        assert tasks[0].project.name == 'home'
+        assert sorted(tasks[0].tags) == ['a', 'b']
+        assert list(tasks[1].tags) == ['b']
+        assert tasks[2].priority.code == 'h'
+        assert tasks[2].due is not None
+        assert tasks[3].completed.date().isoformat() == '2015-07-22'
+
+    def test_import_csv(self, service):
+        stream = io.BytesIO(b'description,project,tags\n'
+                            b'one,work,"a, b"\n'
+                            b'two,,\n')
+        count = service.import_rows(service.read_csv(stream))
+        assert count == 2
+        task = Task.query.filter_by(description=u'one').one()
+        assert task.project.name == 'work'
+        assert sorted(task.tags) == ['a', 'b']
+
+    def test_existing_projects_and_tags(self, service):
+        service.import_rows([{'description': u'one', 'project': u'p',
+                              'tags': [u't']}])
+        other = ImportService()
+        other.import_rows([{'description': u'two', 'project': u'p',
+                            'tags': [u't']}])
+        assert Project.query.count() == 1
+        assert Tag.query.count() == 1
+
+    def test_invalid_row(self, service):
+        rows = [{'description': u'one'}, {'description': u'two'},
+                {'description': u''}]
+        with pytest.raises(ImportServiceException) as info:
+            service.import_rows(rows)
+        assert 'Row 3' in str(info.value)
+        # the first batch was committed
+        assert Task.query.count() == 2
+
+    def test_failed_batch_then_good_one(self, service):
+        existing = {'id': u'0' * 32, 'description': u'existing'}
+        service.import_rows([existing])
+        with pytest.raises(ImportServiceException):
+            service.import_rows([
+                {'description': u'one', 'project': u'new', 'tags': [u'n']},
+                dict(existing)])
+        assert Project.query.count() == 0
+
+        assert service.import_rows([
+            {'description': u'two', 'project': u'new', 'tags': [u'n']}]) == 1
+        task = Task.query.filter_by(description=u'two').one()
+        assert task.project.name == u'new'
+        assert list(task.tags) == [u'n']
+
+    def test_malformed_line(self, service):
+        stream = io.BytesIO(b'{"description": "one"}\n\n'
+                            b'{"description": "two"}\n'
+                            b'{"description": \n')
+        with pytest.raises(ImportServiceException) as info:
+            service.import_rows(service.read_jsonl(stream))
+        assert 'Row 3' in str(info.value)
+        assert Task.query.count() == 2
+
+        with pytest.raises(ImportServiceException) as info:
+            service.import_rows(service.read_jsonl(io.BytesIO(b'[1, 2]')))
+        assert 'Row 1: Not a JSON object' in str(info.value)
+
+
+class TestExportService(object):
+
+    @pytest.fixture
+    def tasks(self, app):
+        rows = [{'description': u'task {}'.format(i),
+                 'project': u'p{}'.format(i % 3),
+                 'tags': [u't{}'.format(i % 4), u'all']}
+                for i in range(10)]
+        rows[0]['priority'] = u'h'
+        rows[0]['due'] = u'2015-07-22'
+        ImportService().import_rows(rows)
+        return rows
+
+    def test_export_jsonl(self, tasks):
+        stream = io.BytesIO()
+        count = ExportService(batch_size=3).export(Task.query, stream)
+        assert count == 10
+
+        rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert len(rows) == 10
+        assert len(set(row['id'] for row in rows)) == 10
+        row = [row for row in rows if row['description'] == 'task 0'][0]
+        assert row['project'] == 'p0'
+        assert row['tags'] == ['all', 't0']
+        assert row['priority'] == 'h'
+        assert row['due'].startswith('2015-07-22')
+
+    def test_export_csv_round_trip(self, tasks):
+        stream = io.BytesIO()
+        ExportService().export(Task.query, stream, fmt='csv')
+        db.session.execute(tasks_tags.delete())
+        Task.query.delete()
+        db.session.commit()
+
+        stream.seek(0)
+        service = ImportService()
+        assert service.import_rows(service.read_csv(stream)) == 10
+        task = Task.query.filter_by(description=u'task 5').one()
+        assert task.project.name == 'p2'
+        assert sorted(task.tags) == ['all', 't1']
+
+    def test_export_jsonl_round_trip(self, tasks):
+        stream = io.BytesIO()
+        ExportService().export(Task.query, stream)
+        exported = sorted(stream.getvalue().splitlines())
+
+        # the tasks are already in the database
+        stream.seek(0)
+        service = ImportService(batch_size=4)
+        with pytest.raises(ImportServiceException) as info:
+            service.import_rows(service.read_jsonl(stream))
+        assert 'Rows 1-4' in str(info.value)
+        assert Task.query.count() == 10
+
+        db.session.execute(tasks_tags.delete())
+        Task.query.delete()
+        db.session.commit()
+        stream.seek(0)
+        assert service.import_rows(service.read_jsonl(stream)) == 10
+
+        # numbers are allocated anew, everything else comes back as it was
+        stream = io.BytesIO()
+        ExportService().export(Task.query, stream)
+        imported = stream.getvalue().splitlines()
+
+        def strip(lines):
+            rows = [json.loads(line) for line in lines]
+            for row in rows:
+                del row['number']
+            return sorted(rows, key=lambda row: row['id'])
+        assert strip(imported) == strip(exported)
+
+    def test_filter(self, tasks):
+        query = TaskService().filter_by_arguments([u'pro:p1'])
+        stream = io.BytesIO()
+        assert ExportService().export(query, stream) == 3
+
+    def test_batches(self, tasks, statements):
+        service = ExportService(batch_size=4)
+        sizes = []
+        for task in service.iter_tasks(Task.query):
+            sizes.append(len(db.session.identity_map))
+            service.to_row(task)
+        # 3 batches and a final empty one, tags loaded once per batch
+        selects = [s for s in statements if s.startswith('SELECT')]
+        assert len(selects) == 4 + 3
+        # 4 tasks, 3 projects and 5 tags at most
+        assert max(sizes) <= 4 + 3 + 5
+
+    def test_batches_in_number_order(self, tasks):
+        kept = Project.query.first()
+        numbers = [task.number for task in
+                   ExportService(batch_size=3).iter_tasks(Task.query)]
+        assert numbers == sorted(numbers)
+        assert len(numbers) == 10
+        # only the exported tasks are expunged
+        assert kept in db.session
+        assert not any(isinstance(obj, Task) for obj in db.session)